@@ -60,6 +60,8 @@ class AIClient(Referenceable, Observed):
         form_game: bool,
         min_players: int,
         max_players: int,
+        ai_processes: int = 0,
+        ai_seed: Optional[int] = None,
     ):
         Observed.__init__(self)
         self.playername = playername
@@ -89,7 +91,11 @@ class AIClient(Referenceable, Observed):
         assert player_info is not None
         bp = BotParams.BotParams.fromstring(player_info)
         self.ai = CleverBot.CleverBot(
-            self.playername, ai_time_limit, bot_params=bp
+            self.playername,
+            ai_time_limit,
+            bot_params=bp,
+            ai_processes=ai_processes,
+            seed=ai_seed,
         )
         self.game_name = game_name
         self.ai_time_limit = ai_time_limit
@@ -302,6 +308,7 @@ class AIClient(Referenceable, Observed):
                 legion.creatures = Creature.n2c(node.creature_names)
                 for creature in legion.creatures:
                     creature.legion = legion
+                legion.creatures_changed()
 
     def failure(self, error: Any) -> None:
         log.err(error)  # type: ignore
@@ -884,6 +891,14 @@ def add_arguments(parser: argparse.ArgumentParser) -> None:
     parser.add_argument("--form-game", action="store_true", default=False)
     parser.add_argument("--min-players", type=int, default=2)
     parser.add_argument("--max-players", type=int, default=6)
+    parser.add_argument(
+        "--ai-processes",
+        action="store",
+        type=int,
+        default=0,
+        help="search for battle moves in this many processes",
+    )
+    parser.add_argument("--ai-seed", action="store", type=int)
 
 
 def main() -> None:
@@ -903,6 +918,8 @@ def main() -> None:
         args.form_game,
         args.min_players,
         args.max_players,
+        args.ai_processes,
+        args.ai_seed,
     )
     reactor.callWhenRunning(aiclient.connect)  # type: ignore
     reactor.run()  # type: ignore
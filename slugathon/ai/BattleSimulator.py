@@ -0,0 +1,340 @@
+import random
+import time
+from collections import namedtuple
+from sys import maxsize
+from typing import Dict, List, Optional, Tuple
+
+from slugathon.game import BattleMap, BattleSnapshot, Game, Legion, Phase
+
+__copyright__ = "Copyright (c) 2021 David Ripton"
+__license__ = "GNU GPL v2"
+
+
+"""A fast headless battle simulator, for AI decisions."""
+
+
+# Weights for the simulator's own maneuver policy.
+# Expected hits taken, relative to expected hits dealt, in engaged hexes.
+ATTACKER_CAUTION = 1.0
+DEFENDER_CAUTION = 0.5
+# Penalty per hex of range to the nearest enemy, in unengaged hexes.
+ATTACKER_APPROACH = 0.5
+DEFENDER_APPROACH = 0.05
+# Bonus for an unengaged rangestriker with an enemy in range.
+RANGESTRIKE_BONUS = 0.5
+
+
+class BattleOdds(
+    namedtuple(
+        "BattleOdds",
+        [
+            "rollouts",
+            "attacker_wins",
+            "defender_wins",
+            "attacker_points",
+            "defender_points",
+        ],
+    )
+):
+    """The results of simulating a battle rollouts times.
+
+    attacker_wins and defender_wins are the fractions of rollouts that
+    each legion won; the rest were mutual kills.  attacker_points and
+    defender_points are the mean point values of each legion's surviving
+    creatures, counting an eliminated legion as zero.
+    """
+
+    @property
+    def mutual(self) -> float:
+        """Return the fraction of rollouts in which both legions died."""
+        return 1.0 - self.attacker_wins - self.defender_wins
+
+
+class BattleSimulator(object):
+    """Plays a battle out many times, without a GUI or server, to estimate
+    how it will go.
+
+    Both legions follow a cheap built-in policy: each creature in turn,
+    best first, moves to the hex where it expects to deal the most damage
+    for the least taken, or else closes on the enemy, and strikes the
+    engaged or rangestrike target it expects to hurt most.  Battles follow
+    the normal rules, through BattleSnapshot, except that there are no
+    carries, summons, or reinforcements.  The attacker loses on time after
+    the seventh turn.
+    """
+
+    def __init__(
+        self,
+        game: Game.Game,
+        attacker: Legion.Legion,
+        defender: Legion.Legion,
+        seed: Optional[int] = None,
+    ):
+        self.start = BattleSnapshot.BattleSnapshot.new_battle(
+            game, attacker, defender
+        )
+        self.rand = random.Random(seed)
+        start = self.start
+        num_creatures = len(start.creatures)
+        self.scores = [
+            start.powers[index] * start.creatures[index].skill
+            for index in range(num_creatures)
+        ]
+        # The indexes of each legion's creatures, best first.
+        self.maneuver_orders = [
+            sorted(
+                indexes,
+                key=lambda index: start.sort_values[index],
+                reverse=True,
+            )
+            for indexes in [
+                range(start.num_attackers),
+                range(start.num_attackers, num_creatures),
+            ]
+        ]
+        # Melee dice and strike numbers depend only on the two creatures
+        # and their hexes, so they are shared by every rollout.
+        # (index, hexlabel, target, target_hexlabel): (dice, strike number)
+        self._melee_cache = (
+            {}
+        )  # type: Dict[Tuple[int, str, int, str], Tuple[int, int]]
+
+    def simulate(
+        self, rollouts: int, finish_time: Optional[float] = None
+    ) -> BattleOdds:
+        """Play the battle out up to rollouts times, stopping early (but
+        after at least one) if finish_time passes, and return the
+        BattleOdds."""
+        start = self.start
+        num_rollouts = 0
+        attacker_wins = 0
+        defender_wins = 0
+        attacker_points = 0
+        defender_points = 0
+        while num_rollouts < rollouts:
+            if (
+                num_rollouts
+                and finish_time is not None
+                and time.time() > finish_time
+            ):
+                break
+            snapshot = self._rollout()
+            num_rollouts += 1
+            attacker_dead = snapshot.legion_dead(0)
+            defender_dead = snapshot.legion_dead(start.num_attackers)
+            if not attacker_dead:
+                attacker_points += self._surviving_points(snapshot, 0)
+                if defender_dead:
+                    attacker_wins += 1
+            if not defender_dead:
+                defender_points += self._surviving_points(
+                    snapshot, start.num_attackers
+                )
+                if attacker_dead:
+                    defender_wins += 1
+        return BattleOdds(
+            num_rollouts,
+            attacker_wins / num_rollouts,
+            defender_wins / num_rollouts,
+            attacker_points / num_rollouts,
+            defender_points / num_rollouts,
+        )
+
+    def _surviving_points(
+        self, snapshot: BattleSnapshot.BattleSnapshot, index: int
+    ) -> int:
+        """Return the point value of the living creatures in index's
+        legion."""
+        return sum(
+            self.scores[index2]
+            for index2 in snapshot.allies(index)
+            if not snapshot.dead(index2)
+        )
+
+    def _rollout(self) -> BattleSnapshot.BattleSnapshot:
+        """Play the battle out once, and return the final snapshot."""
+        snapshot = self.start
+        num_attackers = snapshot.num_attackers
+        for battle_turn in range(1, 7 + 1):
+            # The defender moves first.
+            for side in [1, 0]:
+                index = num_attackers if side else 0
+                snapshot = snapshot.start_turn(battle_turn)
+                snapshot = self._maneuver(snapshot, side)
+                if battle_turn == 1:
+                    # Creatures that don't enter on the first turn die.
+                    for index2 in snapshot.allies(index):
+                        if snapshot.offboard(index2):
+                            snapshot = snapshot.set_hits(
+                                index2, snapshot.powers[index2]
+                            )
+                snapshot = snapshot.set_phase(Phase.STRIKE)
+                snapshot = self._strike(snapshot, side)
+                snapshot = snapshot.set_phase(Phase.COUNTERSTRIKE)
+                snapshot = self._strike(snapshot, 1 - side)
+                if snapshot.legion_dead(0) or snapshot.legion_dead(
+                    num_attackers
+                ):
+                    return snapshot
+        # Time loss
+        for index in range(num_attackers):
+            snapshot = snapshot.set_hits(index, snapshot.powers[index])
+        return snapshot
+
+    def _maneuver(
+        self, snapshot: BattleSnapshot.BattleSnapshot, side: int
+    ) -> BattleSnapshot.BattleSnapshot:
+        """Move side's creatures (0 for the attacker, 1 for the defender),
+        and return the new snapshot."""
+        for index in self.maneuver_orders[side]:
+            hexlabel = snapshot.hexlabels[index]
+            if hexlabel is None or snapshot.dead(index):
+                continue
+            moves = snapshot.find_battle_moves(index)
+            if not moves:
+                continue
+            if not snapshot.offboard(index):
+                moves.add(hexlabel)
+            best_value = float(-maxsize)
+            best_move = hexlabel
+            for move in sorted(moves):
+                value = self._hex_value(snapshot, index, move)
+                if value > best_value:
+                    best_value = value
+                    best_move = move
+            if best_move != hexlabel:
+                snapshot = snapshot.move(index, best_move)
+        return snapshot
+
+    def _hex_value(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        index: int,
+        hexlabel: str,
+    ) -> float:
+        """Return how much creature index would like to be in hexlabel,
+        according to the simulator's policy."""
+        battlemap = snapshot.battlemap
+        is_attacker = snapshot.is_attacker(index)
+        engaged_mask = battlemap.engagement_masks[
+            hexlabel
+        ] & snapshot.enemy_hex_mask(index)
+        if engaged_mask:
+            dealt = 0.0
+            taken = 0.0
+            for enemy in snapshot.enemies(index):
+                hexlabel2 = snapshot.hexlabels[enemy]
+                if (
+                    hexlabel2 is None
+                    or not engaged_mask & BattleMap.hexlabel_to_bit[hexlabel2]
+                ):
+                    continue
+                dice, strike_number = self._melee(
+                    index, hexlabel, enemy, hexlabel2
+                )
+                dealt = max(
+                    dealt,
+                    min(
+                        dice * (7 - strike_number) / 6.0,
+                        snapshot.hits_left(enemy),
+                    ),
+                )
+                dice, strike_number = self._melee(
+                    enemy, hexlabel2, index, hexlabel
+                )
+                taken += dice * (7 - strike_number) / 6.0
+            if is_attacker:
+                return dealt - ATTACKER_CAUTION * taken
+            return dealt - DEFENDER_CAUTION * taken
+        creature = snapshot.creatures[index]
+        distance = maxsize
+        for enemy in snapshot.enemies(index):
+            hexlabel2 = snapshot.hexlabels[enemy]
+            if hexlabel2 is not None and not snapshot.dead(enemy):
+                distance = min(
+                    distance,
+                    battlemap.range(hexlabel, hexlabel2, allow_entrance=True),
+                )
+        if distance == maxsize:
+            return 0.0
+        if is_attacker:
+            value = -ATTACKER_APPROACH * distance
+        else:
+            value = -DEFENDER_APPROACH * distance
+        if creature.rangestrikes and distance <= creature.skill:
+            value += RANGESTRIKE_BONUS
+        return value
+
+    def _melee(
+        self, index: int, hexlabel: str, target: int, target_hexlabel: str
+    ) -> Tuple[int, int]:
+        """Return (dice, strike number) for creature index in hexlabel
+        striking adjacent target in target_hexlabel."""
+        key = (index, hexlabel, target, target_hexlabel)
+        result = self._melee_cache.get(key)
+        if result is None:
+            snapshot = self.start.move(index, hexlabel).move(
+                target, target_hexlabel
+            )
+            result = (
+                snapshot.number_of_dice(index, target),
+                snapshot.strike_number(index, target),
+            )
+            self._melee_cache[key] = result
+        return result
+
+    def _strike(
+        self, snapshot: BattleSnapshot.BattleSnapshot, side: int
+    ) -> BattleSnapshot.BattleSnapshot:
+        """Make side's strikes, and return the new snapshot.
+
+        Creatures killed earlier in the turn still strike back, as in the
+        real game.
+        """
+        rand = self.rand
+        for index in self.maneuver_orders[side]:
+            hexlabel = snapshot.hexlabels[index]
+            if hexlabel is None or snapshot.offboard(index):
+                continue
+            targets = snapshot.engaged_enemies(index)  # type: List[int]
+            melee = bool(targets)
+            if not melee:
+                targets = snapshot.rangestrike_targets(index)
+            best = None  # type: Optional[Tuple[float, float, int, int, int]]
+            for target in targets:
+                if melee:
+                    target_hexlabel = snapshot.hexlabels[target]
+                    assert target_hexlabel is not None
+                    dice, strike_number = self._melee(
+                        index, hexlabel, target, target_hexlabel
+                    )
+                else:
+                    dice = snapshot.number_of_dice(index, target)
+                    strike_number = snapshot.strike_number(index, target)
+                expected = min(
+                    dice * (7 - strike_number) / 6.0,
+                    snapshot.hits_left(target),
+                )
+                choice = (
+                    expected,
+                    snapshot.sort_values[target],
+                    target,
+                    dice,
+                    strike_number,
+                )
+                if best is None or choice[:2] > best[:2]:
+                    best = choice
+            if best is None:
+                continue
+            target, dice, strike_number = best[2:]
+            hits = 0
+            for unused in range(dice):
+                # Rolls of strike_number or more hit.
+                if rand.random() * 6 >= strike_number - 1:
+                    hits += 1
+            if hits:
+                snapshot = snapshot.set_hits(
+                    target,
+                    min(snapshot.hits[target] + hits, snapshot.powers[target]),
+                )
+        return snapshot
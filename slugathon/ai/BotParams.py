@@ -16,6 +16,7 @@ defaults = {
     "SQUASH": 0.6,
     "BE_SQUASHED": 1.0,
     "FLEE_RATIO": 1.5,
+    "FLEE_WIN_PROBABILITY": 0.7,
     "ATTACKER_AGGRESSION_BONUS": 1.0,
     "ATTACKER_DISTANCE_PENALTY": -1.0,
     "HIT_BONUS": 1.0,
@@ -48,6 +49,7 @@ default_keys = [
     "SQUASH",
     "BE_SQUASHED",
     "FLEE_RATIO",
+    "FLEE_WIN_PROBABILITY",
     "ATTACKER_AGGRESSION_BONUS",
     "ATTACKER_DISTANCE_PENALTY",
     "HIT_BONUS",
@@ -1,18 +1,21 @@
 import collections
+import concurrent.futures
 import copy
-import itertools
 import logging
+import multiprocessing
+import pickle
 import random
 import time
 from sys import maxsize
 from typing import (
     Any,
-    DefaultDict,
+    Deque,
     Dict,
     Generator,
     Iterable,
     List,
     Optional,
+    Sequence,
     Set,
     Tuple,
 )
@@ -20,9 +23,17 @@ from typing import (
 from twisted.python import log
 from zope.interface import implementer
 
-from slugathon.ai import BotParams
+from slugathon.ai import BattleSimulator, BotParams
 from slugathon.ai.Bot import Bot
-from slugathon.game import Creature, Game, Legion, Phase, Player
+from slugathon.game import (
+    BattleMap,
+    BattleSnapshot,
+    Creature,
+    Game,
+    Legion,
+    Phase,
+    Player,
+)
 from slugathon.net import User
 
 __copyright__ = "Copyright (c) 2010-2021 David Ripton"
@@ -32,12 +43,31 @@ __license__ = "GNU GPL v2"
 """An attempt at a smarter AI."""
 
 
-def best7(score_moves: List[Tuple[float, str]]) -> Set[str]:
+# Seconds before the time limit that parallel searches stop, to leave time
+# for their results to reach the parent process.
+PARALLEL_MARGIN = 0.2
+
+# Most battles to simulate when deciding whether to flee.  The simulator
+# manages about 700-1200 rollouts per second, so with a short
+# ai_time_limit the time limit, not this, usually ends the simulation.
+FLEE_ROLLOUTS = 500
+
+# Fewest simulated battles to trust when deciding whether to flee.  With
+# fewer, fall back to comparing terrain combat values.
+FLEE_MIN_ROLLOUTS = 50
+
+
+def best7(
+    score_moves: List[Tuple[float, str]],
+    rand: Optional[random.Random] = None,
+) -> Set[str]:
     """Return a set of the the best (highest score) (up to) 7 moves from
     score_moves, which is a sorted list of (score, move) tuples.
 
-    If there's a tie, pick at random.
+    If there's a tie, pick at random, using rand if given.
     """
+    if rand is None:
+        rand = random  # type: ignore
     score_moves = score_moves[:]
     best_moves = set()  # type: Set[str]
     while score_moves and len(best_moves) < 7:
@@ -48,7 +78,7 @@ def best7(score_moves: List[Tuple[float, str]]) -> Set[str]:
                 choices.append((score, move))
             else:
                 break
-        (score, move) = random.choice(choices)
+        (score, move) = rand.choice(choices)  # type: ignore
         score_moves.remove((score, move))
         best_moves.add(move)
     return best_moves
@@ -61,14 +91,37 @@ class CleverBot(object):
         playername: str,
         ai_time_limit: float,
         bot_params: Optional[BotParams.BotParams] = None,
+        ai_processes: int = 0,
+        seed: Optional[int] = None,
     ):
-        logging.info(f"CleverBot {playername=} {ai_time_limit=}")
+        """If ai_processes is more than 1, search for legion moves in that
+        many worker processes.  If seed is given, the same position always
+        gets the same moves, given enough time to finish searching."""
+        logging.info(
+            f"CleverBot {playername=} {ai_time_limit=} {ai_processes=} "
+            f"{seed=}"
+        )
         self.playername = playername
         self.user = None  # type: Optional[User.User]
         self.ai_time_limit = ai_time_limit
+        self.ai_processes = ai_processes
+        self.random = random.Random(seed)
+        self._pool = None  # type: Optional[concurrent.futures.Executor]
+        if ai_processes > 1:
+            # Start the workers now, so that spawning them and importing
+            # this module does not eat into the first move's time limit.
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=ai_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            for unused in range(ai_processes):
+                self._pool.submit(_start_worker)
         self.best_creature_moves = (
             None
         )  # type: Optional[List[Tuple[str, str, str]]]
+        self.strike_plan = None  # type: Optional[StrikePlan]
+        self.threat_map = None  # type: Optional[ThreatMap]
+        self.move_score_cache = None  # type: Optional[MoveScoreCache]
         if bot_params is None:
             self.bp = BotParams.default_bot_params
         else:
@@ -195,10 +248,7 @@ class CleverBot(object):
                 logging.info("defender hasn't chosen whether to flee yet")
                 if defender.can_flee:
                     logging.info("can flee")
-                    if (
-                        defender.terrain_combat_value * self.bp.FLEE_RATIO  # type: ignore
-                        < attacker.terrain_combat_value
-                    ):
+                    if self._should_flee(game, attacker, defender):
                         logging.info("fleeing")
                         def1 = self.user.callRemote(  # type: ignore
                             "flee", game.name, defender.markerid
@@ -229,6 +279,35 @@ class CleverBot(object):
         else:
             logging.info("not my engagement")
 
+    def _should_flee(
+        self, game: Game.Game, attacker: Legion.Legion, defender: Legion.Legion
+    ) -> bool:
+        """Return True iff defender should flee from attacker.
+
+        Simulate the battle, within the time limit, and flee if the
+        attacker wins more than FLEE_WIN_PROBABILITY of the time.  (Mutual
+        kills don't count, since they score nothing for the attacker.)
+
+        If the time limit allows fewer than FLEE_MIN_ROLLOUTS battles, the
+        odds are too noisy, so flee if the attacker's terrain combat value
+        is more than FLEE_RATIO times the defender's.
+        """
+        simulator = BattleSimulator.BattleSimulator(
+            game, attacker, defender, seed=self.random.randrange(maxsize)
+        )
+        odds = simulator.simulate(
+            FLEE_ROLLOUTS, time.time() + self.ai_time_limit
+        )
+        logging.info(f"{odds=}")
+        if odds.rollouts < FLEE_MIN_ROLLOUTS:
+            return (
+                defender.terrain_combat_value * self.bp.FLEE_RATIO  # type: ignore
+                < attacker.terrain_combat_value
+            )
+        return (
+            odds.attacker_wins > self.bp.FLEE_WIN_PROBABILITY  # type: ignore
+        )
+
     def _scary_enemy_legions_behind(self, legion: Legion.Legion) -> bool:
         """Return True if there are any scary enemy legions that can
         catch this legion next turn."""
@@ -333,7 +412,7 @@ class CleverBot(object):
             best_recruit = None
             for recruit2, recruits in recruit_to_later_recruits.items():
                 for creature_name in [recruit2] + list(recruits):
-                    creature = Creature.Creature(creature_name)
+                    creature = Creature.name_to_creature_type[creature_name]
                     if (
                         best_creature is None
                         or creature.sort_value > best_creature.sort_value
@@ -666,20 +745,18 @@ class CleverBot(object):
             logging.info("not active player; aborting")
             return
         assert player.movement_roll is not None
+        cache = self._get_move_score_cache(player)
         non_moves = {}  # markerid: score
         while True:
             # Score moves
             # (score, legion, hexlabel, entry_side)
             best_moves = []
+            player_moves = game.find_all_moves_for_player(player)
             for legion in player.unmoved_legions:
-                moves = game.find_all_moves(
-                    legion,
-                    game.board.hexes[legion.hexlabel],
-                    player.movement_roll,
-                )
+                moves = player_moves[legion.markerid]
                 logging.debug(f"legion {legion} moves {moves}")
                 for hexlabel, entry_side in moves:
-                    score = self._score_move(legion, hexlabel, True)
+                    score = cache.score(legion, hexlabel, True)
                     best_moves.append((score, legion, hexlabel, entry_side))
             # Entry sides are a mix of str and int, so stringify them
             best_moves.sort(
@@ -706,7 +783,7 @@ class CleverBot(object):
             # (score, legion, hexlabel, None)
             # Entry side None means not a move.
             for legion in player.unmoved_legions:
-                score = self._score_move(legion, legion.hexlabel, False)
+                score = cache.score(legion, legion.hexlabel, False)
                 non_moves[legion.markerid] = score
             logging.debug(f"non_moves {non_moves}")
 
@@ -752,6 +829,23 @@ class CleverBot(object):
         self, legion: Legion.Legion, hexlabel: int, moved: bool
     ) -> float:
         """Return a score for legion moving to (or staying in) hexlabel."""
+        score = self._score_move_static(legion, hexlabel, moved)
+        player = legion.player
+        if player.game.turn > 1:
+            # Do not fear enemy legions on turn 1.  8-high legions will be
+            # forced to split, and hanging around in the tower to avoid getting
+            # attacked 5-on-4 is too passive.
+            for enemy, num_rolls in self._get_threat_map(player).threats(
+                legion, hexlabel
+            ):
+                score -= self._threat_weight(legion, enemy) * num_rolls
+        return score
+
+    def _score_move_static(
+        self, legion: Legion.Legion, hexlabel: int, moved: bool
+    ) -> float:
+        """Return the part of _score_move that cannot change while legion's
+        player moves: the engagement and the recruit in hexlabel."""
         score = 0.0
         player = legion.player
         game = player.game
@@ -780,7 +874,7 @@ class CleverBot(object):
             recruits = legion.available_recruits(terrain, caretaker)
             if recruits:
                 recruit_name = recruits[-1]
-                recruit = Creature.Creature(recruit_name)
+                recruit = Creature.name_to_creature_type[recruit_name]
                 # Only give credit for recruiting if we're likely to live.
                 if not enemies or enemy_combat_value < legion_combat_value:
                     recruit_value = recruit.sort_value
@@ -794,53 +888,95 @@ class CleverBot(object):
                     f"{recruit_value}"
                 )
                 score += recruit_value
-        if game.turn > 1:
-            # Do not fear enemy legions on turn 1.  8-high legions will be
-            # forced to split, and hanging around in the tower to avoid getting
-            # attacked 5-on-4 is too passive.
-            try:
-                previous_hexlabel = legion.hexlabel
-                legion.hexlabel = hexlabel
-                for enemy in player.enemy_legions():
-                    if (
-                        enemy.terrain_combat_value
-                        >= self.bp.BE_SQUASHED * legion_combat_value  # type: ignore
-                    ):
-                        for roll in range(1, 6 + 1):
-                            moves = game.find_normal_moves(
-                                enemy, game.board.hexes[enemy.hexlabel], roll
-                            ).union(game.find_titan_teleport_moves(enemy))
-                            hexlabels = {move[0] for move in moves}
-                            if hexlabel in hexlabels:
-                                score -= legion_sort_value / 6.0
-            finally:
-                legion.hexlabel = previous_hexlabel
         return score
 
+    def _threat_weight(
+        self, legion: Legion.Legion, enemy: Legion.Legion
+    ) -> float:
+        """Return how much legion's score should drop for each roll with
+        which enemy could attack it next turn."""
+        if (
+            enemy.terrain_combat_value
+            >= self.bp.BE_SQUASHED * legion.combat_value  # type: ignore
+        ):
+            return legion.sort_value / 6.0
+        return 0.0
+
+    def _get_threat_map(self, player: Player.Player) -> "ThreatMap":
+        """Return a ThreatMap of the enemies of player, reusing the one for
+        this turn if possible."""
+        game = player.game
+        threat_map = self.threat_map
+        if threat_map is None or threat_map.key != ThreatMap.make_key(
+            game, player
+        ):
+            threat_map = self.threat_map = ThreatMap(game, player)
+        else:
+            threat_map.update()
+        return threat_map
+
+    def _get_move_score_cache(self, player: Player.Player) -> "MoveScoreCache":
+        """Return a MoveScoreCache for player's movement phase, reusing the
+        one for this phase if possible."""
+        cache = self.move_score_cache
+        if cache is None or cache.key != MoveScoreCache.make_key(
+            player.game, player
+        ):
+            cache = self.move_score_cache = MoveScoreCache(self, player)
+        return cache
+
     def _gen_legion_moves_inner(
-        self, movesets: List[Set[str]]
+        self, movesets: Sequence[Iterable[str]]
     ) -> Generator[Tuple, None, None]:
         """Yield tuples of distinct hexlabels, one from each moveset, in order,
         with no duplicates.
 
         movesets is a list of sets of hexlabels, corresponding to the order of
         remaining creatures in the legion.
+
+        This is an iterative backtracking search that tracks the hexes
+        already taken as a bitmask, so it allocates nothing per branch and
+        can be abandoned partway through.
         """
-        if not movesets:
+        num_creatures = len(movesets)
+        if not num_creatures:
             yield ()
-        elif len(movesets) == 1:
-            for move in movesets[0]:
-                yield (move,)
-        else:
-            for move in movesets[0]:
-                movesets1 = copy.deepcopy(movesets[1:])
-                for moveset in movesets1:
-                    moveset.discard(move)
-                for moves in self._gen_legion_moves_inner(movesets1):
-                    yield (move,) + moves
+            return
+        # For each creature, a list of (hexlabel, bit)
+        choices = [
+            [
+                (hexlabel, BattleMap.hexlabel_to_bit[hexlabel])
+                for hexlabel in moveset
+            ]
+            for moveset in movesets
+        ]
+        moves = [""] * num_creatures
+        # Next choice to try, and hexes used by earlier creatures, per depth
+        positions = [0] * num_creatures
+        used_masks = [0] * num_creatures
+        last = num_creatures - 1
+        depth = 0
+        while depth >= 0:
+            choices1 = choices[depth]
+            used = used_masks[depth]
+            position = positions[depth]
+            while position < len(choices1) and choices1[position][1] & used:
+                position += 1
+            if position == len(choices1):
+                positions[depth] = 0
+                depth -= 1
+                continue
+            positions[depth] = position + 1
+            hexlabel, bit = choices1[position]
+            moves[depth] = hexlabel
+            if depth == last:
+                yield tuple(moves)
+            else:
+                depth += 1
+                used_masks[depth] = used | bit
 
     def _gen_legion_moves(
-        self, movesets: List[Set[str]]
+        self, movesets: Sequence[Iterable[str]]
     ) -> Generator[List[str], None, None]:
         """Yield all possible legion_moves for movesets.
 
@@ -859,51 +995,6 @@ class CleverBot(object):
             if len(moves) == len(movesets):
                 yield list(moves)
 
-    def _gen_fallback_legion_moves(
-        self, movesets: List[Set[str]]
-    ) -> Generator[List[str], None, None]:
-        """Yield all possible legion_moves for movesets, possibly including
-        some missing moves in the case where not all creatures can get onboard.
-
-        movesets is a list of sets of hexlabels to which each Creature can move
-        (or stay), in the same order as Legion.sorted_creatures.  Like:
-        creatures [titan1, ogre1, troll1]
-        movesets [{"A1", "A2", "B1"}, {"B1", "B2"}, {"B1", "B3"}]
-
-        A legion_move is a list of hexlabels, in the same order as creatures,
-        where each Creature's hexlabel is one from its original list, and no
-        two Creatures have the same hexlabel.  Like:
-        ["A1", "B1", "B3"]
-        """
-        logging.info(movesets)
-        for moves in self._gen_legion_moves_inner(movesets):
-            yield list(moves)
-
-    def _score_perm(
-        self,
-        game: Game.Game,
-        sort_values: Dict[str, float],
-        perm: Iterable[Tuple[str, str, str]],
-    ) -> float:
-        """Score one move order permutation."""
-        score = 0.0
-        moved_creatures = set()
-        try:
-            for (creature_name, start, move) in perm:
-                creature = game.creatures_in_battle_hex(
-                    start, creature_name
-                ).pop()
-                if move == start or move in game.find_battle_moves(creature):
-                    creature.previous_hexlabel = creature.hexlabel
-                    creature.hexlabel = move
-                    moved_creatures.add(creature)
-                    score += sort_values[creature_name]
-            return score
-        finally:
-            for creature in moved_creatures:
-                creature.hexlabel = creature.previous_hexlabel
-                creature.previous_hexlabel = None
-
     def _find_move_order(
         self, game: Game.Game, creature_moves: List[Tuple[str, str, str]]
     ) -> List[Tuple[str, str, str]]:
@@ -912,37 +1003,378 @@ class CleverBot(object):
 
         creature_moves is a list of (creature_name, start_hexlabel,
         finish_hexlabel) tuples.
+
+        A creature moving into a hex that an ally is leaving has to wait
+        for the ally to leave, so only moves whose destinations are free
+        are tried at each step.  Creatures can also block each other's
+        paths, so each move is checked with find_battle_moves, and we
+        backtrack if an order gets stuck.  Each creature is either where
+        it started or where it's going, so the state is just the set of
+        moves made so far, and each state needs to be explored only once.
+
+        If there is no order that makes every move (for example, if two
+        creatures want to swap hexes), return the order that makes the
+        most valuable set of moves, followed by the rest.
         """
-        max_score = 0.0
-        sort_values = {}
+        snapshot = BattleSnapshot.BattleSnapshot(game)
+        indexes = []  # type: List[int]
         for creature_name, start, move in creature_moves:
-            creature = game.creatures_in_battle_hex(start, creature_name).pop()
-            sort_values[creature_name] = creature.sort_value
-            max_score += creature.sort_value
-        perms = list(
-            itertools.permutations(creature_moves)
-        )  # type: List[Iterable[Tuple[str, str, str]]]
-        logging.info(f"{len(perms)} perms")
-        # Scramble the list so we don't get a bunch of similar bad
-        # orders jumbled together at the beginning.
-        random.shuffle(perms)
+            for index, creature in enumerate(snapshot.creatures):
+                if (
+                    creature.name == creature_name
+                    and snapshot.hexlabels[index] == start
+                    and index not in indexes
+                ):
+                    indexes.append(index)
+                    break
+        assert len(indexes) == len(creature_moves)
+        num_moves = len(creature_moves)
+        # For each move, a bitmask of the moves that must be made first
+        # because they vacate its destination.
+        vacate_first = [0] * num_moves
+        for ii, (unused, start1, move1) in enumerate(creature_moves):
+            if move1 == start1:
+                continue
+            for jj, (unused, start2, move2) in enumerate(creature_moves):
+                if jj != ii and start2 == move1 and move2 != start2:
+                    vacate_first[ii] |= 1 << jj
+        all_done = (1 << num_moves) - 1
+        visited = set()  # type: Set[int]
+        order = []  # type: List[int]
+        best_score = -1.0
+        best_order = []  # type: List[int]
+
+        def search(
+            snapshot: BattleSnapshot.BattleSnapshot, done: int, score: float
+        ) -> bool:
+            nonlocal best_score, best_order
+            if done in visited:
+                return False
+            visited.add(done)
+            if score > best_score:
+                best_score = score
+                best_order = list(order)
+            if done == all_done:
+                return True
+            for ii, (unused, start, move) in enumerate(creature_moves):
+                bit = 1 << ii
+                if done & bit or vacate_first[ii] & ~done:
+                    continue
+                index = indexes[ii]
+                if move != start and move not in snapshot.find_battle_moves(
+                    index
+                ):
+                    continue
+                order.append(ii)
+                if search(
+                    snapshot.move(index, move),
+                    done | bit,
+                    score + snapshot.sort_values[index],
+                ):
+                    return True
+                order.pop()
+            return False
+
+        if search(snapshot, 0, 0.0):
+            logging.info("found perfect order")
+            best_order = order
+        logging.info(f"explored {len(visited)} move states")
+        for ii in range(num_moves):
+            if ii not in best_order:
+                best_order.append(ii)
+        result = [creature_moves[ii] for ii in best_order]
+        logging.info(f"returning {result}")
+        return result
+
+    def _find_best_legion_move(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        indexes: List[int],
+        movesets: List[Set[str]],
+        finish_time: float,
+    ) -> Optional[List[str]]:
+        """Return the legion move with the best _score_legion_move, or None
+        if there is no legal legion move.
+
+        See _search_legion_moves.
+        """
+        return self._search_legion_moves(
+            snapshot, indexes, movesets, finish_time
+        )[1]
+
+    def _search_legion_moves(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        indexes: List[int],
+        movesets: List[Set[str]],
+        finish_time: float,
+    ) -> Tuple[float, Optional[List[str]]]:
+        """Return (score, legion move) for the legion move with the best
+        _score_legion_move, or (-maxsize, None) if there is no legal legion
+        move.
+
+        A legion move is a list of distinct hexlabels, one from each of
+        movesets, in the same order as indexes, which are the snapshot
+        indexes of creatures in one legion.
+
+        This is a branch and bound search.  Creatures are given hexes one at
+        a time, trying each creature's best isolated moves first, and a
+        partial legion move is abandoned as soon as an optimistic bound on
+        its final score cannot beat the best complete legion move so far.
+        Complete legion moves are scored incrementally by a
+        LegionMoveScorer.
+
+        Each creature's isolated score leaves out everything that depends on
+        where its allies end up: the kill bonus, the adjacent ally bonus,
+        and rangestrikes that an ally could block.  The kill bonus is bounded
+        by assuming that every creature not yet placed does its best damage
+        to every enemy, and the ally bonus by assuming that every creature
+        not yet placed is next to as many allies as possible.  (The bound
+        relies on penalties being negative and bonuses positive, as in every
+        BotParams.)  Rangestrikes along a hexspine are assumed to pass
+        whichever side has more bramble hexes, since allies can block
+        either side.
+
+        If finish_time passes, return the best legion move found so far.
+        """
+        assert snapshot.battle_turn is not None
+        battlemap = snapshot.battlemap
+        enemies = list(snapshot.enemies(indexes[0]))
+        hits_left = [snapshot.hits_left(enemy) for enemy in enemies]
+        sort_values = [snapshot.sort_values[enemy] for enemy in enemies]
+        kill_multiplier = self.bp.KILL_MULTIPLIER  # type: ignore
+        ally_bonus = self.bp.ADJACENT_ALLY_BONUS  # type: ignore
+        num_creatures = len(indexes)
+        max_neighbors = min(6, num_creatures - 1)
+        num_kill_eligible = 0
+        for index in indexes:
+            if (
+                snapshot.creatures[index].name != "Titan"
+                or snapshot.battle_turn >= 4
+                or snapshot.legion_size(index) == 1
+            ):
+                num_kill_eligible += 1
+
+        # Every hex that could hold a creature once the legion has moved.
+        fixed_mask = 0
+        for index, hexlabel in enumerate(snapshot.hexlabels):
+            if hexlabel is not None and index not in indexes:
+                fixed_mask |= BattleMap.hexlabel_to_bit[hexlabel]
+        moveset_masks = []
+        for moveset in movesets:
+            mask = 0
+            for move in moveset:
+                mask |= BattleMap.hexlabel_to_bit[move]
+            moveset_masks.append(mask)
+
+        # For each creature, a list of (isolated score, hexlabel, mean hits
+        # on each enemy), best first.
+        choices = []  # type: List[List[Tuple[float, str, List[float]]]]
+        for ii, index in enumerate(indexes):
+            occupied = fixed_mask
+            for jj, mask in enumerate(moveset_masks):
+                if jj != ii:
+                    occupied |= mask
+            choices1 = []
+            # Sorted so that ties go the same way in every process.
+            for move in sorted(movesets[ii]):
+                snapshot2 = snapshot.move(index, move)
+                engaged = snapshot2.engaged_enemies(index)
+                rangestrikers = [
+                    enemy
+                    for enemy in enemies
+                    if enemy not in engaged
+                    and self._can_always_rangestrike(
+                        snapshot2, enemy, index, occupied
+                    )
+                ]
+                # Outbound rangestrikes only count in the strike phase, so
+                # they never depend on allies here.
+                score = self._score_creature(
+                    snapshot2,
+                    index,
+                    0.0,
+                    rangestrikers=rangestrikers,
+                    count_allies=False,
+                )
+                mean_hits = self._mean_hits_by_enemy(snapshot2, index)
+                choices1.append((score, move, mean_hits))
+            choices1.sort(key=lambda choice: choice[0], reverse=True)
+            choices.append(choices1)
+
+        # The best possible base score and mean hits on each enemy, for
+        # creatures ii onward.
+        rest_scores = [0.0] * (num_creatures + 1)
+        rest_hits = [[0.0] * len(enemies)]
+        for ii in range(num_creatures - 1, -1, -1):
+            rest_scores[ii] = rest_scores[ii + 1] + max(
+                choice[0] for choice in choices[ii]
+            )
+            rest_hits.insert(
+                0,
+                [
+                    hits + max(choice[2][jj] for choice in choices[ii])
+                    for jj, hits in enumerate(rest_hits[0])
+                ],
+            )
+
         best_score = float(-maxsize)
-        best_perm = perms[0]
-        finish_time = time.time() + self.ai_time_limit
-        for perm in perms:
-            score = self._score_perm(game, sort_values, perm)
-            if score == max_score:
-                best_perm = perm
-                logging.info("found perfect order")
-                break
-            elif score > best_score:
-                best_perm = perm
+        best_legion_move = None  # type: Optional[List[str]]
+        legion_move = [""] * num_creatures
+        num_scored = 0
+        timed_out = False
+
+        def search(
+            ii: int,
+            used: int,
+            score: float,
+            mean_hits: List[float],
+            adjacent_pairs: int,
+        ) -> None:
+            nonlocal best_score, best_legion_move, num_scored, timed_out
+            if ii == num_creatures:
+                for jj, move in enumerate(legion_move):
+                    scorer.move(jj, move)
+                score = scorer.score
+                num_scored += 1
+                if score > best_score:
+                    best_score = score
+                    best_legion_move = list(legion_move)
+                if time.time() > finish_time:
+                    timed_out = True
+                return
+            kill_bonus = 0.0
+            for jj, hits in enumerate(mean_hits):
+                if hits + rest_hits[ii][jj] >= hits_left[jj]:
+                    kill_bonus += sort_values[jj]
+            bound = (
+                score
+                + rest_scores[ii]
+                + max(kill_multiplier, 0) * kill_bonus * num_kill_eligible
+                + max(ally_bonus, 0)
+                * 2
+                * (adjacent_pairs + max_neighbors * (num_creatures - ii))
+            )
+            if bound <= best_score:
+                return
+            for score1, move, mean_hits1 in choices[ii]:
+                bit = BattleMap.hexlabel_to_bit[move]
+                if used & bit:
+                    continue
+                legion_move[ii] = move
+                search(
+                    ii + 1,
+                    used | bit,
+                    score + score1,
+                    [a + b for a, b in zip(mean_hits, mean_hits1)],
+                    adjacent_pairs
+                    + bin(battlemap.neighbor_masks[move] & used).count("1"),
+                )
+                if timed_out:
+                    return
+
+        scorer = LegionMoveScorer(self, snapshot, indexes)
+        search(0, 0, 0.0, [0.0] * len(enemies), 0)
+        if timed_out:
+            logging.info("time limit")
+        logging.info(f"scored {num_scored} legion_moves")
+        return best_score, best_legion_move
+
+    def _find_best_legion_move_parallel(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        indexes: List[int],
+        movesets: List[Set[str]],
+        finish_time: float,
+    ) -> Optional[List[str]]:
+        """Like _find_best_legion_move, but split the search across
+        self.ai_processes worker processes.
+
+        The creature with the most moves is given each of its moves in a
+        separate search, and the best result wins, with ties going to the
+        earliest search.  The searches stop PARALLEL_MARGIN seconds before
+        finish_time, and any that have not reported back by finish_time
+        are ignored.  If none have, fall back to _find_best_legion_move,
+        which returns its first legion move once finish_time has passed.
+        """
+        split = max(
+            range(len(indexes)), key=lambda ii: (len(movesets[ii]), -ii)
+        )
+        if len(movesets[split]) < 2:
+            return self._find_best_legion_move(
+                snapshot, indexes, movesets, finish_time
+            )
+        assert self._pool is not None
+        snapshot_bytes = pickle.dumps(snapshot)
+        futures = []
+        for move in sorted(movesets[split]):
+            movesets2 = list(movesets)
+            movesets2[split] = {move}
+            futures.append(
+                self._pool.submit(
+                    _search_legion_moves_worker,
+                    self.bp,
+                    snapshot_bytes,
+                    indexes,
+                    movesets2,
+                    finish_time - PARALLEL_MARGIN,
+                )
+            )
+        timeout = max(finish_time - time.time(), 0.0)
+        concurrent.futures.wait(futures, timeout=timeout)
+        best_score = float(-maxsize)
+        best_legion_move = None  # type: Optional[List[str]]
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                logging.info("parallel search missed the time limit")
+                continue
+            score, legion_move = future.result()
+            if legion_move is not None and (
+                best_legion_move is None or score > best_score
+            ):
                 best_score = score
-            if time.time() > finish_time:
-                logging.info("time limit")
-                break
-        logging.info(f"returning {list(best_perm)}")
-        return list(best_perm)
+                best_legion_move = legion_move
+        if best_legion_move is None:
+            logging.info("no parallel search finished; searching serially")
+            return self._find_best_legion_move(
+                snapshot, indexes, movesets, finish_time
+            )
+        return best_legion_move
+
+    def _can_always_rangestrike(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        enemy: int,
+        index: int,
+        occupied: int,
+    ) -> bool:
+        """Return True iff enemy could rangestrike creature index even with
+        creatures in every hex in the bitmask occupied.
+
+        This matches BattleSnapshot.potential_rangestrike_targets, except
+        that line of sight is checked against occupied.
+        """
+        enemy_hexlabel = snapshot.hexlabels[enemy]
+        hexlabel = snapshot.hexlabels[index]
+        enemy_creature = snapshot.creatures[enemy]
+        if (
+            enemy_hexlabel is None
+            or snapshot.offboard(enemy)
+            or not enemy_creature.rangestrikes
+            or snapshot.has_dead_adjacent_enemies(enemy)
+            or hexlabel is None
+            or not snapshot.onboard(index)
+        ):
+            return False
+        return Creature.is_potential_rangestrike_target(
+            enemy_creature.creature_type,
+            enemy_hexlabel,
+            snapshot.creatures[index].creature_type,
+            hexlabel,
+            snapshot.battlemap,
+            occupied,
+        )
 
     def _find_best_creature_moves(
         self, game: Game.Game
@@ -971,10 +1403,12 @@ class CleverBot(object):
         creatures = legion.sorted_living_creatures
         if not creatures:
             return None
+        snapshot = BattleSnapshot.BattleSnapshot(game)
+        indexes = [snapshot.index(creature) for creature in creatures]
         movesets = []  # list of a set of hexlabels for each creature
         previous_creature = None
         moveset = None
-        for creature in creatures:
+        for creature, index in zip(creatures, indexes):
             assert creature.hexlabel is not None
             if (
                 previous_creature
@@ -984,8 +1418,8 @@ class CleverBot(object):
                 # Reuse previous moveset
                 moveset = copy.deepcopy(moveset)
             else:
-                moves = game.find_battle_moves(
-                    creature, ignore_mobile_allies=True
+                moves = snapshot.find_battle_moves(
+                    index, ignore_mobile_allies=True
                 )
                 if moves:
                     score_moves = []
@@ -993,57 +1427,32 @@ class CleverBot(object):
                     if creature.hexlabel not in {"ATTACKER", "DEFENDER"}:
                         moves.add(creature.hexlabel)
                     for move in moves:
-                        try:
-                            creature.previous_hexlabel = creature.hexlabel
-                            creature.hexlabel = move
-                            score = self._score_legion_move(game, [creature])
-                            score_moves.append((score, move))
-                        finally:
-                            creature.hexlabel = creature.previous_hexlabel
+                        score = self._score_snapshot(
+                            snapshot.move(index, move), [index]
+                        )
+                        score_moves.append((score, move))
                     score_moves.sort()
                     logging.info(f"{creature=} {score_moves=}")
-                    moveset = best7(score_moves)
+                    moveset = best7(score_moves, self.random)
                 else:
                     moveset = {creature.hexlabel}
             movesets.append(moveset)
             previous_creature = creature
-        now = time.time()
-        legion_moves = list(self._gen_legion_moves(movesets))
-        logging.info(
-            f"found {len(legion_moves)} legion_moves in {time.time() - now}"
-        )
-        if not legion_moves:
-            legion_moves = list(self._gen_fallback_legion_moves(movesets))
-            if not legion_moves:
-                return None
         start_time = time.time()
         finish_time = start_time + self.ai_time_limit
-        # Scramble the moves, in case we don't have time to look at them all.
-        random.shuffle(legion_moves)
-        best_legion_move = legion_moves[0]
-        best_score = float(-maxsize)
-        lc = len(creatures)
-        llm0 = len(legion_moves[0])
-        logging.info(f"len(creatures) = {lc} len(legion_moves[0]) = {llm0}")
-        for legion_move in legion_moves:
-            try:
-                for ii, creature in enumerate(creatures):
-                    move = legion_move[ii]
-                    creature.previous_hexlabel = creature.hexlabel
-                    creature.hexlabel = move
-                score = self._score_legion_move(game, creatures)
-                if score > best_score:
-                    best_legion_move = legion_move
-                    best_score = score
-                now = time.time()
-                if now > finish_time:
-                    logging.info("time limit")
-                    break
-            finally:
-                for creature in creatures:
-                    creature.hexlabel = creature.previous_hexlabel
+        if self.ai_processes > 1:
+            best_legion_move = self._find_best_legion_move_parallel(
+                snapshot, indexes, movesets, finish_time
+            )
+        else:
+            best_legion_move = self._find_best_legion_move(
+                snapshot, indexes, movesets, finish_time
+            )
+        if best_legion_move is None:
+            return None
         logging.info(
-            f"found best_legion_move {best_legion_move} in {now - start_time}"
+            f"found best_legion_move {best_legion_move} in "
+            f"{time.time() - start_time}"
         )
         for creature in creatures:
             assert creature.hexlabel is not None
@@ -1109,233 +1518,292 @@ class CleverBot(object):
         def1 = self.user.callRemote("done_with_maneuvers", game.name)  # type: ignore
         def1.addErrback(self.failure)
 
+    def _mean_hits_by_enemy(
+        self, snapshot: BattleSnapshot.BattleSnapshot, index: int
+    ) -> List[float]:
+        """Return a list of the mean hits creature index could do to each
+        of its enemies from its current hex, by melee or, if not engaged,
+        by rangestrike."""
+        engaged = snapshot.engaged_enemies(index)
+        if engaged:
+            targets = []  # type: List[int]
+        else:
+            targets = snapshot.rangestrike_targets(index)
+        result = []
+        for enemy in snapshot.enemies(index):
+            if enemy in engaged or enemy in targets:
+                dice = snapshot.number_of_dice(index, enemy)
+                strike_number = snapshot.strike_number(index, enemy)
+                result.append(dice * (7.0 - strike_number) / 6)
+            else:
+                result.append(0.0)
+        return result
+
     def _score_legion_move(
         self, game: Game.Game, creatures: List[Creature.Creature]
     ) -> float:
         """Return a score for creatures in their current hexlabels."""
-        assert game.battle_turn is not None
-        score = 0
-        battlemap = game.battlemap
-        assert battlemap is not None
-        legion = creatures[0].legion
-        assert legion is not None
-        legion2 = game.other_battle_legion(legion)
-        assert legion2 is not None
+        snapshot = BattleSnapshot.BattleSnapshot(game)
+        return self._score_snapshot(
+            snapshot, [snapshot.index(creature) for creature in creatures]
+        )
 
+    def _score_snapshot(
+        self, snapshot: BattleSnapshot.BattleSnapshot, indexes: List[int]
+    ) -> float:
+        """Return a score for the creatures with indexes, which are all in
+        the same legion, in their hexlabels in snapshot."""
         # For each enemy, figure out the average damage we could do to it if
         # everyone concentrated on hitting it, and if that's enough to kill it,
         # give every creature a kill bonus.
         # (This is not quite right because each creature can only hit one enemy
         # (ignoring carries), but it's a start.)
+        enemies = snapshot.enemies(indexes[0])
+        total_mean_hits = [0.0] * len(enemies)
+        for index in indexes:
+            for ii, mean_hits in enumerate(
+                self._mean_hits_by_enemy(snapshot, index)
+            ):
+                total_mean_hits[ii] += mean_hits
         kill_bonus = 0.0
-        for enemy in legion2.creatures:
-            total_mean_hits = 0.0
-            for creature in creatures:
-                if enemy in creature.engaged_enemies or (
-                    not creature.engaged
-                    and enemy in creature.rangestrike_targets
-                ):
-                    dice = creature.number_of_dice(enemy)
-                    strike_number = creature.strike_number(enemy)
-                    mean_hits = dice * (7.0 - strike_number) / 6
-                    total_mean_hits += mean_hits
-            if total_mean_hits >= enemy.hits_left:
-                kill_bonus += enemy.sort_value
+        for ii, enemy in enumerate(enemies):
+            if total_mean_hits[ii] >= snapshot.hits_left(enemy):
+                kill_bonus += snapshot.sort_values[enemy]
 
-        for creature in creatures:
-            assert creature.hexlabel is not None
-            can_rangestrike = False
-            engaged = creature.engaged_enemies
-            max_mean_hits = 0.0
-            total_mean_damage_taken = 0.0
-            engaged_with_rangestriker = False
-            # melee
-            for enemy in engaged:
-                # Damage we can do.
-                dice = creature.number_of_dice(enemy)
-                strike_number = creature.strike_number(enemy)
-                mean_hits = dice * (7.0 - strike_number) / 6
-                max_mean_hits = max(mean_hits, max_mean_hits)
-                # Damage we can take.
-                dice = enemy.number_of_dice(creature)
-                strike_number = enemy.strike_number(creature)
-                mean_hits = dice * (7.0 - strike_number) / 6
-                total_mean_damage_taken += mean_hits
-                if enemy.rangestrikes:
-                    engaged_with_rangestriker = True
-            # inbound rangestriking
-            for enemy in legion2.creatures:
-                if enemy not in engaged:
-                    if creature in enemy.potential_rangestrike_targets:
-                        dice = enemy.number_of_dice(creature)
-                        strike_number = enemy.strike_number(creature)
-                        mean_hits = dice * (7.0 - strike_number) / 6
-                        total_mean_damage_taken += mean_hits
-            probable_death = total_mean_damage_taken >= creature.hits_left
-
-            if engaged_with_rangestriker and not creature.rangestrikes:
-                score += self.bp.ENGAGE_RANGESTRIKER_BONUS  # type: ignore
-
-            # rangestriking
-            if not engaged:
-                targets = creature.rangestrike_targets
-                for enemy in targets:
-                    # Damage we can do
-                    dice = creature.number_of_dice(enemy)
-                    strike_number = creature.strike_number(enemy)
-                    mean_hits = dice * (7.0 - strike_number) / 6
-                    max_mean_hits = max(mean_hits, max_mean_hits)
-                    can_rangestrike = True
-            if can_rangestrike:
-                score += self.bp.RANGESTRIKE_BONUS  # type: ignore
-
-            # Don't encourage titans to charge early.
+        score = 0.0
+        for index in indexes:
+            score += self._score_creature(snapshot, index, kill_bonus)
+        return score
+
+    def _score_creature(
+        self,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        index: int,
+        kill_bonus: float,
+        rangestrikers: Optional[List[int]] = None,
+        count_allies: bool = True,
+    ) -> float:
+        """Return creature index's part of _score_snapshot, given the kill
+        bonus for its whole legion.
+
+        rangestrikers, if not None, replaces the list of enemies that could
+        rangestrike the creature.  If count_allies is False, leave out the
+        adjacent ally bonus, and assume that each of rangestrikers strikes
+        through as many bramble hexes as any placement of allies could make
+        it.
+        """
+        battle_turn = snapshot.battle_turn
+        assert battle_turn is not None
+        battlemap = snapshot.battlemap
+        creature = snapshot.creatures[index]
+        hexlabel = snapshot.hexlabels[index]
+        assert hexlabel is not None
+        is_attacker = snapshot.is_attacker(index)
+        score = 0.0
+        can_rangestrike = False
+        engaged = snapshot.engaged_enemies(index)
+        max_mean_hits = 0.0
+        total_mean_damage_taken = 0.0
+        engaged_with_rangestriker = False
+        # melee
+        for enemy in engaged:
+            # Damage we can do.
+            dice = snapshot.number_of_dice(index, enemy)
+            strike_number = snapshot.strike_number(index, enemy)
+            mean_hits = dice * (7.0 - strike_number) / 6
+            max_mean_hits = max(mean_hits, max_mean_hits)
+            # Damage we can take.
+            dice = snapshot.number_of_dice(enemy, index)
+            strike_number = snapshot.strike_number(enemy, index)
+            mean_hits = dice * (7.0 - strike_number) / 6
+            total_mean_damage_taken += mean_hits
+            if snapshot.creatures[enemy].rangestrikes:
+                engaged_with_rangestriker = True
+        # inbound rangestriking
+        if rangestrikers is None:
+            rangestrikers = [
+                enemy
+                for enemy in snapshot.enemies(index)
+                if enemy not in engaged
+                and index in snapshot.potential_rangestrike_targets(enemy)
+            ]
+        for enemy in rangestrikers:
+            dice = snapshot.number_of_dice(enemy, index)
+            strike_number = snapshot.strike_number(enemy, index)
+            enemy_creature = snapshot.creatures[enemy]
             if (
-                creature.name != "Titan"
-                or game.battle_turn >= 4
-                or len(legion) == 1
+                not count_allies
+                and not enemy_creature.magicmissile
+                and not enemy_creature.is_native("Bramble")
             ):
-                if max_mean_hits:
-                    bonus = self.bp.HIT_BONUS * max_mean_hits  # type: ignore
-                    score += bonus
-                if kill_bonus:
-                    bonus = self.bp.KILL_MULTIPLIER * kill_bonus  # type: ignore
-                    score += bonus
-            if total_mean_damage_taken:
-                penalty = self.bp.DAMAGE_PENALTY * total_mean_damage_taken  # type: ignore
-                score += penalty
-            if probable_death:
-                penalty = (
-                    self.bp.DEATH_MULTIPLIER  # type: ignore
-                    * probable_death
-                    * creature.sort_value
+                # Allies can push a line of sight along a hexspine to
+                # either side, past different numbers of bramble hexes.
+                enemy_hexlabel = snapshot.hexlabels[enemy]
+                assert enemy_hexlabel is not None
+                extra_brambles = battlemap.max_bramble_hexes(
+                    enemy_hexlabel, hexlabel
+                ) - battlemap.count_bramble_hexes_by(
+                    enemy_hexlabel, hexlabel, snapshot.occupied_mask
                 )
-                score += penalty
+                strike_number = min(strike_number + extra_brambles, 6)
+            mean_hits = dice * (7.0 - strike_number) / 6
+            total_mean_damage_taken += mean_hits
+        probable_death = total_mean_damage_taken >= snapshot.hits_left(index)
+
+        if engaged_with_rangestriker and not creature.rangestrikes:
+            score += self.bp.ENGAGE_RANGESTRIKER_BONUS  # type: ignore
+
+        # rangestriking
+        if not engaged:
+            targets = snapshot.rangestrike_targets(index)
+            for enemy in targets:
+                # Damage we can do
+                dice = snapshot.number_of_dice(index, enemy)
+                strike_number = snapshot.strike_number(index, enemy)
+                mean_hits = dice * (7.0 - strike_number) / 6
+                max_mean_hits = max(mean_hits, max_mean_hits)
+                can_rangestrike = True
+        if can_rangestrike:
+            score += self.bp.RANGESTRIKE_BONUS  # type: ignore
 
-            # Attacker must attack to avoid time loss
-            # Don't encourage titans to charge early.
-            if legion == game.attacker_legion and (
-                creature.name != "Titan"
-                or game.battle_turn >= 4
-                or len(legion) == 1
-            ):
-                if engaged or targets:
-                    score += self.bp.ATTACKER_AGGRESSION_BONUS  # type: ignore
-                else:
-                    enemy_hexlabels = [
-                        enemy.hexlabel
-                        for enemy in legion2.living_creatures
-                        if enemy.hexlabel is not None
-                    ]
-                    if enemy_hexlabels:
-                        min_range = min(
-                            (
-                                battlemap.range(
-                                    creature.hexlabel, enemy_hexlabel
-                                )
-                                for enemy_hexlabel in enemy_hexlabels
-                            )
+        # Don't encourage titans to charge early.
+        if (
+            creature.name != "Titan"
+            or battle_turn >= 4
+            or snapshot.legion_size(index) == 1
+        ):
+            if max_mean_hits:
+                bonus = self.bp.HIT_BONUS * max_mean_hits  # type: ignore
+                score += bonus
+            if kill_bonus:
+                bonus = self.bp.KILL_MULTIPLIER * kill_bonus  # type: ignore
+                score += bonus
+        if total_mean_damage_taken:
+            penalty = self.bp.DAMAGE_PENALTY * total_mean_damage_taken  # type: ignore
+            score += penalty
+        if probable_death:
+            penalty = (
+                self.bp.DEATH_MULTIPLIER  # type: ignore
+                * probable_death
+                * snapshot.sort_values[index]
+            )
+            score += penalty
+
+        # Attacker must attack to avoid time loss
+        # Don't encourage titans to charge early.
+        if is_attacker and (
+            creature.name != "Titan"
+            or battle_turn >= 4
+            or snapshot.legion_size(index) == 1
+        ):
+            if engaged or targets:
+                score += self.bp.ATTACKER_AGGRESSION_BONUS  # type: ignore
+            else:
+                enemy_hexlabels = []  # type: List[str]
+                for enemy in snapshot.enemies(index):
+                    enemy_hexlabel = snapshot.hexlabels[enemy]
+                    if not snapshot.dead(enemy) and enemy_hexlabel is not None:
+                        enemy_hexlabels.append(enemy_hexlabel)
+                if enemy_hexlabels:
+                    min_range = min(
+                        (
+                            battlemap.range(hexlabel, enemy_hexlabel)
+                            for enemy_hexlabel in enemy_hexlabels
                         )
-                        penalty = min_range * self.bp.ATTACKER_DISTANCE_PENALTY  # type: ignore
-                        score += penalty
-
-            battlehex = battlemap.hexes[creature.hexlabel]
-            terrain = battlehex.terrain
-
-            # Make titans hang back early.
-            if (
-                creature.is_titan
-                and game.battle_turn < 4
-                and terrain != "Tower"
-            ):
-                if legion == game.attacker_legion:
-                    entrance = "ATTACKER"
-                else:
-                    entrance = "DEFENDER"
-                distance = (
-                    battlemap.range(
-                        creature.hexlabel, entrance, allow_entrance=True
                     )
-                    - 2
-                )
-                penalty = distance * self.bp.TITAN_FORWARD_PENALTY  # type: ignore
-                if penalty:
+                    penalty = min_range * self.bp.ATTACKER_DISTANCE_PENALTY  # type: ignore
                     score += penalty
 
-            # Make defenders hang back early.
-            if (
-                legion == game.defender_legion
-                and game.battle_turn < 4
-                and terrain != "Tower"
-            ):
+        battlehex = battlemap.hexes[hexlabel]
+        terrain = battlehex.terrain
+
+        # Make titans hang back early.
+        if creature.is_titan and battle_turn < 4 and terrain != "Tower":
+            if is_attacker:
+                entrance = "ATTACKER"
+            else:
                 entrance = "DEFENDER"
-                distance = (
-                    battlemap.range(
-                        creature.hexlabel, entrance, allow_entrance=True
-                    )
-                    - 2
-                )
-                penalty = distance * self.bp.DEFENDER_FORWARD_PENALTY  # type: ignore
-                if penalty:
-                    score += penalty
+            distance = (
+                battlemap.range(hexlabel, entrance, allow_entrance=True) - 2
+            )
+            penalty = distance * self.bp.TITAN_FORWARD_PENALTY  # type: ignore
+            if penalty:
+                score += penalty
 
-            # terrain
-            if battlehex.elevation:
-                bonus = battlehex.elevation * self.bp.ELEVATION_BONUS  # type: ignore
-                score += bonus
-            if terrain == "Bramble":
-                if creature.is_native(terrain):
-                    score += self.bp.NATIVE_BRAMBLE_BONUS  # type: ignore
-                else:
-                    score += self.bp.NON_NATIVE_BRAMBLE_PENALTY  # type: ignore
-            elif terrain == "Tower":
-                # XXX Hardcoded to default Tower map
-                score += self.bp.TOWER_BONUS  # type: ignore
-                if battlehex.elevation == 2:
-                    if creature.is_titan:
-                        score += self.bp.TITAN_IN_CENTER_OF_TOWER_BONUS  # type: ignore
-                    else:
-                        score += self.bp.CENTER_OF_TOWER_BONUS  # type: ignore
-                elif (
-                    legion == game.defender_legion
-                    and creature.name != "Titan"
-                    and battlehex.label in ["C3", "D3"]
-                ):
-                    score += self.bp.FRONT_OF_TOWER_BONUS  # type: ignore
-                elif (
-                    legion == game.defender_legion
-                    and creature.name != "Titan"
-                    and battlehex.label in ["C4", "E3"]
-                ):
-                    score += self.bp.MIDDLE_OF_TOWER_BONUS  # type: ignore
-            elif terrain == "Drift":
-                if not creature.is_native(terrain):
-                    score += self.bp.NON_NATIVE_DRIFT_PENALTY  # type: ignore
-            elif terrain == "Volcano":
-                score += self.bp.NATIVE_VOLCANO_BONUS  # type: ignore
-
-            if "Slope" in battlehex.borders:
-                if creature.is_native("Slope"):
-                    score += self.bp.NATIVE_SLOPE_BONUS  # type: ignore
-                else:
-                    score += self.bp.NON_NATIVE_SLOPE_PENALTY  # type: ignore
-            if "Dune" in battlehex.borders:
-                if creature.is_native("Dune"):
-                    score += self.bp.NATIVE_DUNE_BONUS  # type: ignore
-                else:
-                    score += self.bp.NON_NATIVE_DUNE_PENALTY  # type: ignore
-
-            # allies
-            num_adjacent_allies = 0
-            for neighbor in battlehex.neighbors.values():
-                for ally in legion.living_creatures:
-                    if ally.hexlabel == neighbor.label:
-                        num_adjacent_allies += 1
-            adjacent_allies_bonus = (
-                num_adjacent_allies * self.bp.ADJACENT_ALLY_BONUS  # type: ignore
+        # Make defenders hang back early.
+        if not is_attacker and battle_turn < 4 and terrain != "Tower":
+            entrance = "DEFENDER"
+            distance = (
+                battlemap.range(hexlabel, entrance, allow_entrance=True) - 2
             )
-            if adjacent_allies_bonus:
-                score += adjacent_allies_bonus
+            penalty = distance * self.bp.DEFENDER_FORWARD_PENALTY  # type: ignore
+            if penalty:
+                score += penalty
+
+        # terrain
+        if battlehex.elevation:
+            bonus = battlehex.elevation * self.bp.ELEVATION_BONUS  # type: ignore
+            score += bonus
+        if terrain == "Bramble":
+            if creature.is_native(terrain):
+                score += self.bp.NATIVE_BRAMBLE_BONUS  # type: ignore
+            else:
+                score += self.bp.NON_NATIVE_BRAMBLE_PENALTY  # type: ignore
+        elif terrain == "Tower":
+            # XXX Hardcoded to default Tower map
+            score += self.bp.TOWER_BONUS  # type: ignore
+            if battlehex.elevation == 2:
+                if creature.is_titan:
+                    score += self.bp.TITAN_IN_CENTER_OF_TOWER_BONUS  # type: ignore
+                else:
+                    score += self.bp.CENTER_OF_TOWER_BONUS  # type: ignore
+            elif (
+                not is_attacker
+                and creature.name != "Titan"
+                and battlehex.label in ["C3", "D3"]
+            ):
+                score += self.bp.FRONT_OF_TOWER_BONUS  # type: ignore
+            elif (
+                not is_attacker
+                and creature.name != "Titan"
+                and battlehex.label in ["C4", "E3"]
+            ):
+                score += self.bp.MIDDLE_OF_TOWER_BONUS  # type: ignore
+        elif terrain == "Drift":
+            if not creature.is_native(terrain):
+                score += self.bp.NON_NATIVE_DRIFT_PENALTY  # type: ignore
+        elif terrain == "Volcano":
+            score += self.bp.NATIVE_VOLCANO_BONUS  # type: ignore
+
+        if "Slope" in battlehex.borders:
+            if creature.is_native("Slope"):
+                score += self.bp.NATIVE_SLOPE_BONUS  # type: ignore
+            else:
+                score += self.bp.NON_NATIVE_SLOPE_PENALTY  # type: ignore
+        if "Dune" in battlehex.borders:
+            if creature.is_native("Dune"):
+                score += self.bp.NATIVE_DUNE_BONUS  # type: ignore
+            else:
+                score += self.bp.NON_NATIVE_DUNE_PENALTY  # type: ignore
+
+        # allies
+        if not count_allies:
+            return score
+        neighbor_mask = battlemap.neighbor_masks[battlehex.label]
+        num_adjacent_allies = 0
+        for ally in snapshot.allies(index):
+            ally_hexlabel = snapshot.hexlabels[ally]
+            if (
+                not snapshot.dead(ally)
+                and ally_hexlabel is not None
+                and neighbor_mask & BattleMap.hexlabel_to_bit[ally_hexlabel]
+            ):
+                num_adjacent_allies += 1
+        adjacent_allies_bonus = (
+            num_adjacent_allies * self.bp.ADJACENT_ALLY_BONUS  # type: ignore
+        )
+        if adjacent_allies_bonus:
+            score += adjacent_allies_bonus
 
         return score
 
@@ -1349,79 +1817,28 @@ class CleverBot(object):
             return
         legion = game.battle_active_legion
         assert legion is not None
-        # First do the strikers with only one target.
-        for striker in legion.sorted_creatures:
-            if striker.can_strike:
-                hexlabels = striker.find_target_hexlabels()
-                if len(hexlabels) == 1:
-                    hexlabel = hexlabels.pop()
-                    target = game.creatures_in_battle_hex(hexlabel).pop()
-                    num_dice = striker.number_of_dice(target)
-                    strike_number = striker.strike_number(target)
-                    def1 = self.user.callRemote(  # type: ignore
-                        "strike",
-                        game.name,
-                        striker.name,
-                        striker.hexlabel,
-                        target.name,
-                        target.hexlabel,
-                        num_dice,
-                        strike_number,
-                    )
-                    def1.addErrback(self.failure)
-                    return
-
-        # Then do the ones that have to choose a target.
-        target_to_total_mean_hits = collections.defaultdict(
-            float
-        )  # type: DefaultDict[Creature.Creature, float]
-        best_target = None
-        for striker in legion.sorted_creatures:
-            if striker.can_strike:
-                hexlabels = striker.find_target_hexlabels()
-                for hexlabel in hexlabels:
-                    target = game.creatures_in_battle_hex(hexlabel).pop()
-                    num_dice = striker.number_of_dice(target)
-                    strike_number = striker.strike_number(target)
-                    mean_hits = num_dice * (7.0 - strike_number) / 6
-                    target_to_total_mean_hits[target] += mean_hits
-        # First find the best target we can kill.
-        for target, total_mean_hits in target_to_total_mean_hits.items():
-            if total_mean_hits >= target.hits_left:
-                if (
-                    best_target is None
-                    or target.sort_value > best_target.sort_value
-                ):
-                    best_target = target
-        # If we can't kill anything, go after the target we can hurt most.
-        if best_target is None:
-            max_total_mean_hits = 0.0
-            for target, total_mean_hits in target_to_total_mean_hits.items():
-                if total_mean_hits >= max_total_mean_hits:
-                    best_target = target
-                    max_total_mean_hits = total_mean_hits
-        # Find the least valuable striker who can hit best_target.
-        for striker in reversed(legion.sorted_creatures):
-            if striker.can_strike:
-                hexlabels = striker.find_target_hexlabels()
-                for hexlabel in hexlabels:
-                    target = game.creatures_in_battle_hex(hexlabel).pop()
-                    if target is best_target:
-                        num_dice = striker.number_of_dice(target)
-                        strike_number = striker.strike_number(target)
-                        def1 = self.user.callRemote(  # type: ignore
-                            "strike",
-                            game.name,
-                            striker.name,
-                            striker.hexlabel,
-                            target.name,
-                            target.hexlabel,
-                            num_dice,
-                            strike_number,
-                        )
-                        def1.addErrback(self.failure)
-                        return
+        plan = self.strike_plan
+        if plan is None or plan.key != StrikePlan.make_key(game, legion):
+            plan = self.strike_plan = StrikePlan(game, legion)
+        else:
+            plan.update()
+        strike = plan.choose_strike()
+        if strike is not None:
+            striker, target, num_dice, strike_number = strike
+            def1 = self.user.callRemote(  # type: ignore
+                "strike",
+                game.name,
+                striker.name,
+                striker.hexlabel,
+                target.name,
+                target.hexlabel,
+                num_dice,
+                strike_number,
+            )
+            def1.addErrback(self.failure)
+            return
         # No strikes, so end the strike phase.
+        self.strike_plan = None
         if game.battle_phase == Phase.STRIKE:
             def1 = self.user.callRemote("done_with_strikes", game.name)  # type: ignore
             def1.addErrback(self.failure)
@@ -1455,7 +1872,7 @@ class CleverBot(object):
         # First find the best target we can kill.
         if best_target is None:
             for carry_target in carry_targets:
-                if carries >= target.hits_left:
+                if carries >= carry_target.hits_left:
                     if (
                         best_target is None
                         or carry_target.sort_value > best_target.sort_value
@@ -1463,11 +1880,17 @@ class CleverBot(object):
                         best_target = carry_target
         # If we can't kill anything then go after the hardest target to hit.
         if best_target is None:
+            options = {}  # type: Dict[Creature.Creature, Tuple[int, int]]
+            if self.strike_plan is not None:
+                options = self.strike_plan.striker_options.get(striker, {})
             best_num_dice = maxsize
             best_strike_number = 0
             for carry_target in carry_targets:
-                num_dice2 = striker.number_of_dice(carry_target)
-                strike_number2 = striker.strike_number(carry_target)
+                if carry_target in options:
+                    num_dice2, strike_number2 = options[carry_target]
+                else:
+                    num_dice2 = striker.number_of_dice(carry_target)
+                    strike_number2 = striker.strike_number(carry_target)
                 if (
                     best_target is None
                     or num_dice2 < best_num_dice
@@ -1484,3 +1907,472 @@ class CleverBot(object):
 
     def failure(self, error: Any) -> None:
         log.err(error)  # type: ignore
+
+
+def _start_worker() -> None:
+    """Do nothing, in a worker process, so that it starts up."""
+
+
+def _search_legion_moves_worker(
+    bot_params: BotParams.BotParams,
+    snapshot_bytes: bytes,
+    indexes: List[int],
+    movesets: List[Set[str]],
+    finish_time: float,
+) -> Tuple[float, Optional[List[str]]]:
+    """Run CleverBot._search_legion_moves in a worker process, on a
+    pickled BattleSnapshot."""
+    bot = CleverBot("", 0.0, bot_params)
+    snapshot = pickle.loads(snapshot_bytes)
+    return bot._search_legion_moves(snapshot, indexes, movesets, finish_time)
+
+
+class LegionMoveScorer(object):
+    """Keep CleverBot._score_snapshot up to date for some creatures in one
+    legion while they move one at a time.
+
+    Each creature's score without the kill bonus, and the mean hits it
+    could do to each enemy, are cached.  When a creature moves, the only
+    other creatures rescored are those next to its old or new hex, or with
+    a line of sight to or from an enemy that passes through either one.
+    The kill bonus is then recomputed from each enemy's total mean hits.
+    """
+
+    def __init__(
+        self,
+        bot: CleverBot,
+        snapshot: BattleSnapshot.BattleSnapshot,
+        indexes: List[int],
+    ):
+        assert snapshot.battle_turn is not None
+        self.bot = bot
+        self.snapshot = snapshot
+        self.indexes = indexes
+        self.enemies = snapshot.enemies(indexes[0])
+        self.kill_eligible = [
+            snapshot.creatures[index].name != "Titan"
+            or snapshot.battle_turn >= 4
+            or snapshot.legion_size(index) == 1
+            for index in indexes
+        ]
+        # For each creature, its score without the kill bonus, the mean
+        # hits it could do to each enemy, and a bitmask of the hexes where
+        # an ally could change its score.
+        self.base_scores = [0.0] * len(indexes)
+        self.mean_hits = [[]] * len(indexes)  # type: List[List[float]]
+        self.masks = [0] * len(indexes)
+        for ii in range(len(indexes)):
+            self._rescore(ii)
+        self.total_mean_hits = []  # type: List[float]
+        self.kill_bonus = 0.0
+        self._find_kill_bonus()
+
+    def _rescore(self, ii: int) -> None:
+        snapshot = self.snapshot
+        battlemap = snapshot.battlemap
+        index = self.indexes[ii]
+        hexlabel = snapshot.hexlabels[index]
+        assert hexlabel is not None
+        self.base_scores[ii] = self.bot._score_creature(snapshot, index, 0.0)
+        self.mean_hits[ii] = self.bot._mean_hits_by_enemy(snapshot, index)
+        mask = battlemap.neighbor_masks[hexlabel]
+        for enemy in self.enemies:
+            enemy_hexlabel = snapshot.hexlabels[enemy]
+            if snapshot.onboard(enemy) and enemy_hexlabel is not None:
+                mask |= battlemap.los_blockers(enemy_hexlabel, hexlabel)
+                mask |= battlemap.los_blockers(hexlabel, enemy_hexlabel)
+        self.masks[ii] = mask
+
+    def _find_kill_bonus(self) -> None:
+        # Sum in the same order as _score_snapshot, so that totals exactly
+        # equal to an enemy's hits_left still count as kills.
+        self.total_mean_hits = [0.0] * len(self.enemies)
+        for mean_hits in self.mean_hits:
+            for jj, hits in enumerate(mean_hits):
+                self.total_mean_hits[jj] += hits
+        self.kill_bonus = 0.0
+        for jj, enemy in enumerate(self.enemies):
+            if self.total_mean_hits[jj] >= self.snapshot.hits_left(enemy):
+                self.kill_bonus += self.snapshot.sort_values[enemy]
+
+    def move(self, ii: int, hexlabel: str) -> None:
+        """Move the creature with indexes[ii] to hexlabel and update the
+        score."""
+        index = self.indexes[ii]
+        old_hexlabel = self.snapshot.hexlabels[index]
+        if hexlabel == old_hexlabel:
+            return
+        assert old_hexlabel is not None
+        self.snapshot = self.snapshot.move(index, hexlabel)
+        changed = (
+            BattleMap.hexlabel_to_bit[old_hexlabel]
+            | BattleMap.hexlabel_to_bit[hexlabel]
+        )
+        for jj, mask in enumerate(self.masks):
+            if jj == ii or mask & changed:
+                self._rescore(jj)
+        self._find_kill_bonus()
+
+    @property
+    def score(self) -> float:
+        """Return _score_snapshot for the creatures where they are."""
+        kill_score = 0.0
+        if self.kill_bonus:
+            kill_score = self.bot.bp.KILL_MULTIPLIER * self.kill_bonus  # type: ignore
+        score = 0.0
+        for base_score, kill_eligible in zip(
+            self.base_scores, self.kill_eligible
+        ):
+            score += base_score
+            if kill_eligible:
+                score += kill_score
+        return score
+
+
+class StrikePlan(object):
+    """The strikes available to one legion in one strike or counterstrike
+    phase.
+
+    Each striker's targets, with the dice and strike number for each, are
+    found once at the start of the phase, along with the total mean hits
+    the legion could do to each target, in sixths of a hit so that the
+    totals stay exact.  After each strike, strikers that have struck are
+    dropped, and when a target dies the only strikers planned again are
+    those that could strike it or are next to it.
+    """
+
+    def __init__(self, game: Game.Game, legion: Legion.Legion):
+        self.game = game
+        self.legion = legion
+        self.key = self.make_key(game, legion)
+        # Best first, the order in which strikers are considered.
+        self.strikers = [
+            striker
+            for striker in legion.sorted_creatures
+            if striker.can_strike
+        ]
+        # striker: {target: (num_dice, strike_number)}
+        self.striker_options = (
+            {}
+        )  # type: Dict[Creature.Creature, Dict[Creature.Creature, Tuple[int, int]]]
+        # target: [total mean hits in sixths, number of strikers]
+        self.target_totals = {}  # type: Dict[Creature.Creature, List[int]]
+        self.dead_targets = set()  # type: Set[Creature.Creature]
+        for striker in self.strikers:
+            self._plan_striker(striker)
+
+    @staticmethod
+    def make_key(game: Game.Game, legion: Legion.Legion) -> Tuple:
+        """Return a key that changes whenever a new strike plan is needed."""
+        return (
+            game.name,
+            game.turn,
+            game.current_engagement_hexlabel,
+            game.battle_turn,
+            game.battle_phase,
+            legion.markerid,
+        )
+
+    def _plan_striker(self, striker: Creature.Creature) -> None:
+        """Find striker's targets, replacing any already found."""
+        self._drop_striker(striker)
+        if not striker.can_strike:
+            return
+        options = {}  # type: Dict[Creature.Creature, Tuple[int, int]]
+        for hexlabel in striker.find_target_hexlabels():
+            target = self.game.creatures_in_battle_hex(hexlabel).pop()
+            num_dice = striker.number_of_dice(target)
+            strike_number = striker.strike_number(target)
+            options[target] = (num_dice, strike_number)
+            totals = self.target_totals.setdefault(target, [0, 0])
+            totals[0] += num_dice * (7 - strike_number)
+            totals[1] += 1
+        if options:
+            self.striker_options[striker] = options
+
+    def _drop_striker(self, striker: Creature.Creature) -> None:
+        options = self.striker_options.pop(striker, {})
+        for target, (num_dice, strike_number) in options.items():
+            totals = self.target_totals[target]
+            totals[0] -= num_dice * (7 - strike_number)
+            totals[1] -= 1
+            if not totals[1]:
+                del self.target_totals[target]
+
+    def update(self) -> None:
+        """Bring the plan up to date after strikes and carries."""
+        for striker in list(self.striker_options):
+            if striker.struck:
+                self._drop_striker(striker)
+        battlemap = self.game.battlemap
+        assert battlemap is not None
+        for target in list(self.target_totals):
+            if target.dead and target not in self.dead_targets:
+                self.dead_targets.add(target)
+                assert target.hexlabel is not None
+                bit = BattleMap.hexlabel_to_bit[target.hexlabel]
+                for striker in list(self.striker_options):
+                    assert striker.hexlabel is not None
+                    if (
+                        target in self.striker_options[striker]
+                        or battlemap.engagement_masks[striker.hexlabel] & bit
+                    ):
+                        self._plan_striker(striker)
+
+    def choose_strike(
+        self,
+    ) -> Optional[Tuple[Creature.Creature, Creature.Creature, int, int]]:
+        """Return (striker, target, num_dice, strike_number) for the next
+        strike, or None if there are no strikes left.
+
+        Strikers with only one target go first.  Then strike the most
+        valuable target the legion can probably kill, or else the one it
+        can hurt most, with the least valuable striker that can hit it.
+        """
+        for striker in self.strikers:
+            options = self.striker_options.get(striker)
+            if options is not None and len(options) == 1:
+                target, (num_dice, strike_number) = next(iter(options.items()))
+                return striker, target, num_dice, strike_number
+        best_target = None
+        # First find the best target we can kill.
+        for target, (total, unused) in self.target_totals.items():
+            if total >= 6 * target.hits_left:
+                if (
+                    best_target is None
+                    or target.sort_value > best_target.sort_value
+                ):
+                    best_target = target
+        # If we can't kill anything, go after the target we can hurt most.
+        if best_target is None:
+            max_total = 0
+            for target, (total, unused) in self.target_totals.items():
+                if total >= max_total:
+                    best_target = target
+                    max_total = total
+        if best_target is None:
+            return None
+        # Find the least valuable striker who can hit best_target.
+        for striker in reversed(self.strikers):
+            options = self.striker_options.get(striker, {})
+            if best_target in options:
+                num_dice, strike_number = options[best_target]
+                return striker, best_target, num_dice, strike_number
+        return None
+
+
+class ThreatMap(object):
+    """Which enemy legions could reach each masterboard hex next turn, and
+    with how many of the six possible rolls, for one player's turn.
+
+    For each enemy legion, one breadth-first search finds the fewest steps
+    along which it could reach each hex, stopping at hexes that hold other
+    players' legions.  A legion of ours that moved to a hex reached in k
+    steps could be attacked there with any roll of k or more, so the
+    searches work for every candidate move.  They are redone only when a
+    legion moves into or out of a hex that they visited.  A legion that
+    can titan teleport reaches every hex of ours with every roll.
+
+    This matches moving the legion and calling Game.find_normal_moves and
+    Game.find_titan_teleport_moves for each enemy and roll, except that an
+    enemy legion is not counted as a threat to its own hex.
+    """
+
+    def __init__(self, game: Game.Game, player: Player.Player):
+        self.game = game
+        self.player = player
+        self.key = self.make_key(game, player)
+        # markerid: hexlabel, for every legion when the searches were done
+        self.positions = {}  # type: Dict[str, int]
+        # hexlabel: legions there
+        self.hexlabel_to_legions = {}  # type: Dict[int, List[Legion.Legion]]
+        # (enemy markerid, markerid of our legion that has left its hex, or
+        # None): ({hexlabel: fewest steps}, hexlabels visited, hexlabels
+        # where the search stopped)
+        self.searches = (
+            {}
+        )  # type: Dict[Tuple[str, Optional[str]], Tuple[Dict[int, int], Set[int], Set[int]]]
+        self.update()
+
+    @staticmethod
+    def make_key(game: Game.Game, player: Player.Player) -> Tuple:
+        """Return a key that changes whenever a new threat map is needed."""
+        return (game.name, game.turn, player.name)
+
+    def update(self) -> None:
+        """Forget the searches that legion moves since the last update
+        could have changed."""
+        positions = {}  # type: Dict[str, int]
+        hexlabel_to_legions = {}  # type: Dict[int, List[Legion.Legion]]
+        for legion in self.game.all_legions():
+            positions[legion.markerid] = legion.hexlabel
+            hexlabel_to_legions.setdefault(legion.hexlabel, []).append(legion)
+        changed = set()  # type: Set[int]
+        for markerid in set(positions) | set(self.positions):
+            hexlabel = positions.get(markerid)
+            previous_hexlabel = self.positions.get(markerid)
+            if hexlabel != previous_hexlabel:
+                for hexlabel2 in [hexlabel, previous_hexlabel]:
+                    if hexlabel2 is not None:
+                        changed.add(hexlabel2)
+        if changed:
+            for key, (unused, visited, unused2) in list(self.searches.items()):
+                if (
+                    positions.get(key[0]) != self.positions.get(key[0])
+                    or visited & changed
+                ):
+                    del self.searches[key]
+        self.positions = positions
+        self.hexlabel_to_legions = hexlabel_to_legions
+
+    def _search(
+        self, enemy: Legion.Legion, mover: Optional[Legion.Legion]
+    ) -> Tuple[Dict[int, int], Set[int], Set[int]]:
+        """Return ({hexlabel: fewest steps}, hexlabels visited, hexlabels
+        where the search stopped) for enemy's normal moves, as if mover were
+        not on the board."""
+        key = (enemy.markerid, mover.markerid if mover else None)
+        result = self.searches.get(key)
+        if result is not None:
+            return result
+        enemy_player = enemy.player
+        hexes = self.game.board.hexes
+        start = hexes[enemy.hexlabel]
+        block = start.find_block()
+        if block is None:
+            block = Game.ARCHES_AND_ARROWS
+        steps = {}  # type: Dict[int, int]
+        visited = {start.label}
+        stopped = set()  # type: Set[int]
+        # Each (hexlabel, came_from) is expanded once, with the fewest
+        # steps, because moves from it don't depend on how it was reached.
+        seen = set()  # type: Set[Tuple[int, Optional[int]]]
+        queue = collections.deque(
+            [(start, 0, block, None)]
+        )  # type: Deque[Tuple[Any, int, int, Optional[int]]]
+        while queue:
+            masterhex, num_steps, block, came_from = queue.popleft()
+            hexlabel = masterhex.label
+            if num_steps:
+                visited.add(hexlabel)
+                steps.setdefault(hexlabel, num_steps)
+            # Movement ends in any hex with a legion of another player, even
+            # the starting hex.  (It is a legal move only if there is no
+            # friendly legion there, but threats() ignores those hexes.)
+            if any(
+                legion.player is not enemy_player and legion is not mover
+                for legion in self.hexlabel_to_legions.get(hexlabel, [])
+            ):
+                stopped.add(hexlabel)
+                continue
+            if num_steps == 6:
+                continue
+            if block >= 0:
+                directions = [block]
+            elif block == Game.ARCHES_AND_ARROWS:
+                directions = [
+                    direction
+                    for direction, gate in enumerate(masterhex.exits)
+                    if gate in ("ARCH", "ARROW", "ARROWS")
+                    and direction != came_from
+                ]
+            else:
+                directions = [
+                    direction
+                    for direction, gate in enumerate(masterhex.exits)
+                    if gate in ("ARROW", "ARROWS") and direction != came_from
+                ]
+            for direction in directions:
+                neighbor = masterhex.get_neighbor(direction)
+                came_from2 = Game.opposite(direction)
+                if (neighbor.label, came_from2) not in seen:
+                    seen.add((neighbor.label, came_from2))
+                    queue.append(
+                        (
+                            neighbor,
+                            num_steps + 1,
+                            Game.ARROWS_ONLY,
+                            came_from2,
+                        )
+                    )
+        result = (steps, visited, stopped)
+        self.searches[key] = result
+        return result
+
+    def threats(
+        self, legion: Legion.Legion, hexlabel: int
+    ) -> List[Tuple[Legion.Legion, int]]:
+        """Return a list of (enemy legion, number of rolls) for each enemy
+        legion that could attack legion next turn if it were in hexlabel,
+        with the number of rolls from 1 to 6 with which it could."""
+        result = []
+        for enemy in self.player.enemy_legions():
+            enemy_player = enemy.player
+            if any(
+                legion2.player is enemy_player
+                for legion2 in self.hexlabel_to_legions.get(hexlabel, [])
+            ):
+                continue
+            if (
+                enemy_player.can_titan_teleport
+                and "Titan" in enemy.creature_names
+            ):
+                result.append((enemy, 6))
+                continue
+            steps, unused, stopped = self._search(enemy, None)
+            if legion.hexlabel in stopped and legion.hexlabel != hexlabel:
+                # Leaving its hex could open a path through it.
+                steps = self._search(enemy, legion)[0]
+            num_steps = steps.get(hexlabel)
+            if num_steps is not None:
+                result.append((enemy, 7 - num_steps))
+        return result
+
+
+class MoveScoreCache(object):
+    """CleverBot._score_move results for one player's movement phase.
+
+    move_legions moves one legion at a time, and is called again after
+    each move to score every remaining move.  Only this player's legions
+    move during the phase, so everything about a move except the chance of
+    being attacked next turn is scored once and kept.  That chance comes
+    from the ThreatMap, whose searches are redone only for enemy legions
+    whose paths ran through the hexes that a legion left or entered.
+    """
+
+    def __init__(self, bot: CleverBot, player: Player.Player):
+        self.bot = bot
+        self.player = player
+        self.key = self.make_key(player.game, player)
+        # (markerid, hexlabel, moved): score without threats
+        self.static_scores = {}  # type: Dict[Tuple[str, int, bool], float]
+        # (markerid, enemy markerid): score lost per roll
+        self.threat_weights = {}  # type: Dict[Tuple[str, str], float]
+
+    @staticmethod
+    def make_key(game: Game.Game, player: Player.Player) -> Tuple:
+        """Return a key that changes whenever a new cache is needed."""
+        return (game.name, game.turn, player.name)
+
+    def score(
+        self, legion: Legion.Legion, hexlabel: int, moved: bool
+    ) -> float:
+        """Return CleverBot._score_move(legion, hexlabel, moved)."""
+        bot = self.bot
+        key = (legion.markerid, hexlabel, moved)
+        score = self.static_scores.get(key)
+        if score is None:
+            score = self.static_scores[key] = bot._score_move_static(
+                legion, hexlabel, moved
+            )
+        if self.player.game.turn > 1:
+            threat_map = bot._get_threat_map(self.player)
+            for enemy, num_rolls in threat_map.threats(legion, hexlabel):
+                key2 = (legion.markerid, enemy.markerid)
+                weight = self.threat_weights.get(key2)
+                if weight is None:
+                    weight = self.threat_weights[key2] = bot._threat_weight(
+                        legion, enemy
+                    )
+                score -= weight * num_rolls
+        return score
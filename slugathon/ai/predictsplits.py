@@ -4,7 +4,7 @@ import copy
 import itertools
 from typing import List, Optional, Tuple
 
-from slugathon.game.Creature import Creature
+from slugathon.game.Creature import Creature, name_to_creature_type
 
 __copyright__ = "Copyright (c) 2003-2021 David Ripton"
 __license__ = "GNU GPL v2"
@@ -92,6 +92,8 @@ class CreatureInfo(Creature):
 
     """A Creature with some extra attributes for split prediction."""
 
+    __slots__ = ("certain", "at_split")
+
     def __init__(self, name: str, certain: bool, at_split: bool):
         Creature.__init__(self, name)
         self.certain = certain
@@ -387,8 +389,7 @@ class Node(object):
         for li in possible_splits:
             total_sort_value = 0.0
             for name in li:
-                creature = Creature(name)
-                total_sort_value += creature.sort_value
+                total_sort_value += name_to_creature_type[name].sort_value
             if (
                 (best_sort_value is None)
                 or (maximize and total_sort_value > best_sort_value)
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Dict, Optional, Set
 
-from slugathon.game import BattleMap
+from slugathon.game import BattleMap, Creature
 
 __copyright__ = "Copyright (c) 2005-2021 David Ripton"
 __license__ = "GNU GPL v2"
@@ -44,6 +44,12 @@ class BattleHex(object):
         self.borders = []
         for ii in range(6):
             self.borders.append(borderdict.get(ii))
+        # Creature.hazard_to_bit bits, for fast nativity checks
+        self.terrain_bit = Creature.hazard_to_bit.get(terrain, 0)
+        self.border_bits = [
+            Creature.hazard_to_bit.get(border, 0) if border else 0
+            for border in self.borders
+        ]
         self.down = self.x & 1 == 1
         self.label_side = 5
         self.terrain_side = 3
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 from sys import maxsize
-from typing import Dict, Optional, Set, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from slugathon.data import battlemapdata
 from slugathon.game import BattleHex, Game
@@ -45,6 +45,11 @@ all_labels = frozenset(
     ]
 )
 
+# hexlabel: a distinct bit, for building bitmasks of hexes
+hexlabel_to_bit = {
+    label: 1 << ii for ii, label in enumerate(sorted(all_labels))
+}
+
 
 def label_to_coords(
     label: str, entry_side: int, down: bool = False
@@ -225,6 +230,87 @@ def is_obstacle(border: str) -> bool:
     return bool(border)
 
 
+def _compute_ranges(
+    battlemap: BattleMap,
+) -> Tuple[Dict[Tuple[str, str], int], Dict[Tuple[str, str], int]]:
+    """Return a tuple of two dicts of (hexlabel1, hexlabel2): range for every
+    pair of hexes on battlemap.
+
+    The first dict follows the rules of BattleMap.range, and the second
+    the rules of BattleMap.range with allow_entrance.
+
+    Range only depends on hex positions, not on terrain, so all maps with
+    the same entry side can share these dicts.
+    """
+    ranges = {}  # type: Dict[Tuple[str, str], int]
+    entrance_ranges = {}  # type: Dict[Tuple[str, str], int]
+    for hex1 in battlemap.hexes.values():
+        # Breadth-first search outward from hex1.
+        hexlabel_to_range = {hex1.label: 1}
+        prev = [hex1]
+        result = 1
+        while prev:
+            result += 1
+            neighbors = []  # type: List[BattleHex.BattleHex]
+            for hex3 in prev:
+                for hex4 in hex3.neighbors.values():
+                    if hex4.label not in hexlabel_to_range:
+                        hexlabel_to_range[hex4.label] = result
+                        neighbors.append(hex4)
+            prev = neighbors
+        for hex2 in battlemap.hexes.values():
+            key = (hex1.label, hex2.label)
+            if hex1 is hex2:
+                ranges[key] = entrance_ranges[key] = 1
+            elif hex1.entrance:
+                ranges[key] = maxsize
+                if hex2.entrance:
+                    entrance_ranges[key] = maxsize
+                else:
+                    # We need to start from the entrance.
+                    distance = hexlabel_to_range[hex2.label]
+                    entrance_ranges[key] = distance
+                    entrance_ranges[(hex2.label, hex1.label)] = distance
+            elif hex2.entrance:
+                ranges[key] = maxsize
+            else:
+                distance = hexlabel_to_range[hex2.label]
+                ranges[key] = entrance_ranges[key] = distance
+    return ranges, entrance_ranges
+
+
+# XXX Hardcoded to default Tower map
+def _compute_walls(battlemap: BattleMap) -> Dict[Tuple[str, str], int]:
+    """Return a dict of (hexlabel1, hexlabel2): number of uphill wall
+    hazards between them, for all pairs of hexes on battlemap that have
+    any."""
+    walls = {}  # type: Dict[Tuple[str, str], int]
+    if battlemap.mterrain == "Tower":
+        for hex1 in battlemap.hexes.values():
+            for hex2 in battlemap.hexes.values():
+                if hex2.elevation > hex1.elevation:
+                    walls[(hex1.label, hex2.label)] = (
+                        hex2.elevation - hex1.elevation
+                    )
+    return walls
+
+
+# entry_side: (ranges, entrance_ranges), filled in as BattleMaps are created
+_entry_side_to_ranges = {}  # type: Dict[int, Tuple[Dict, Dict]]
+
+# (mterrain, entry_side): {(hexlabel1, hexlabel2): los_dirs}, filled in
+# lazily.  See BattleMap._find_los_dirs
+_map_to_los = {}  # type: Dict[Tuple[str, int], Dict]
+
+# (mterrain, entry_side): {(hexlabel1, hexlabel2): bramble_counts}, filled in
+# lazily.  See BattleMap._find_bramble_counts
+_map_to_brambles = {}  # type: Dict[Tuple[str, int], Dict]
+
+# (mterrain, entry_side): {(hexlabel1, hexlabel2): walls}, filled in as
+# BattleMaps are created.  See _compute_walls
+_map_to_walls = {}  # type: Dict[Tuple[str, int], Dict[Tuple[str, str], int]]
+
+
 class BattleMap(object):
 
     """A logical battle map.  No GUI code.
@@ -254,7 +340,34 @@ class BattleMap(object):
                 )
         for hex1 in self.hexes.values():
             hex1.init_neighbors()
+        # hexlabel: bitmask of neighboring hexes, and the same minus
+        # neighbors across a cliff hexside, which cannot engage.
+        self.neighbor_masks = {}  # type: Dict[str, int]
+        self.engagement_masks = {}  # type: Dict[str, int]
+        for hex1 in self.hexes.values():
+            neighbor_mask = 0
+            engagement_mask = 0
+            for hexside, hex2 in hex1.neighbors.items():
+                bit = hexlabel_to_bit[hex2.label]
+                neighbor_mask |= bit
+                if (
+                    hex1.borders[hexside] != "Cliff"
+                    and hex2.borders[(hexside + 3) % 6] != "Cliff"
+                ):
+                    engagement_mask |= bit
+            self.neighbor_masks[hex1.label] = neighbor_mask
+            self.engagement_masks[hex1.label] = engagement_mask
         self.startlist = battlemapdata.startlist.get(mterrain)
+        if entry_side not in _entry_side_to_ranges:
+            _entry_side_to_ranges[entry_side] = _compute_ranges(self)
+        self._ranges, self._entrance_ranges = _entry_side_to_ranges[entry_side]
+        self._los = _map_to_los.setdefault((mterrain, entry_side), {})
+        self._brambles = _map_to_brambles.setdefault(
+            (mterrain, entry_side), {}
+        )
+        if (mterrain, entry_side) not in _map_to_walls:
+            _map_to_walls[(mterrain, entry_side)] = _compute_walls(self)
+        self._walls = _map_to_walls[(mterrain, entry_side)]
 
     @property
     def hex_width(self) -> int:
@@ -289,35 +402,18 @@ class BattleMap(object):
         If either hex is an entrance, return a huge number, unless
         allow_entrance is True, in which case return the normal range.
         """
-        if hexlabel1 not in self.hexes or hexlabel2 not in self.hexes:
+        if allow_entrance:
+            ranges = self._entrance_ranges
+        else:
+            ranges = self._ranges
+        result = ranges.get((hexlabel1, hexlabel2))
+        if result is None:
             logging.info(
                 f"BattleMap.range invalid hexlabel {hexlabel1} {hexlabel2} "
                 f"{allow_entrance}"
             )
             return maxsize
-        if hexlabel1 == hexlabel2:
-            return 1
-        hex1 = self.hexes[hexlabel1]
-        hex2 = self.hexes[hexlabel2]
-        if hex1.entrance or hex2.entrance:
-            if not allow_entrance or (hex1.entrance and hex2.entrance):
-                return maxsize
-            elif hex2.entrance:
-                # We need to start from the entrance.
-                hex1, hex2 = hex2, hex1
-        result = 2
-        prev = {hex1}
-        ignore = set()  # type: Set[BattleHex.BattleHex]
-        while True:
-            neighbors = set()  # type: Set[BattleHex.BattleHex]
-            for hex3 in prev:
-                neighbors.update(iter(hex3.neighbors.values()))
-            if hex2 in neighbors:
-                return result
-            neighbors -= ignore
-            result += 1
-            ignore = prev
-            prev = neighbors
+        return result
 
     def _to_left(self, delta_x: float, delta_y: float) -> bool:
         """Return True iff the path of displacement (delta_x, delta_y)
@@ -423,11 +519,14 @@ class BattleMap(object):
         mid_chit: bool = False,
         total_obstacles: int = 0,
         total_walls: int = 0,
-        game: Optional[Game.Game] = None,
+        occupied: int = 0,
     ) -> bool:
         """Return True iff the line of sight from hexlabel1 to
         hexlabel2 is blocked by terrain or creatures, going to the left of
         hexspines if left is True.
+
+        occupied is a bitmask (see hexlabel_to_bit) of the hexes that
+        contain creatures.
         """
         target_atop = False
         target_atop_cliff = False
@@ -525,8 +624,7 @@ class BattleMap(object):
         # elevation than the creature, or unless the creature is at
         # the base of a cliff and the striker or target is atop it.
         if (
-            game is not None
-            and game.is_battle_hex_occupied(next_hex.label)
+            occupied & hexlabel_to_bit[next_hex.label]
             and next_hex.elevation >= strike_elevation
             and (not striker_atop_cliff or current_hex != initial_hex)
         ):
@@ -545,9 +643,100 @@ class BattleMap(object):
             mid_chit=mid_chit,
             total_obstacles=total_obstacles,
             total_walls=total_walls,
-            game=game,
+            occupied=occupied,
         )
 
+    def _los_path(
+        self, hex1: BattleHex.BattleHex, hex2: BattleHex.BattleHex, left: bool
+    ) -> List[BattleHex.BattleHex]:
+        """Return a list of the hexes that the line of sight from hex1 to
+        hex2 passes through, not including hex1 and hex2, going to the left
+        of hexspines if left is True."""
+        path = []  # type: List[BattleHex.BattleHex]
+        current_hex = hex1
+        while True:
+            direction = self._get_direction(current_hex, hex2, left)
+            next_hex = current_hex.neighbors.get(direction)
+            assert next_hex is not None
+            if next_hex == hex2:
+                return path
+            path.append(next_hex)
+            current_hex = next_hex
+
+    def _compute_los_dir(
+        self, hex1: BattleHex.BattleHex, hex2: BattleHex.BattleHex, left: bool
+    ) -> Tuple[bool, int]:
+        """Return a tuple of (blocked, blockers) for the line of sight from
+        hex1 to hex2, going to the left of hexspines if left is True.
+
+        blocked is True iff the terrain alone blocks the line of sight.
+        blockers is a bitmask of the hexes that would block the line of
+        sight if they contained a creature.
+
+        A creature in any one of these hexes is enough to block, and
+        creatures elsewhere never block, so we can find blockers by
+        trying one occupied hex at a time.
+        """
+        strike_elevation = min(hex1.elevation, hex2.elevation)
+        if self._is_los_blocked_dir(
+            initial_hex=hex1,
+            current_hex=hex1,
+            final_hex=hex2,
+            left=left,
+            strike_elevation=strike_elevation,
+        ):
+            return (True, 0)
+        blockers = 0
+        for hex3 in self._los_path(hex1, hex2, left):
+            bit = hexlabel_to_bit[hex3.label]
+            if self._is_los_blocked_dir(
+                initial_hex=hex1,
+                current_hex=hex1,
+                final_hex=hex2,
+                left=left,
+                strike_elevation=strike_elevation,
+                occupied=bit,
+            ):
+                blockers |= bit
+        return (False, blockers)
+
+    def _find_los_dirs(
+        self, hexlabel1: str, hexlabel2: str
+    ) -> Tuple[Tuple[bool, int], ...]:
+        """Return a tuple of (blocked, blockers) tuples, as returned by
+        _compute_los_dir, for each possible line of sight from hexlabel1 to
+        hexlabel2.
+
+        There are two possible lines of sight along a hexspine, and the
+        line of sight is clear if either of them is clear.  Otherwise there
+        is only one.
+
+        Results only depend on terrain, so they are computed once and then
+        shared by all BattleMaps with the same terrain and entry side.
+        """
+        key = (hexlabel1, hexlabel2)
+        los_dirs = self._los.get(key)
+        if los_dirs is None:
+            x1, y1 = label_to_coords(hexlabel1, self.entry_side, True)
+            x2, y2 = label_to_coords(hexlabel2, self.entry_side, True)
+            delta_x = x2 - x1
+            delta_y = y2 - y1
+            hex1 = self.hexes[hexlabel1]
+            hex2 = self.hexes[hexlabel2]
+            if close(delta_y, 0) or close(abs(delta_y), 1.5 * abs(delta_x)):
+                los_dirs = (
+                    self._compute_los_dir(hex1, hex2, True),
+                    self._compute_los_dir(hex1, hex2, False),
+                )
+            else:
+                los_dirs = (
+                    self._compute_los_dir(
+                        hex1, hex2, self._to_left(delta_x, delta_y)
+                    ),
+                )
+            self._los[key] = los_dirs
+        return los_dirs
+
     def is_los_blocked(
         self, hexlabel1: str, hexlabel2: str, game: Optional[Game.Game]
     ) -> bool:
@@ -559,38 +748,52 @@ class BattleMap(object):
         assert hexlabel1 in self.hexes and hexlabel2 in self.hexes
         if hexlabel1 == hexlabel2:
             return False
-        x1, y1 = label_to_coords(hexlabel1, self.entry_side, True)
-        x2, y2 = label_to_coords(hexlabel2, self.entry_side, True)
-        delta_x = x2 - x1
-        delta_y = y2 - y1
-        hex1 = self.hexes[hexlabel1]
-        hex2 = self.hexes[hexlabel2]
-        strike_elevation = min(hex1.elevation, hex2.elevation)
-        if close(delta_y, 0) or close(abs(delta_y), 1.5 * abs(delta_x)):
-            return self._is_los_blocked_dir(
-                initial_hex=hex1,
-                current_hex=hex1,
-                final_hex=hex2,
-                left=True,
-                strike_elevation=strike_elevation,
-                game=game,
-            ) and self._is_los_blocked_dir(
-                initial_hex=hex1,
-                current_hex=hex1,
-                final_hex=hex2,
-                left=False,
-                strike_elevation=strike_elevation,
-                game=game,
-            )
-        else:
-            return self._is_los_blocked_dir(
-                initial_hex=hex1,
-                current_hex=hex1,
-                final_hex=hex2,
-                left=self._to_left(delta_x, delta_y),
-                strike_elevation=strike_elevation,
-                game=game,
-            )
+        occupied = None  # type: Optional[int]
+        for blocked, blockers in self._find_los_dirs(hexlabel1, hexlabel2):
+            if blocked:
+                continue
+            if blockers and game is not None:
+                if occupied is None:
+                    occupied = game.occupied_battle_hex_mask()
+                if blockers & occupied:
+                    continue
+            return False
+        return True
+
+    def is_los_blocked_by(
+        self, hexlabel1: str, hexlabel2: str, occupied: int
+    ) -> bool:
+        """Return True iff the line of sight from hexlabel1 to
+        hexlabel2 is blocked by terrain or by creatures in the hexes in
+        the bitmask occupied.
+
+        See hexlabel_to_bit.
+        """
+        assert hexlabel1 in self.hexes and hexlabel2 in self.hexes
+        if hexlabel1 == hexlabel2:
+            return False
+        for blocked, blockers in self._find_los_dirs(hexlabel1, hexlabel2):
+            if not blocked and not blockers & occupied:
+                return False
+        return True
+
+    def los_blockers(self, hexlabel1: str, hexlabel2: str) -> int:
+        """Return a bitmask of the hexes where a creature could change the
+        line of sight from hexlabel1 to hexlabel2, either by blocking it or
+        by changing which side of a hexspine it passes.
+
+        See hexlabel_to_bit.
+        """
+        if (
+            hexlabel1 == hexlabel2
+            or self.hexes[hexlabel1].entrance
+            or self.hexes[hexlabel2].entrance
+        ):
+            return 0
+        mask = 0
+        for blocked, blockers in self._find_los_dirs(hexlabel1, hexlabel2):
+            mask |= blockers
+        return mask
 
     def _count_bramble_hexes_dir(
         self,
@@ -615,6 +818,41 @@ class BattleMap(object):
             count += 1
         return self._count_bramble_hexes_dir(next_hex, hex2, left, count)
 
+    def _find_bramble_counts(
+        self, hexlabel1: str, hexlabel2: str
+    ) -> Tuple[int, ...]:
+        """Return a tuple of the number of intervening bramble hexes between
+        hexlabel1 and hexlabel2, for each possible line of sight.
+
+        Along a hexspine, the tuple is (left count, right count).  Otherwise
+        it has just one element.
+
+        Results only depend on terrain, so they are computed once and then
+        shared by all BattleMaps with the same terrain and entry side.
+        """
+        key = (hexlabel1, hexlabel2)
+        counts = self._brambles.get(key)
+        if counts is None:
+            hex1 = self.hexes[hexlabel1]
+            hex2 = self.hexes[hexlabel2]
+            x1, y1 = label_to_coords(hexlabel1, self.entry_side, True)
+            x2, y2 = label_to_coords(hexlabel2, self.entry_side, True)
+            delta_x = x2 - x1
+            delta_y = y2 - y1
+            if close(delta_y, 0) or close(delta_y, 1.5 * abs(delta_x)):
+                counts = (
+                    self._count_bramble_hexes_dir(hex1, hex2, True, 0),
+                    self._count_bramble_hexes_dir(hex1, hex2, False, 0),
+                )
+            else:
+                counts = (
+                    self._count_bramble_hexes_dir(
+                        hex1, hex2, self._to_left(delta_x, delta_y), 0
+                    ),
+                )
+            self._brambles[key] = counts
+        return counts
+
     def count_bramble_hexes(
         self, hexlabel1: str, hexlabel2: str, game: Optional[Game.Game]
     ) -> int:
@@ -623,72 +861,59 @@ class BattleMap(object):
 
         game is optional, but needed to check creatures.
         """
+        if game is None:
+            occupied = 0
+        else:
+            occupied = game.occupied_battle_hex_mask()
+        return self.count_bramble_hexes_by(hexlabel1, hexlabel2, occupied)
+
+    def count_bramble_hexes_by(
+        self, hexlabel1: str, hexlabel2: str, occupied: int
+    ) -> int:
+        """Return the minimum number of intervening bramble hexes along a valid
+        line of sight between hexlabel1 and hexlabel2, with creatures in the
+        hexes in the bitmask occupied.
+
+        See hexlabel_to_bit.
+        """
         if hexlabel1 == hexlabel2:
             logging.info(
                 f"count_bramble_hexes hexlabel1 == hexlabel2 == {hexlabel1}"
             )
             return 0
-        if self.is_los_blocked(hexlabel1, hexlabel2, game):
+        if self.is_los_blocked_by(hexlabel1, hexlabel2, occupied):
             logging.info(
                 f"count_bramble_hexes {hexlabel1} {hexlabel2} los blocked"
             )
             return 0
-        hex1 = self.hexes[hexlabel1]
-        hex2 = self.hexes[hexlabel2]
-        if hex1.entrance or hex2.entrance:
+        if self.hexes[hexlabel1].entrance or self.hexes[hexlabel2].entrance:
             logging.info("count_bramble_hexes entrance hex")
             return 0
-        x1, y1 = label_to_coords(hexlabel1, self.entry_side, True)
-        x2, y2 = label_to_coords(hexlabel2, self.entry_side, True)
-        delta_x = x2 - x1
-        delta_y = y2 - y1
-
-        if close(delta_y, 0) or close(delta_y, 1.5 * abs(delta_x)):
-            strike_elevation = min(hex1.elevation, hex2.elevation)
-            # Hexspine try unblocked side(s).
-            if self._is_los_blocked_dir(
-                initial_hex=hex1,
-                current_hex=hex1,
-                final_hex=hex2,
-                left=True,
-                strike_elevation=strike_elevation,
-                striker_atop=False,
-                striker_atop_cliff=False,
-                striker_atop_wall=False,
-                mid_obstacle=False,
-                mid_cliff=False,
-                mid_chit=False,
-                total_obstacles=0,
-                total_walls=0,
-                game=game,
-            ):
-                return self._count_bramble_hexes_dir(hex1, hex2, False, 0)
-            elif self._is_los_blocked_dir(
-                initial_hex=hex1,
-                current_hex=hex1,
-                final_hex=hex2,
-                left=False,
-                strike_elevation=strike_elevation,
-                striker_atop=False,
-                striker_atop_cliff=False,
-                striker_atop_wall=False,
-                mid_obstacle=False,
-                mid_cliff=False,
-                mid_chit=False,
-                total_obstacles=0,
-                total_walls=0,
-                game=game,
-            ):
-                return self._count_bramble_hexes_dir(hex1, hex2, True, 0)
-            else:
-                return min(
-                    self._count_bramble_hexes_dir(hex1, hex2, True, 0),
-                    self._count_bramble_hexes_dir(hex1, hex2, False, 0),
-                )
+        counts = self._find_bramble_counts(hexlabel1, hexlabel2)
+        if len(counts) == 1 or counts[0] == counts[1]:
+            return counts[0]
+        # Hexspine try unblocked side(s).
+        left_dir, right_dir = self._find_los_dirs(hexlabel1, hexlabel2)
+        left_blocked, left_blockers = left_dir
+        right_blocked, right_blockers = right_dir
+        if left_blocked or left_blockers & occupied:
+            return counts[1]
+        elif right_blocked or right_blockers & occupied:
+            return counts[0]
         else:
-            return self._count_bramble_hexes_dir(
-                hex1, hex2, self._to_left(delta_x, delta_y), 0
-            )
+            return min(counts)
+
+    def max_bramble_hexes(self, hexlabel1: str, hexlabel2: str) -> int:
+        """Return the most intervening bramble hexes that
+        count_bramble_hexes_by could find between hexlabel1 and hexlabel2,
+        whichever hexes were occupied."""
+        if (
+            hexlabel1 == hexlabel2
+            or self.hexes[hexlabel1].entrance
+            or self.hexes[hexlabel2].entrance
+        ):
+            return 0
+        return max(self._find_bramble_counts(hexlabel1, hexlabel2))
 
     # XXX Hardcoded to default Tower map
     def count_walls(
@@ -699,8 +924,22 @@ class BattleMap(object):
 
         game is optional, but needed to check creatures.
         """
-        if self.mterrain != "Tower":
-            return 0
-        hex1 = self.hexes[hexlabel1]
-        hex2 = self.hexes[hexlabel2]
-        return max(hex2.elevation - hex1.elevation, 0)
+        return self._walls.get((hexlabel1, hexlabel2), 0)
+
+
+# (mterrain, entry_side): BattleMap
+_map_to_battlemap = {}  # type: Dict[Tuple[str, int], BattleMap]
+
+
+def get_battlemap(mterrain: str, entry_side: int) -> BattleMap:
+    """Return the shared BattleMap for mterrain and entry_side, building it
+    the first time.
+
+    BattleMaps are never modified after construction, so every battle on
+    the same terrain and side can use one instance.
+    """
+    battlemap = _map_to_battlemap.get((mterrain, entry_side))
+    if battlemap is None:
+        battlemap = BattleMap(mterrain, entry_side)
+        _map_to_battlemap[(mterrain, entry_side)] = battlemap
+    return battlemap
@@ -0,0 +1,443 @@
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from slugathon.game import BattleMap, Creature, Game, Legion, Phase
+
+__copyright__ = "Copyright (c) 2021 David Ripton"
+__license__ = "GNU GPL v2"
+
+
+"""An immutable snapshot of a battle, for AI search."""
+
+
+class BattleSnapshot(object):
+    """An immutable copy of the changeable parts of a battle.
+
+    Creatures are referred to by their index in creatures, which holds the
+    attacker's creatures followed by the defender's.  Each snapshot has its
+    own hexlabels, hits, and moved flags, and answers the same questions as
+    Creature and Game (engaged enemies, rangestrike targets, dice, strike
+    numbers, battle moves) from them, so that AI search never needs to
+    touch the live Creatures.
+
+    Changing a creature returns a new snapshot that shares everything else
+    with this one.  Snapshots never change, so their answers are cached.
+
+    Snapshots pickle compactly, without the Game or the live Creatures, so
+    that they can be sent to other processes.  An unpickled snapshot has
+    no game, so it can't find battle moves.
+    """
+
+    def __init__(self, game: Game.Game):
+        attacker = game.attacker_legion
+        defender = game.defender_legion
+        assert attacker is not None and defender is not None
+        assert game.battlemap is not None
+        self.game = game  # type: Optional[Game.Game]
+        self.battlemap = game.battlemap
+        self.battle_turn = game.battle_turn
+        self.battle_phase = game.battle_phase
+        self.creatures = tuple(
+            attacker.creatures + defender.creatures
+        )  # type: Tuple[Creature.Creature, ...]
+        self.num_attackers = len(attacker.creatures)
+        # Titans' power depends on their player's score, so keep it here.
+        self.powers = tuple(
+            creature.power for creature in self.creatures
+        )  # type: Tuple[int, ...]
+        self.sort_values = tuple(
+            creature.sort_value for creature in self.creatures
+        )  # type: Tuple[float, ...]
+        self.hexlabels = tuple(
+            creature.hexlabel for creature in self.creatures
+        )  # type: Tuple[Optional[str], ...]
+        self.hits = tuple(
+            creature.hits for creature in self.creatures
+        )  # type: Tuple[int, ...]
+        self.moved = tuple(
+            creature.moved for creature in self.creatures
+        )  # type: Tuple[bool, ...]
+        self._cache = {}  # type: Dict[Any, Any]
+
+    @classmethod
+    def new_battle(
+        cls, game: Game.Game, attacker: Legion.Legion, defender: Legion.Legion
+    ) -> BattleSnapshot:
+        """Return a snapshot of the start of a battle between attacker and
+        defender, which are engaged but have not started fighting."""
+        assert attacker.hexlabel == defender.hexlabel
+        assert attacker.entry_side is not None
+        masterhex = game.board.hexes[attacker.hexlabel]
+        snapshot = cls.__new__(cls)
+        snapshot.game = game
+        snapshot.battlemap = BattleMap.get_battlemap(
+            masterhex.terrain, attacker.entry_side
+        )
+        snapshot.battle_turn = 1
+        snapshot.battle_phase = Phase.MANEUVER
+        snapshot.creatures = tuple(attacker.creatures + defender.creatures)
+        snapshot.num_attackers = len(attacker.creatures)
+        snapshot.powers = tuple(
+            creature.power for creature in snapshot.creatures
+        )
+        snapshot.sort_values = tuple(
+            creature.sort_value for creature in snapshot.creatures
+        )
+        snapshot.hexlabels = tuple(
+            ["ATTACKER"] * len(attacker.creatures)
+            + ["DEFENDER"] * len(defender.creatures)
+        )
+        snapshot.hits = (0,) * len(snapshot.creatures)
+        snapshot.moved = (False,) * len(snapshot.creatures)
+        snapshot._cache = {}
+        return snapshot
+
+    def __copy__(self) -> BattleSnapshot:
+        # Shallow, sharing the game and creatures, unlike pickling.
+        snapshot = BattleSnapshot.__new__(BattleSnapshot)
+        snapshot.__dict__.update(self.__dict__)
+        return snapshot
+
+    def __getstate__(self) -> Tuple:
+        return (
+            tuple(creature.name for creature in self.creatures),
+            self.num_attackers,
+            self.powers,
+            self.sort_values,
+            self.hexlabels,
+            self.hits,
+            self.moved,
+            self.battlemap.mterrain,
+            self.battlemap.entry_side,
+            self.battle_turn,
+            self.battle_phase,
+        )
+
+    def __setstate__(self, state: Tuple) -> None:
+        (
+            names,
+            self.num_attackers,
+            self.powers,
+            self.sort_values,
+            self.hexlabels,
+            self.hits,
+            self.moved,
+            mterrain,
+            entry_side,
+            self.battle_turn,
+            self.battle_phase,
+        ) = state
+        self.game = None
+        self.battlemap = BattleMap.get_battlemap(mterrain, entry_side)
+        self.creatures = tuple(Creature.Creature(name) for name in names)
+        self._cache = {}
+
+    def __repr__(self) -> str:
+        return f"BattleSnapshot {list(zip(self.creatures, self.hexlabels))}"
+
+    def _replace(self, **kwargs: Any) -> BattleSnapshot:
+        """Return a copy of this snapshot with some attributes replaced."""
+        snapshot = copy.copy(self)
+        for name, value in kwargs.items():
+            setattr(snapshot, name, value)
+        snapshot._cache = {}
+        return snapshot
+
+    def move(self, index: int, hexlabel: str) -> BattleSnapshot:
+        """Return a new snapshot with creature index moved to hexlabel."""
+        hexlabels = list(self.hexlabels)
+        hexlabels[index] = hexlabel
+        moved = list(self.moved)
+        moved[index] = True
+        return self._replace(hexlabels=tuple(hexlabels), moved=tuple(moved))
+
+    def set_hits(self, index: int, hits: int) -> BattleSnapshot:
+        """Return a new snapshot with creature index having taken hits."""
+        all_hits = list(self.hits)
+        all_hits[index] = hits
+        return self._replace(hits=tuple(all_hits))
+
+    def set_phase(self, battle_phase: int) -> BattleSnapshot:
+        """Return a new snapshot in battle_phase."""
+        return self._replace(battle_phase=battle_phase)
+
+    def start_turn(self, battle_turn: int) -> BattleSnapshot:
+        """Return a new snapshot at the start of a legion's maneuver phase
+        in battle_turn, with the dead removed from the board and no
+        creatures moved yet."""
+        hexlabels = tuple(
+            None if self.dead(index) else hexlabel
+            for index, hexlabel in enumerate(self.hexlabels)
+        )
+        return self._replace(
+            battle_turn=battle_turn,
+            battle_phase=Phase.MANEUVER,
+            hexlabels=hexlabels,
+            moved=(False,) * len(self.moved),
+        )
+
+    def index(self, creature: Creature.Creature) -> int:
+        """Return the index of creature, which must be in the battle."""
+        for index, creature2 in enumerate(self.creatures):
+            if creature2 is creature:
+                return index
+        raise ValueError(f"{creature} is not in the battle")
+
+    def is_attacker(self, index: int) -> bool:
+        return index < self.num_attackers
+
+    def allies(self, index: int) -> range:
+        """Return the indexes of the creatures in index's legion,
+        including index."""
+        if self.is_attacker(index):
+            return range(self.num_attackers)
+        return range(self.num_attackers, len(self.creatures))
+
+    def enemies(self, index: int) -> range:
+        """Return the indexes of the creatures in the other legion."""
+        if self.is_attacker(index):
+            return range(self.num_attackers, len(self.creatures))
+        return range(self.num_attackers)
+
+    def dead(self, index: int) -> bool:
+        return self.hits[index] >= self.powers[index]
+
+    def hits_left(self, index: int) -> int:
+        return max(self.powers[index] - self.hits[index], 0)
+
+    def offboard(self, index: int) -> bool:
+        return self.hexlabels[index] in {"ATTACKER", "DEFENDER"}
+
+    def onboard(self, index: int) -> bool:
+        """Return True iff creature index is alive and on the board."""
+        return (
+            self.hexlabels[index] is not None
+            and not self.offboard(index)
+            and not self.dead(index)
+        )
+
+    def legion_dead(self, index: int) -> bool:
+        """Return True iff index's legion has been eliminated, because its
+        titan or all of its creatures are dead, like Legion.dead."""
+        alive = False
+        for index2 in self.allies(index):
+            if self.dead(index2):
+                if self.creatures[index2].is_titan:
+                    return True
+            else:
+                alive = True
+        return not alive
+
+    def legion_size(self, index: int) -> int:
+        """Return the number of living creatures in index's legion."""
+        return sum(1 for index2 in self.allies(index) if not self.dead(index2))
+
+    @property
+    def occupied_mask(self) -> int:
+        """Return a bitmask of all hexes that contain creatures, alive or
+        dead, like Game.occupied_battle_hex_mask."""
+        mask = self._cache.get("occupied")
+        if mask is None:
+            mask = 0
+            for hexlabel in self.hexlabels:
+                if hexlabel is not None:
+                    mask |= BattleMap.hexlabel_to_bit[hexlabel]
+            self._cache["occupied"] = mask
+        return mask
+
+    def _hex_masks(self) -> Tuple[int, int, int, int]:
+        """Return bitmasks of the hexes holding live onboard attackers, live
+        onboard defenders, dead attackers, and dead defenders."""
+        masks = self._cache.get("hex_masks")
+        if masks is None:
+            live = [0, 0]
+            dead = [0, 0]
+            for index, hexlabel in enumerate(self.hexlabels):
+                if hexlabel is None:
+                    continue
+                if self.offboard(index):
+                    continue
+                side = 0 if self.is_attacker(index) else 1
+                if self.dead(index):
+                    dead[side] |= BattleMap.hexlabel_to_bit[hexlabel]
+                else:
+                    live[side] |= BattleMap.hexlabel_to_bit[hexlabel]
+            masks = (live[0], live[1], dead[0], dead[1])
+            self._cache["hex_masks"] = masks
+        return masks
+
+    def enemy_hex_mask(self, index: int) -> int:
+        """Return a bitmask of the hexes holding live onboard enemies of
+        creature index."""
+        masks = self._hex_masks()
+        return masks[1] if self.is_attacker(index) else masks[0]
+
+    def is_engaged_with(self, index: int, index2: int) -> bool:
+        """Return True iff creature index is engaged with live enemy
+        index2."""
+        hexlabel = self.hexlabels[index]
+        hexlabel2 = self.hexlabels[index2]
+        if (
+            hexlabel is None
+            or hexlabel2 is None
+            or self.offboard(index)
+            or not self.onboard(index2)
+            or self.is_attacker(index) == self.is_attacker(index2)
+        ):
+            return False
+        return bool(
+            self.battlemap.engagement_masks[hexlabel]
+            & BattleMap.hexlabel_to_bit[hexlabel2]
+        )
+
+    def engaged(self, index: int) -> bool:
+        hexlabel = self.hexlabels[index]
+        if hexlabel is None or self.offboard(index):
+            return False
+        return bool(
+            self.battlemap.engagement_masks[hexlabel]
+            & self.enemy_hex_mask(index)
+        )
+
+    def engaged_enemies(self, index: int) -> List[int]:
+        """Return a list of the live enemies creature index is engaged
+        with."""
+        if not self.engaged(index):
+            return []
+        return [
+            index2
+            for index2 in self.enemies(index)
+            if self.is_engaged_with(index, index2)
+        ]
+
+    def has_dead_adjacent_enemies(self, index: int) -> bool:
+        hexlabel = self.hexlabels[index]
+        if hexlabel is None or self.offboard(index):
+            return False
+        masks = self._hex_masks()
+        dead_enemy_mask = masks[3] if self.is_attacker(index) else masks[2]
+        return bool(
+            self.battlemap.engagement_masks[hexlabel] & dead_enemy_mask
+        )
+
+    def mobile(self, index: int) -> bool:
+        return (
+            not self.moved[index]
+            and not self.dead(index)
+            and not self.engaged(index)
+        )
+
+    def potential_rangestrike_targets(self, index: int) -> List[int]:
+        """Return a list of the enemies that creature index could
+        rangestrike if the phase were correct."""
+        key = ("potential_rangestrike_targets", index)
+        targets = self._cache.get(key)
+        if targets is None:
+            targets = []
+            creature = self.creatures[index]
+            hexlabel = self.hexlabels[index]
+            if (
+                hexlabel is not None
+                and not self.offboard(index)
+                and creature.rangestrikes
+                and not self.has_dead_adjacent_enemies(index)
+            ):
+                for index2 in self.enemies(index):
+                    if not self.onboard(index2):
+                        continue
+                    hexlabel2 = self.hexlabels[index2]
+                    assert hexlabel2 is not None
+                    if Creature.is_potential_rangestrike_target(
+                        creature.creature_type,
+                        hexlabel,
+                        self.creatures[index2].creature_type,
+                        hexlabel2,
+                        self.battlemap,
+                        self.occupied_mask,
+                    ):
+                        targets.append(index2)
+            self._cache[key] = targets
+        return targets
+
+    def rangestrike_targets(self, index: int) -> List[int]:
+        """Return a list of the enemies that creature index can
+        rangestrike."""
+        if self.battle_phase != Phase.STRIKE:
+            return []
+        return self.potential_rangestrike_targets(index)
+
+    def number_of_dice(self, index: int, target: int) -> int:
+        """Return the number of dice creature index would use if striking
+        target."""
+        hexlabel = self.hexlabels[index]
+        hexlabel2 = self.hexlabels[target]
+        assert hexlabel is not None and hexlabel2 is not None
+        if self.is_engaged_with(index, target):
+            engaged = True
+        elif target in self.potential_rangestrike_targets(index):
+            engaged = False
+        else:
+            return 0
+        return Creature.find_number_of_dice(
+            self.creatures[index].creature_type,
+            self.powers[index],
+            hexlabel,
+            hexlabel2,
+            self.battlemap,
+            engaged,
+        )
+
+    def strike_number(self, index: int, target: int) -> int:
+        """Return the strike number creature index would use if striking
+        target."""
+        hexlabel = self.hexlabels[index]
+        hexlabel2 = self.hexlabels[target]
+        assert hexlabel is not None and hexlabel2 is not None
+        return Creature.find_strike_number(
+            self.creatures[index].creature_type,
+            hexlabel,
+            self.creatures[target].creature_type,
+            hexlabel2,
+            self.battlemap,
+            self.occupied_mask,
+            self.is_engaged_with(index, target),
+        )
+
+    def find_battle_moves(
+        self, index: int, ignore_mobile_allies: bool = False
+    ) -> Set[str]:
+        """Return a set of all hexlabels to which creature index can move,
+        excluding its current hex, like Game.find_battle_moves."""
+        result = set()  # type: Set[str]
+        hexlabel = self.hexlabels[index]
+        if hexlabel is None:
+            return result
+        if self.moved[index] or self.engaged(index):
+            return result
+        if (
+            self.battle_turn == 1
+            and not self.is_attacker(index)
+            and self.battlemap.startlist
+        ):
+            for start_hexlabel in self.battlemap.startlist:
+                # There can't be any mobile allies there on turn 1.
+                if (
+                    not self.occupied_mask
+                    & BattleMap.hexlabel_to_bit[start_hexlabel]
+                ):
+                    result.add(start_hexlabel)
+            return result
+        assert self.game is not None
+        blocked = 0
+        for index2, hexlabel2 in enumerate(self.hexlabels):
+            if hexlabel2 is not None and not (
+                ignore_mobile_allies
+                and self.is_attacker(index2) == self.is_attacker(index)
+                and self.mobile(index2)
+            ):
+                blocked |= BattleMap.hexlabel_to_bit[hexlabel2]
+        return self.game.find_blocked_battle_moves(
+            self.creatures[index], hexlabel, blocked, self.battlemap
+        )
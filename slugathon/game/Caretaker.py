@@ -19,11 +19,11 @@ class Caretaker(object):
         self.max_counts = {}
         self.graveyard = {}
         for creature_name in creaturedata.data:
-            creature = Creature.Creature(creature_name)
-            if not creature.is_unknown:
-                self.counts[creature.name] = creature.max_count
-                self.max_counts[creature.name] = creature.max_count
-                self.graveyard[creature.name] = 0
+            creature_type = Creature.name_to_creature_type[creature_name]
+            if not creature_type.is_unknown:
+                self.counts[creature_name] = creature_type.max_count
+                self.max_counts[creature_name] = creature_type.max_count
+                self.graveyard[creature_name] = 0
 
     def num_left(self, creature_name: str) -> int:
         """Return the number of creature_name left in the stacks."""
@@ -39,10 +39,10 @@ class Caretaker(object):
 
     def put_one_back(self, creature_name: str) -> None:
         """Put one of creature_name back onto the stack."""
-        creature = Creature.Creature(creature_name)
-        if creature.is_unknown:
+        creature_type = Creature.name_to_creature_type[creature_name]
+        if creature_type.is_unknown:
             return
-        if self.counts[creature_name] >= creature.max_count:
+        if self.counts[creature_name] >= creature_type.max_count:
             logging.info(f"Tried to put too many {creature_name} back")
             self.counts[creature_name] = self.max_counts[creature_name]
         else:
@@ -51,8 +51,7 @@ class Caretaker(object):
     def kill_one(self, creature_name: str) -> None:
         """If creature_name is mortal, put it in the graveyard.  Otherwise put
         it back onto the stack."""
-        creature = Creature.Creature(creature_name)
-        if creature.is_creature:
+        if Creature.name_to_creature_type[creature_name].is_creature:
             self.graveyard[creature_name] += 1
         else:
             self.put_one_back(creature_name)
@@ -2,10 +2,21 @@ from __future__ import annotations
 
 import logging
 from collections import defaultdict
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple
+from operator import attrgetter
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from slugathon.data import battlemapdata, creaturedata, recruitdata
-from slugathon.game import Legion, Phase
+from slugathon.game import BattleMap, Legion, Phase
 
 __copyright__ = "Copyright (c) 2003-2021 David Ripton"
 __license__ = "GNU GPL v2"
@@ -61,20 +72,70 @@ def _compute_nativity() -> DefaultDict[str, Set[str]]:
 creature_name_to_native_hazards = _compute_nativity()
 
 
-def n2c(names: List[str]) -> List[Creature]:
-    """Make a list of Creatures from a list of creature names"""
-    return [Creature(name) for name in names]
+def _compute_hazard_bits() -> Dict[str, int]:
+    """Return a dict of each battle hazard (hex and hexside) to its own bit,
+    for nativity masks."""
+    hazards = set()  # type: Set[str]
+    for set1 in _terrain_to_hazards().values():
+        hazards.update(set1)
+    return {hazard: 1 << ii for ii, hazard in enumerate(sorted(hazards))}
 
 
-class Creature(object):
+hazard_to_bit = _compute_hazard_bits()
+
+BOG_BIT = hazard_to_bit["Bog"]
+BRAMBLE_BIT = hazard_to_bit["Bramble"]
+DRIFT_BIT = hazard_to_bit["Drift"]
+DUNE_BIT = hazard_to_bit["Dune"]
+SLOPE_BIT = hazard_to_bit["Slope"]
+
+
+def _native_mask(hazards: Iterable[str]) -> int:
+    """Return the bitmask of hazard_to_bit bits for hazards."""
+    mask = 0
+    for hazard in hazards:
+        mask |= hazard_to_bit.get(hazard, 0)
+    return mask
+
+
+class CreatureType(object):
+    """The static stats of one type of Creature, Lord, or Demi-Lord.
+
+    There is one CreatureType per creature name, in name_to_creature_type,
+    shared by every Creature with that name.  Don't modify it.
+    """
 
-    """One instance of one Creature, Lord, or Demi-Lord."""
+    __slots__ = (
+        "name",
+        "plural_name",
+        "power",
+        "skill",
+        "rangestrikes",
+        "magicmissile",
+        "flies",
+        "character_type",
+        "summonable",
+        "acquirable_every",
+        "acquirable",
+        "max_count",
+        "color_name",
+        "is_titan",
+        "is_lord",
+        "is_demilord",
+        "is_creature",
+        "is_unknown",
+        "score",
+        "sort_value",
+        "combat_value",
+        "native_hazards",
+        "native_mask",
+    )
 
     def __init__(self, name: str):
         self.name = name
         (
             self.plural_name,
-            self._power,
+            self.power,
             self.skill,
             rangestrikes_int,
             flies_int,
@@ -89,19 +150,303 @@ class Creature(object):
         self.flies = bool(flies_int)
         self.summonable = bool(summonable_int)
         self.acquirable = bool(self.acquirable_every)
+        self.is_titan = name == "Titan"
+        self.is_lord = self.character_type == "lord"
+        self.is_demilord = self.character_type == "demilord"
+        self.is_creature = self.character_type == "creature"
+        self.is_unknown = self.character_type == "unknown"
+        self.score = self.power * self.skill
+        self.sort_value = self.sort_value_for(self.power)
+        self.combat_value = self.combat_value_for(self.power)
+        self.native_hazards = frozenset(creature_name_to_native_hazards[name])
+        self.native_mask = _native_mask(self.native_hazards)
+
+    def __repr__(self) -> str:
+        return f"CreatureType({self.name})"
+
+    def sort_value_for(self, power: int) -> float:
+        """Return a rough indication of creature value, for sorting, if
+        this type of creature had power."""
+        return (
+            power * self.skill
+            + 0.2 * self.acquirable
+            + 0.3 * self.flies
+            + 0.25 * self.rangestrikes
+            + 0.1 * self.magicmissile
+            + 0.15 * (self.skill == 2)
+            + 0.18 * (self.skill == 4)
+            + 100 * (self.is_titan)
+        )
+
+    def combat_value_for(self, power: int) -> float:
+        """Return a rough indication of creature combat ability, for the AI,
+        if this type of creature had power."""
+        return (
+            power * self.skill
+            + 0.3 * self.flies
+            + 0.25 * self.rangestrikes
+            + 0.1 * self.magicmissile
+            + 0.15 * (self.skill == 2)
+            + 0.18 * (self.skill == 4)
+        )
+
+
+name_to_creature_type = {
+    name: CreatureType(name) for name in creaturedata.data
+}  # type: Dict[str, CreatureType]
+
+
+def n2c(names: List[str]) -> List[Creature]:
+    """Make a list of Creatures from a list of creature names"""
+    return [Creature(name) for name in names]
+
+
+# The battle strike rules, shared by Creature and BattleSnapshot.  They
+# work on creature types and hexlabels, so that they don't depend on
+# where the creatures' positions are kept.
+
+
+def is_potential_rangestrike_target(
+    striker_type: CreatureType,
+    hexlabel1: str,
+    target_type: CreatureType,
+    hexlabel2: str,
+    battlemap: BattleMap.BattleMap,
+    occupied: int,
+) -> bool:
+    """Return True iff a rangestriker of striker_type in hexlabel1 is in
+    range of, and can see, a target of target_type in hexlabel2, with
+    creatures in the hexes in the bitmask occupied.
+
+    The caller must check the phase, and that the striker is not engaged
+    and has no dead adjacent enemies.
+    """
+    if battlemap.range(hexlabel1, hexlabel2) > striker_type.skill:
+        return False
+    if striker_type.magicmissile:
+        return True
+    return not target_type.is_lord and not battlemap.is_los_blocked_by(
+        hexlabel1, hexlabel2, occupied
+    )
+
+
+def find_number_of_dice(
+    striker_type: CreatureType,
+    power: int,
+    hexlabel1: str,
+    hexlabel2: str,
+    battlemap: BattleMap.BattleMap,
+    engaged: bool,
+) -> int:
+    """Return the number of dice that a striker of striker_type with power,
+    in hexlabel1, would roll against a target in hexlabel2.
+
+    engaged is True for a melee strike, and False for a rangestrike.
+    """
+    native = striker_type.native_mask
+    hex1 = battlemap.hexes[hexlabel1]
+    if engaged:
+        hex2 = battlemap.hexes[hexlabel2]
+        dice = power
+        if hex1.terrain == "Volcano" and native & hex1.terrain_bit:
+            dice += 2
+        hexside = hex1.neighbor_to_hexside(hex2)
+        assert hexside is not None
+        border = hex1.borders[hexside]
+        if border == "Slope" and native & SLOPE_BIT:
+            dice += 1
+        elif border == "Dune" and native & DUNE_BIT:
+            dice += 2
+        border2 = hex1.opposite_border(hexside)
+        if border2 == "Dune" and not native & DUNE_BIT:
+            dice -= 1
+    else:
+        dice = int(power / 2)
+        if hex1.terrain == "Volcano" and native & hex1.terrain_bit:
+            dice += 2
+    return dice
+
+
+def find_strike_number(
+    striker_type: CreatureType,
+    hexlabel1: str,
+    target_type: CreatureType,
+    hexlabel2: str,
+    battlemap: BattleMap.BattleMap,
+    occupied: int,
+    engaged: bool,
+) -> int:
+    """Return the strike number that a striker of striker_type in hexlabel1
+    would need against a target of target_type in hexlabel2, with creatures
+    in the hexes in the bitmask occupied.
+
+    engaged is True for a melee strike, and False for a rangestrike.
+    """
+    native1 = striker_type.native_mask
+    native2 = target_type.native_mask
+    hex1 = battlemap.hexes[hexlabel1]
+    hex2 = battlemap.hexes[hexlabel2]
+    skill1 = striker_type.skill
+    skill2 = target_type.skill
+    if engaged:
+        hexside = hex1.neighbor_to_hexside(hex2)
+        assert hexside is not None
+        border = hex1.borders[hexside]
+        border2 = hex1.opposite_border(hexside)
+        if hex1.terrain == "Bramble" and not native1 & BRAMBLE_BIT:
+            skill1 -= 1
+        elif border == "Wall":
+            skill1 += 1
+        elif border2 == "Slope" and not native1 & SLOPE_BIT:
+            skill1 -= 1
+        elif border2 == "Wall":
+            skill1 -= 1
+    else:
+        # Long range rangestrike penalty
+        if (
+            not striker_type.magicmissile
+            and battlemap.range(hexlabel1, hexlabel2) >= 4
+        ):
+            skill1 -= 1
+        if not striker_type.magicmissile and not native1 & BRAMBLE_BIT:
+            skill1 -= battlemap.count_bramble_hexes_by(
+                hexlabel1, hexlabel2, occupied
+            )
+        if not striker_type.magicmissile:
+            skill1 -= battlemap.count_walls(hexlabel1, hexlabel2, None)
+    strike_number = 4 - skill1 + skill2
+    if engaged:
+        if (
+            hex2.terrain == "Bramble"
+            and not native1 & BRAMBLE_BIT
+            and native2 & BRAMBLE_BIT
+        ):
+            strike_number += 1
+    else:
+        if (
+            hex2.terrain == "Bramble"
+            and native2 & BRAMBLE_BIT
+            and not native1 & BRAMBLE_BIT
+        ):
+            strike_number += 1
+        elif hex2.terrain == "Volcano" and native2 & hex2.terrain_bit:
+            strike_number += 1
+    strike_number = min(strike_number, 6)
+    return strike_number
+
+
+class Creature(object):
+    """One instance of one Creature, Lord, or Demi-Lord.
+
+    Static stats live in its CreatureType; a Creature only holds its own
+    battle state.
+    """
+
+    __slots__ = (
+        "creature_type",
+        "name",
+        "hits",
+        "moved",
+        "struck",
+        "_hexlabel",
+        "previous_hexlabel",
+        "legion",
+    )
+
+    def __init__(self, name: str):
+        self.creature_type = name_to_creature_type[name]
+        self.name = name
         self.hits = 0
         self.moved = False
         self.struck = False
-        self.hexlabel = None  # type: Optional[str]
+        self._hexlabel = None  # type: Optional[str]
         self.previous_hexlabel = None  # type: Optional[str]
         self.legion = None  # type: Optional[Legion.Legion]
 
+    @property
+    def plural_name(self) -> str:
+        return self.creature_type.plural_name
+
+    @property
+    def skill(self) -> int:
+        return self.creature_type.skill
+
+    @property
+    def rangestrikes(self) -> bool:
+        return self.creature_type.rangestrikes
+
+    @property
+    def magicmissile(self) -> bool:
+        return self.creature_type.magicmissile
+
+    @property
+    def flies(self) -> bool:
+        return self.creature_type.flies
+
+    @property
+    def character_type(self) -> str:
+        return self.creature_type.character_type
+
+    @property
+    def summonable(self) -> bool:
+        return self.creature_type.summonable
+
+    @property
+    def acquirable_every(self) -> int:
+        return self.creature_type.acquirable_every
+
+    @property
+    def acquirable(self) -> bool:
+        return self.creature_type.acquirable
+
+    @property
+    def max_count(self) -> int:
+        return self.creature_type.max_count
+
+    @property
+    def color_name(self) -> str:
+        return self.creature_type.color_name
+
+    def _set_hexlabel(self, hexlabel: Optional[str]) -> None:
+        """Set the battle hexlabel, and tell the game so that its battle
+        hex index stays current, even for the AI's temporary moves."""
+        old_hexlabel = self._hexlabel
+        self._hexlabel = hexlabel
+        if hexlabel == old_hexlabel:
+            return
+        legion = self.legion
+        if legion is None:
+            return
+        player = legion.player
+        if player is None:
+            return
+        game = player.game
+        if game is None:
+            return
+        game.battle_creature_moved(self, old_hexlabel)
+
+    # hexlabel is read far more often than it is set, so read it with
+    # attrgetter, which avoids a Python call.  mypy can't see the type of
+    # that, so it gets the equivalent plain property.
+    if TYPE_CHECKING:
+
+        @property
+        def hexlabel(self) -> Optional[str]:
+            return self._hexlabel
+
+        @hexlabel.setter
+        def hexlabel(self, hexlabel: Optional[str]) -> None:
+            self._set_hexlabel(hexlabel)
+
+    else:
+        hexlabel = property(attrgetter("_hexlabel"), _set_hexlabel)
+
     @property
     def power(self) -> int:
-        if self.is_titan and self.legion is not None:
+        if self.creature_type.is_titan and self.legion is not None:
             return self.legion.player.titan_power
         else:
-            return self._power
+            return self.creature_type.power
 
     @property
     def dead(self) -> bool:
@@ -141,28 +486,18 @@ class Creature(object):
     @property
     def sort_value(self) -> float:
         """Return a rough indication of creature value, for sorting."""
-        return (
-            self.score
-            + 0.2 * self.acquirable
-            + 0.3 * self.flies
-            + 0.25 * self.rangestrikes
-            + 0.1 * self.magicmissile
-            + 0.15 * (self.skill == 2)
-            + 0.18 * (self.skill == 4)
-            + 100 * (self.is_titan)
-        )
+        creature_type = self.creature_type
+        if creature_type.is_titan:
+            return creature_type.sort_value_for(self.power)
+        return creature_type.sort_value
 
     @property
     def combat_value(self) -> float:
         """Return a rough indication of creature combat ability, for the AI."""
-        return (
-            self.score
-            + 0.3 * self.flies
-            + 0.25 * self.rangestrikes
-            + 0.1 * self.magicmissile
-            + 0.15 * (self.skill == 2)
-            + 0.18 * (self.skill == 4)
-        )
+        creature_type = self.creature_type
+        if creature_type.is_titan:
+            return creature_type.combat_value_for(self.power)
+        return creature_type.combat_value
 
     @property
     def terrain_combat_value(self) -> float:
@@ -187,50 +522,53 @@ class Creature(object):
         terrain = self.legion.player.game.board.hexes[
             self.legion.hexlabel
         ].terrain
+        native = self.creature_type.native_mask
         if terrain == "Tower":
             return (1 + TOWER_BONUS) * base_value
         elif terrain == "Brush":
-            return (1 + (self.is_native("Bramble") * BRUSH_BONUS)) * base_value
+            return (
+                1 + (bool(native & BRAMBLE_BIT) * BRUSH_BONUS)
+            ) * base_value
         elif terrain == "Jungle":
             return (
-                1 + (self.is_native("Bramble") * JUNGLE_BONUS)
+                1 + (bool(native & BRAMBLE_BIT) * JUNGLE_BONUS)
             ) * base_value
         elif terrain == "Hills":
-            return (1 + (self.is_native("Slope") * HILLS_BONUS)) * base_value
+            return (1 + (bool(native & SLOPE_BIT) * HILLS_BONUS)) * base_value
         elif terrain == "Swamp":
-            return (1 + (self.is_native("Bog") * SWAMP_BONUS)) * base_value
+            return (1 + (bool(native & BOG_BIT) * SWAMP_BONUS)) * base_value
         elif terrain == "Marsh":
-            return (1 + (self.is_native("Bog") * MARSH_BONUS)) * base_value
+            return (1 + (bool(native & BOG_BIT) * MARSH_BONUS)) * base_value
         elif terrain == "Desert":
-            return (1 + (self.is_native("Dune") * DESERT_BONUS)) * base_value
+            return (1 + (bool(native & DUNE_BIT) * DESERT_BONUS)) * base_value
         elif terrain == "Mountain":
             return (
-                1 + (self.is_native("Slope") * MOUNTAINS_BONUS)
+                1 + (bool(native & SLOPE_BIT) * MOUNTAINS_BONUS)
             ) * base_value
         elif terrain == "Tundra":
-            return (1 + (self.is_native("Drift") * TUNDRA_BONUS)) * base_value
+            return (1 + (bool(native & DRIFT_BIT) * TUNDRA_BONUS)) * base_value
         else:
             return base_value
 
     @property
     def is_titan(self) -> bool:
-        return self.name == "Titan"
+        return self.creature_type.is_titan
 
     @property
     def is_lord(self) -> bool:
-        return self.character_type == "lord"
+        return self.creature_type.is_lord
 
     @property
     def is_demilord(self) -> bool:
-        return self.character_type == "demilord"
+        return self.creature_type.is_demilord
 
     @property
     def is_creature(self) -> bool:
-        return self.character_type == "creature"
+        return self.creature_type.is_creature
 
     @property
     def is_unknown(self) -> bool:
-        return self.character_type == "unknown"
+        return self.creature_type.is_unknown
 
     def _hexlabel_to_enemy(self) -> Dict[str, Creature]:
         """Return a dict of hexlabel: live enemy Creature"""
@@ -296,15 +634,17 @@ class Creature(object):
             logging.warning("")
             return enemies
         assert game.battlemap is not None
-        hex1 = game.battlemap.hexes[self.hexlabel]
-        hexlabel_to_enemy = self._hexlabel_to_enemy()
-        for hexside, hex2 in hex1.neighbors.items():
-            if hex2.label in hexlabel_to_enemy:
+        engagement_mask = game.battlemap.engagement_masks[self.hexlabel]
+        legion2 = game.other_battle_legion(legion)
+        assert legion2 is not None
+        for creature in legion2.creatures:
+            if not creature.dead and not creature.offboard:
+                assert creature.hexlabel is not None
                 if (
-                    hex1.borders[hexside] != "Cliff"
-                    and hex2.borders[(hexside + 3) % 6] != "Cliff"
+                    engagement_mask
+                    & BattleMap.hexlabel_to_bit[creature.hexlabel]
                 ):
-                    enemies.add(hexlabel_to_enemy[hex2.label])
+                    enemies.add(creature)
         logging.debug(f"{self=} {enemies=}")
         return enemies
 
@@ -377,11 +717,15 @@ class Creature(object):
         hexlabel_to_enemy = self._hexlabel_to_enemy()
         map1 = game.battlemap
         assert map1 is not None
+        occupied = game.occupied_battle_hex_mask()
         for hexlabel, enemy in hexlabel_to_enemy.items():
-            if (
-                map1.range(self.hexlabel, hexlabel) <= self.skill
-                and (self.magicmissile or self.has_los_to(hexlabel))
-                and (self.magicmissile or not enemy.is_lord)
+            if is_potential_rangestrike_target(
+                self.creature_type,
+                self.hexlabel,
+                enemy.creature_type,
+                hexlabel,
+                map1,
+                occupied,
             ):
                 enemies.add(enemy)
         return enemies
@@ -469,7 +813,24 @@ class Creature(object):
     @property
     def engaged(self) -> bool:
         """Return True iff this creature is engaged with an adjacent enemy."""
-        return bool(self.engaged_enemies)
+        if self.offboard or self.hexlabel is None:
+            return False
+        legion = self.legion
+        if legion is None:
+            return False
+        player = legion.player
+        if player is None:
+            return False
+        game = player.game
+        if game is None:
+            return False
+        assert game.battlemap is not None
+        legion2 = game.other_battle_legion(legion)
+        assert legion2 is not None
+        return bool(
+            game.battlemap.engagement_masks[self.hexlabel]
+            & game.battle_legion_hex_mask(legion2)
+        )
 
     @property
     def mobile(self) -> bool:
@@ -482,7 +843,7 @@ class Creature(object):
         Note that we define nativity even for hazards that don't provide any
         benefit for being native, like Wall and Plain.
         """
-        return hazard in creature_name_to_native_hazards[self.name]
+        return hazard in self.creature_type.native_hazards
 
     def move(self, hexlabel: str) -> None:
         """Move this creature to a new battle hex"""
@@ -521,30 +882,21 @@ class Creature(object):
         map1 = game.battlemap
         assert map1 is not None
         assert self.hexlabel is not None
-        hex1 = map1.hexes[self.hexlabel]
         assert target.hexlabel is not None
-        hex2 = map1.hexes[target.hexlabel]
         if target in self.engaged_enemies:
-            dice = self.power
-            if hex1.terrain == "Volcano" and self.is_native(hex1.terrain):
-                dice += 2
-            hexside = hex1.neighbor_to_hexside(hex2)
-            assert hexside is not None
-            border = hex1.borders[hexside]
-            if border == "Slope" and self.is_native(border):
-                dice += 1
-            elif border == "Dune" and self.is_native(border):
-                dice += 2
-            border2 = hex1.opposite_border(hexside)
-            if border2 == "Dune" and not self.is_native(border2):
-                dice -= 1
+            engaged = True
         elif target in self.potential_rangestrike_targets:
-            dice = int(self.power / 2)
-            if hex1.terrain == "Volcano" and self.is_native(hex1.terrain):
-                dice += 2
+            engaged = False
         else:
-            dice = 0
-        return dice
+            return 0
+        return find_number_of_dice(
+            self.creature_type,
+            self.power,
+            self.hexlabel,
+            target.hexlabel,
+            map1,
+            engaged,
+        )
 
     def strike_number(self, target: Creature) -> int:
         """Return the strike number to use if striking target."""
@@ -556,59 +908,21 @@ class Creature(object):
         map1 = game.battlemap
         assert map1 is not None
         assert self.hexlabel is not None
-        hex1 = map1.hexes[self.hexlabel]
         assert target.hexlabel is not None
-        hex2 = map1.hexes[target.hexlabel]
-        skill1 = self.skill
-        skill2 = target.skill
-        assert target.hexlabel is not None
-        if target in self.engaged_enemies:
-            hexside = hex1.neighbor_to_hexside(hex2)
-            assert hexside is not None
-            border = hex1.borders[hexside]
-            border2 = hex1.opposite_border(hexside)
-            if hex1.terrain == "Bramble" and not self.is_native(hex1.terrain):
-                skill1 -= 1
-            elif border == "Wall":
-                skill1 += 1
-            elif border2 == "Slope" and not self.is_native(border2):
-                skill1 -= 1
-            elif border2 == "Wall":
-                skill1 -= 1
+        engaged = target in self.engaged_enemies
+        if engaged:
+            occupied = 0
         else:
-            # Long range rangestrike penalty
-            if (
-                not self.magicmissile
-                and map1.range(self.hexlabel, target.hexlabel) >= 4
-            ):
-                skill1 -= 1
-            if not self.magicmissile and not self.is_native("Bramble"):
-                skill1 -= map1.count_bramble_hexes(
-                    self.hexlabel, target.hexlabel, game
-                )
-            if not self.magicmissile:
-                skill1 -= map1.count_walls(
-                    self.hexlabel, target.hexlabel, game
-                )
-        strike_number = 4 - skill1 + skill2
-        if target in self.engaged_enemies:
-            if (
-                hex2.terrain == "Bramble"
-                and not self.is_native(hex2.terrain)
-                and target.is_native(hex2.terrain)
-            ):
-                strike_number += 1
-        else:
-            if (
-                hex2.terrain == "Bramble"
-                and target.is_native(hex2.terrain)
-                and not self.is_native(hex2.terrain)
-            ):
-                strike_number += 1
-            elif hex2.terrain == "Volcano" and target.is_native(hex2.terrain):
-                strike_number += 1
-        strike_number = min(strike_number, 6)
-        return strike_number
+            occupied = game.occupied_battle_hex_mask()
+        return find_strike_number(
+            self.creature_type,
+            self.hexlabel,
+            target.creature_type,
+            target.hexlabel,
+            map1,
+            occupied,
+            engaged,
+        )
 
     def can_carry_to(
         self,
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import heapq
 import logging
 import os
 import time
 from collections import defaultdict
 from sys import maxsize
-from typing import Any, DefaultDict, List, Optional, Set, Tuple, Union
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from twisted.internet import reactor
 from zope.interface import implementer
@@ -39,11 +50,126 @@ ARROWS_ONLY = -2
 # Entry side constants
 TELEPORT = -3
 
+# Maximum number of entries in Game._battle_moves_cache
+MAX_BATTLE_MOVES_CACHE = 10000
+
 
 def opposite(direction: int) -> int:
     return (direction + 3) % 6
 
 
+# (hexlabel, roll, block, came_from): paths, for find_paths
+_paths = (
+    {}
+)  # type: Dict[Tuple[int, int, Optional[int], Optional[int]], Tuple[Tuple[Tuple[int, Optional[int]], ...], ...]]
+
+
+def find_paths(
+    masterhex: MasterHex.MasterHex,
+    roll: int,
+    block: Optional[int] = None,
+    came_from: Optional[int] = None,
+) -> Tuple[Tuple[Tuple[int, Optional[int]], ...], ...]:
+    """Return every distinct path that a legion could take from masterhex
+    with roll, on an empty board.
+
+    Each path is a tuple of (hexlabel, entry_side), starting with masterhex
+    and ending in the hex where the move would end.  The entry side of
+    masterhex is None if came_from is None.  block and came_from are as in
+    Game.find_normal_moves.
+
+    The board never changes, so the paths from each hex are found once and
+    kept.  Game.find_normal_moves then only has to walk them, stopping at
+    hexes with enemy legions.
+    """
+    key = (masterhex.label, roll, block, came_from)
+    paths = _paths.get(key)
+    if paths is None:
+        if came_from is None:
+            entry_side = None
+        else:
+            entry_side = masterhex.find_entry_side(came_from)
+        first = ((masterhex.label, entry_side),)
+        if roll == 0:
+            paths = (first,)
+        else:
+            if block is None:
+                block = masterhex.find_block()
+                if block is None:
+                    block = ARCHES_AND_ARROWS
+            if block >= 0:
+                directions = [block]
+            elif block == ARCHES_AND_ARROWS:
+                directions = [
+                    direction
+                    for direction, gate in enumerate(masterhex.exits)
+                    if gate in ("ARCH", "ARROW", "ARROWS")
+                    and direction != came_from
+                ]
+            elif block == ARROWS_ONLY:
+                directions = [
+                    direction
+                    for direction, gate in enumerate(masterhex.exits)
+                    if gate in ("ARROW", "ARROWS") and direction != came_from
+                ]
+            else:
+                directions = []
+            # dict rather than set, to keep the order stable
+            unique_paths = {}  # type: Dict[Tuple, None]
+            for direction in directions:
+                for path in find_paths(
+                    masterhex.get_neighbor(direction),
+                    roll - 1,
+                    ARROWS_ONLY,
+                    opposite(direction),
+                ):
+                    unique_paths[first + path] = None
+            paths = tuple(unique_paths)
+        _paths[key] = paths
+    return paths
+
+
+# (hexlabel, distance): hexlabels, for find_nearby_hexlabels
+_neighborhoods = {}  # type: Dict[Tuple[int, int], Tuple[int, ...]]
+
+
+def find_nearby_hexlabels(
+    masterhex: MasterHex.MasterHex, distance: int
+) -> Tuple[int, ...]:
+    """Return the labels of masterhex and of every hex within distance
+    steps of it, crossing any hexside with a gate on either side, as tower
+    teleport does.
+
+    The board never changes, so each neighborhood is found once, with a
+    breadth-first search, and kept.
+    """
+    key = (masterhex.label, distance)
+    hexlabels = _neighborhoods.get(key)
+    if hexlabels is None:
+        found = [masterhex.label]
+        seen = {masterhex.label}
+        frontier = [masterhex]
+        for unused in range(distance):
+            next_frontier = []
+            for hex1 in frontier:
+                for direction, gate in enumerate(hex1.exits):
+                    neighbor = hex1.neighbors[direction]
+                    if (
+                        neighbor
+                        and neighbor.label not in seen
+                        and (
+                            gate != "NONE"
+                            or neighbor.exits[opposite(direction)] != "NONE"
+                        )
+                    ):
+                        seen.add(neighbor.label)
+                        found.append(neighbor.label)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        hexlabels = _neighborhoods[key] = tuple(found)
+    return hexlabels
+
+
 @implementer(IObserver)
 class Game(Observed):
 
@@ -78,6 +204,10 @@ class Game(Observed):
         self.board = MasterBoard.MasterBoard()
         self.turn = 1
         self.phase = Phase.SPLIT
+        # (playername, turn, movement roll) and markerid: moves.  See
+        # find_all_moves_for_player
+        self._player_moves_key = None  # type: Optional[Tuple]
+        self._player_moves = {}  # type: Dict[str, Set[Tuple[int, int]]]
         self.active_player = None  # type: Optional[Player.Player]
         self.caretaker = Caretaker.Caretaker()
         self.history = History.History()
@@ -89,6 +219,15 @@ class Game(Observed):
         self.battle_masterhex = None  # type: Optional[MasterHex.MasterHex]
         self.battle_entry_side = None  # type: Optional[int]
         self.battlemap = None  # type: Optional[BattleMap.BattleMap]
+        # battle hexlabel: list of Creatures, for both battle legions.
+        # Kept current by battle_creature_moved, and reset to None by
+        # battle_legion_changed, to be rebuilt on the next lookup.
+        self._battle_hex_index = (
+            None
+        )  # type: Optional[Dict[Optional[str], List[Creature.Creature]]]
+        # (battlemap, creature name, hexlabel, movement, blocked hex mask,
+        # ignore_mobile_allies): hexlabels.  See find_battle_moves
+        self._battle_moves_cache = {}  # type: Dict[Tuple, Set[str]]
         self.battle_turn = None  # type: Optional[int]
         self.battle_phase = None  # type: Optional[int]
         self.battle_active_legion = None  # type: Optional[Legion.Legion]
@@ -135,12 +274,13 @@ class Game(Observed):
         assert self.battle_masterhex is not None
         self.battle_entry_side = attacker_legion.entry_side
         assert self.battle_entry_side is not None
-        self.battlemap = BattleMap.BattleMap(
+        self.battlemap = BattleMap.get_battlemap(
             self.battle_masterhex.terrain, self.battle_entry_side
         )
         self.battle_turn = 1
         self.battle_phase = Phase.MANEUVER
         self.battle_active_legion = self.defender_legion
+        self._battle_hex_index = None
         self.defender_legion.enter_battle("DEFENDER")
         self.attacker_legion.enter_battle("ATTACKER")
         self.first_attacker_kill = None
@@ -158,6 +298,8 @@ class Game(Observed):
         self.battle_masterhex = None
         self.battle_entry_side = None
         self.battlemap = None
+        self._battle_hex_index = None
+        self._battle_moves_cache.clear()
         self.battle_turn = None
         self.battle_phase = None
         self.battle_active_legion = None
@@ -459,11 +601,23 @@ class Game(Observed):
         game if hexlabel is None"""
         legions = set()
         for player in self.players:
-            for legion in player.legions:
-                if hexlabel in (None, legion.hexlabel) and len(legion):
+            if hexlabel is None:
+                player_legions = (
+                    player.markerid_to_legion.values()
+                )  # type: Iterable[Legion.Legion]
+            else:
+                player_legions = player.markerid_to_legion.legions_in(hexlabel)
+            for legion in player_legions:
+                if len(legion):
                     legions.add(legion)
         return legions
 
+    def check_legion_index(self) -> None:
+        """Raise AssertionError if any player's index of legions by hex is
+        wrong.  For tests."""
+        for player in self.players:
+            player.markerid_to_legion.check()
+
     def find_legion(self, markerid: str) -> Optional[Legion.Legion]:
         """Return the legion called markerid, or None."""
         for player in self.players:
@@ -501,6 +655,7 @@ class Game(Observed):
             parent_creature_names,
             child_creature_names,
         )
+        self._player_moves_key = None
 
     def undo_split(
         self, playername: str, parent_markerid: str, child_markerid: str
@@ -512,6 +667,7 @@ class Game(Observed):
         if player is not self.active_player:
             raise AssertionError("splitting out of turn")
         player.undo_split(parent_markerid, child_markerid)
+        self._player_moves_key = None
 
     def done_with_splits(self, playername: str) -> None:
         """Try to end playername's split phase.
@@ -547,77 +703,53 @@ class Game(Observed):
         roll: int,
         block: int = None,
         came_from: int = None,
+        has_enemy: Optional[Dict[int, bool]] = None,
     ) -> Set[Tuple[int, int]]:
-        """Recursively find non-teleport moves for legion from masterhex.
+        """Find non-teleport moves for legion from masterhex.
 
         If block >= 0, go only that way.
         If block == ARCHES_AND_ARROWS, use arches and arrows.
         If block == ARROWS_ONLY, use only arrows.
+        has_enemy, if not None, is a dict of hexlabel to whether there is
+        an enemy legion there, filled in as needed, which calls for the
+        same player's legions can share.
         Return a set of (hexlabel, entry_side) tuples.
         """
-        logging.info(f"{legion=} {masterhex=} {roll=} {block=} {came_from=}")
-        if block is None:
-            block = masterhex.find_block()
-            if block is None:
-                block = ARCHES_AND_ARROWS
-        moves = set()  # type: Set[Tuple[int, int]]
-        hexlabel = masterhex.label
         player = legion.player
-        # If there is an enemy legion and no friendly legion, mark the hex
-        # as a legal move, and stop.
-        if player.enemy_legions(hexlabel):
-            if not player.friendly_legions(hexlabel):
-                if came_from is None:
-                    logging.error("")
-                    raise AssertionError("came_from is None")
-                moves.add((hexlabel, masterhex.find_entry_side(came_from)))
-        elif roll == 0:
-            # Final destination
-            # Do not add this hex if already occupied by another friendly
-            # legion.
-            allies = set(player.friendly_legions(hexlabel))
-            allies.discard(legion)
-            if not allies:
-                if came_from is None:
-                    logging.error("")
-                    raise AssertionError("came_from is None")
-                moves.add((hexlabel, masterhex.find_entry_side(came_from)))
-        elif block >= 0:
-            moves.update(
-                self.find_normal_moves(
-                    legion,
-                    masterhex.get_neighbor(block),
-                    roll - 1,
-                    ARROWS_ONLY,
-                    opposite(block),
-                )
-            )
-        elif block == ARCHES_AND_ARROWS:
-            for direction, gate in enumerate(masterhex.exits):
-                if gate in ("ARCH", "ARROW", "ARROWS") and (
-                    direction != came_from
-                ):
-                    moves.update(
-                        self.find_normal_moves(
-                            legion,
-                            masterhex.get_neighbor(direction),
-                            roll - 1,
-                            ARROWS_ONLY,
-                            opposite(direction),
-                        )
-                    )
-        elif block == ARROWS_ONLY:
-            for direction, gate in enumerate(masterhex.exits):
-                if gate in ("ARROW", "ARROWS") and (direction != came_from):
-                    moves.update(
-                        self.find_normal_moves(
-                            legion,
-                            masterhex.get_neighbor(direction),
-                            roll - 1,
-                            ARROWS_ONLY,
-                            opposite(direction),
-                        )
+        if has_enemy is None:
+            has_enemy = {}
+        friendly_hexlabels = set()
+        ally_hexlabels = set()
+        for legion2 in player.legions:
+            friendly_hexlabels.add(legion2.hexlabel)
+            if legion2 is not legion:
+                ally_hexlabels.add(legion2.hexlabel)
+        moves = set()  # type: Set[Tuple[int, int]]
+        for path in find_paths(masterhex, roll, block, came_from):
+            for hexlabel, entry_side in path:
+                enemy = has_enemy.get(hexlabel)
+                if enemy is None:
+                    enemy = has_enemy[hexlabel] = bool(
+                        player.enemy_legions(hexlabel)
                     )
+                # If there is an enemy legion and no friendly legion, mark
+                # the hex as a legal move, and stop.
+                if enemy:
+                    if hexlabel not in friendly_hexlabels:
+                        if entry_side is None:
+                            logging.error("")
+                            raise AssertionError("came_from is None")
+                        moves.add((hexlabel, entry_side))
+                    break
+            else:
+                # Final destination
+                # Do not add this hex if already occupied by another friendly
+                # legion.
+                if hexlabel not in ally_hexlabels:
+                    if entry_side is None:
+                        logging.error("")
+                        raise AssertionError("came_from is None")
+                    moves.add((hexlabel, entry_side))
         return moves
 
     def find_nearby_empty_hexes(
@@ -625,27 +757,12 @@ class Game(Observed):
         legion: Legion.Legion,
         masterhex: MasterHex.MasterHex,
         roll: int,
-        came_from: Optional[int],
     ) -> Set[Tuple[int, int]]:
-        """Recursively find empty hexes within roll hexes, for tower
-        teleport"""
-        hexlabel = masterhex.label
+        """Find empty hexes within roll hexes, for tower teleport"""
         moves = set()
-        if not self.all_legions(hexlabel):
-            moves.add((hexlabel, TELEPORT))
-        if roll > 0:
-            for direction, gate in enumerate(masterhex.exits):
-                if direction != came_from:
-                    neighbor = masterhex.neighbors[direction]
-                    if neighbor and (
-                        gate != "NONE"
-                        or neighbor.exits[opposite(direction)] != "NONE"
-                    ):
-                        moves.update(
-                            self.find_nearby_empty_hexes(
-                                legion, neighbor, roll - 1, opposite(direction)
-                            )
-                        )
+        for hexlabel in find_nearby_hexlabels(masterhex, roll):
+            if not self.all_legions(hexlabel):
+                moves.add((hexlabel, TELEPORT))
         return moves
 
     def find_tower_teleport_moves(
@@ -655,9 +772,7 @@ class Game(Observed):
         teleport."""
         moves = set()
         if masterhex.tower and legion.num_lords:
-            moves.update(
-                self.find_nearby_empty_hexes(legion, masterhex, 6, None)
-            )
+            moves.update(self.find_nearby_empty_hexes(legion, masterhex, 6))
             for hexlabel in self.board.get_tower_labels():
                 if hexlabel != masterhex.label and not self.all_legions(
                     hexlabel
@@ -703,6 +818,36 @@ class Game(Observed):
         logging.info(f"{moves=}")
         return moves
 
+    def find_all_moves_for_player(
+        self, player: Player.Player
+    ) -> Dict[str, Set[Tuple[int, int]]]:
+        """Return a dict of markerid to the set of (hexlabel, entry_side)
+        tuples describing where each of player's unmoved legions can move
+        with player's movement roll.
+
+        The result is kept until the next MoveLegion, UndoMoveLegion,
+        SplitLegion or UndoSplit, or until the turn or the roll changes, so
+        callers must not change it.
+        """
+        roll = player.movement_roll
+        key = (player.name, self.turn, roll)
+        if key != self._player_moves_key:
+            player_moves = {}  # type: Dict[str, Set[Tuple[int, int]]]
+            if roll is not None:
+                has_enemy = {}  # type: Dict[int, bool]
+                for legion in player.unmoved_legions:
+                    masterhex = self.board.hexes[legion.hexlabel]
+                    moves = self.find_normal_moves(
+                        legion, masterhex, roll, has_enemy=has_enemy
+                    )
+                    moves.update(
+                        self.find_all_teleport_moves(legion, masterhex, roll)
+                    )
+                    player_moves[legion.markerid] = moves
+            self._player_moves_key = key
+            self._player_moves = player_moves
+        return self._player_moves
+
     def can_move_legion(
         self,
         player: Player.Player,
@@ -768,6 +913,7 @@ class Game(Observed):
             return
         previous_hexlabel = legion.hexlabel
         legion.move(hexlabel, teleport, teleporting_lord, entry_side)
+        self._player_moves_key = None
         action = Action.MoveLegion(
             self.name,
             playername,
@@ -801,6 +947,7 @@ class Game(Observed):
             legion.previous_hexlabel,
         )
         legion.undo_move()
+        self._player_moves_key = None
         self.notify(action)
 
     def done_with_moves(self, playername: str) -> None:
@@ -1487,6 +1634,52 @@ class Game(Observed):
                 return legion2
         return None
 
+    def _build_battle_hex_index(
+        self,
+    ) -> Dict[Optional[str], List[Creature.Creature]]:
+        """Build and return the battle hexlabel: creatures index."""
+        index = {}  # type: Dict[Optional[str], List[Creature.Creature]]
+        for legion in self.battle_legions:
+            for creature in legion.creatures:
+                index.setdefault(creature.hexlabel, []).append(creature)
+        self._battle_hex_index = index
+        return index
+
+    def battle_legion_changed(self, legion: Legion.Legion) -> None:
+        """Reset the battle hex index if legion, which has gained or lost
+        creatures, is in the battle.
+
+        Called from Legion.creatures_changed.  The index is rebuilt on the
+        next lookup, so a summon or undone recruit costs one rebuild.
+        """
+        if legion is self.attacker_legion or legion is self.defender_legion:
+            self._battle_hex_index = None
+
+    def battle_creature_moved(
+        self, creature: Creature.Creature, old_hexlabel: Optional[str]
+    ) -> None:
+        """Update the battle hex index after creature's hexlabel changed
+        from old_hexlabel.
+
+        Called from Creature, including for the AI's temporary moves.
+        """
+        index = self._battle_hex_index
+        if index is None:
+            return
+        creatures = index.get(old_hexlabel)
+        if not creatures:
+            return
+        # Creature.__eq__ compares hexlabels, so match by identity.
+        for ii, creature2 in enumerate(creatures):
+            if creature2 is creature:
+                del creatures[ii]
+                break
+        else:
+            return
+        if not creatures:
+            del index[old_hexlabel]
+        index.setdefault(creature.hexlabel, []).append(creature)
+
     def creatures_in_battle_hex(
         self, hexlabel: str, name: Optional[str] = None
     ) -> Set[Creature.Creature]:
@@ -1494,20 +1687,73 @@ class Game(Observed):
 
         If name is not None, then return only creatures with that name.
         """
+        index = self._battle_hex_index
+        if index is None:
+            index = self._build_battle_hex_index()
+        if name is None:
+            return set(index.get(hexlabel, ()))
         creatures = set()
-        for legion in self.battle_legions:
-            for creature in legion.creatures:
-                if creature.hexlabel == hexlabel:
-                    if name is None or creature.name == name:
-                        creatures.add(creature)
+        for creature in index.get(hexlabel, ()):
+            if creature.name == name:
+                creatures.add(creature)
         return creatures
 
     def is_battle_hex_occupied(self, hexlabel: str) -> bool:
         """Return True iff there's a creature in the hex with hexlabel."""
-        return bool(self.creatures_in_battle_hex(hexlabel))
+        index = self._battle_hex_index
+        if index is None:
+            index = self._build_battle_hex_index()
+        return hexlabel in index
+
+    def occupied_battle_hex_mask(self) -> int:
+        """Return a bitmask of all battle hexes that contain creatures.
+
+        See BattleMap.hexlabel_to_bit.
+        """
+        mask = 0
+        for legion in self.battle_legions:
+            for creature in legion.creatures:
+                if creature.hexlabel is not None:
+                    mask |= BattleMap.hexlabel_to_bit[creature.hexlabel]
+        return mask
+
+    def battle_legion_hex_mask(self, legion: Legion.Legion) -> int:
+        """Return a bitmask of the battle hexes that contain live onboard
+        creatures from legion.
+
+        See BattleMap.hexlabel_to_bit.
+        """
+        mask = 0
+        for creature in legion.creatures:
+            if (
+                not creature.dead
+                and not creature.offboard
+                and creature.hexlabel is not None
+            ):
+                mask |= BattleMap.hexlabel_to_bit[creature.hexlabel]
+        return mask
+
+    @property
+    def attacker_hex_mask(self) -> int:
+        """Return a bitmask of the battle hexes held by the attacker."""
+        if self.attacker_legion is None:
+            return 0
+        return self.battle_legion_hex_mask(self.attacker_legion)
+
+    @property
+    def defender_hex_mask(self) -> int:
+        """Return a bitmask of the battle hexes held by the defender."""
+        if self.defender_legion is None:
+            return 0
+        return self.battle_legion_hex_mask(self.defender_legion)
 
     def battle_hex_entry_cost(
-        self, creature: Creature.Creature, terrain: str, border: Optional[str]
+        self,
+        creature: Creature.Creature,
+        terrain: str,
+        border: Optional[str],
+        terrain_bit: Optional[int] = None,
+        border_bit: Optional[int] = None,
     ) -> int:
         """Return the cost for creature to enter a battle hex with terrain,
         crossing border.  For fliers, this means landing in the hex, not
@@ -1515,26 +1761,35 @@ class Game(Observed):
 
         If the creature cannot enter the hex, return maxsize.
 
+        terrain_bit and border_bit are the Creature.hazard_to_bit bits of
+        terrain and border, which callers with a BattleHex can pass to save
+        looking them up.
+
         This does not take other creatures in the hex into account.
         """
+        native = creature.creature_type.native_mask
+        if terrain_bit is None:
+            terrain_bit = Creature.hazard_to_bit.get(terrain, 0)
         cost = 1
         # terrains
         if terrain in ["Tree"]:
             return maxsize
         elif terrain in ["Bog", "Volcano"]:
-            if not creature.is_native(terrain):
+            if not native & terrain_bit:
                 return maxsize
         elif terrain in ["Bramble", "Drift"]:
-            if not creature.is_native(terrain):
+            if not native & terrain_bit:
                 cost += 1
         elif terrain in ["Sand"]:
-            if not creature.is_native(terrain) and not creature.flies:
+            if not native & terrain_bit and not creature.flies:
                 cost += 1
         # borders
         if border is None:
             pass
         elif border in ["Slope"]:
-            if not creature.is_native(border) and not creature.flies:
+            if border_bit is None:
+                border_bit = Creature.hazard_to_bit[border]
+            if not native & border_bit and not creature.flies:
                 cost += 1
         elif border in ["Wall"]:
             if not creature.flies:
@@ -1545,17 +1800,24 @@ class Game(Observed):
         return cost
 
     def battle_hex_flyover_cost(
-        self, creature: Creature.Creature, terrain: str
+        self,
+        creature: Creature.Creature,
+        terrain: str,
+        terrain_bit: Optional[int] = None,
     ) -> int:
         """Return the cost for creature to fly over the hex with terrain.
         This does not include landing in the hex.
 
         If the creature cannot fly over the hex, return maxsize.
+
+        terrain_bit is as for battle_hex_entry_cost.
         """
         if not creature.flies:
             return maxsize
         if terrain in ["Volcano"]:
-            if not creature.is_native(terrain):
+            if terrain_bit is None:
+                terrain_bit = Creature.hazard_to_bit[terrain]
+            if not creature.creature_type.native_mask & terrain_bit:
                 return maxsize
         return 1
 
@@ -1565,77 +1827,114 @@ class Game(Observed):
         hexlabel: str,
         movement_left: int,
         ignore_mobile_allies: bool = False,
+        blocked: Optional[int] = None,
+        battlemap: Optional[BattleMap.BattleMap] = None,
     ) -> Set[str]:
         """Return a set of all hexlabels to which creature can move,
         starting from hexlabel, with movement_left.
 
         Do not include hexlabel itself.
+
+        blocked is a bitmask of the hexes that other creatures block, as
+        returned by _blocked_battle_hex_mask, which is used if it is None.
+
+        battlemap defaults to the current battle's.
+
+        This is a uniform-cost search that expands each hex once, with the
+        most movement that can be left on arrival there.  Whether a hex can
+        be passed through does not depend on the path taken, so keeping only
+        the best remaining movement per hex loses nothing.
         """
         result = set()  # type: Set[str]
-        if self.battlemap is None:
+        if battlemap is None:
+            battlemap = self.battlemap
+        if battlemap is None:
             return result
         if movement_left <= 0:
             return result
-        hex1 = self.battlemap.hexes[hexlabel]
-        for hexside, hex2 in hex1.neighbors.items():
-            creatures = self.creatures_in_battle_hex(hex2.label)
-            creature2 = None  # type: Optional[Creature.Creature]
-            if creatures:
-                creature2 = creatures.pop()
-            if (
-                creature.flies
-                or creature2 is None
-                or (
-                    ignore_mobile_allies
-                    and creature2.legion == creature.legion
-                    and creature2.mobile
-                )
-            ):
+        if blocked is None:
+            blocked = self._blocked_battle_hex_mask(
+                creature, ignore_mobile_allies
+            )
+        hexes = battlemap.hexes
+        # hexlabel: most movement left on arrival
+        best_left = {hexlabel: movement_left}  # type: Dict[str, int]
+        # heap of (-movement_left, hexlabel)
+        frontier = [(-movement_left, hexlabel)]  # type: List[Tuple[int, str]]
+        while frontier:
+            neg_left, hexlabel1 = heapq.heappop(frontier)
+            left = -neg_left
+            if left < best_left[hexlabel1]:
+                continue
+            hex1 = hexes[hexlabel1]
+            for hexside, hex2 in hex1.neighbors.items():
+                open_hex = not blocked & BattleMap.hexlabel_to_bit[hex2.label]
+                if not creature.flies and not open_hex:
+                    continue
                 if hex1.entrance:
                     # Ignore hexside penalties from entrances.  There aren't
                     # any on the standard boards, and this avoids having to
                     # properly compute the real hexside.
                     border = None
+                    border_bit = 0
                 else:
-                    border = hex1.opposite_border(hexside)
+                    # Same as hex1.opposite_border(hexside), inlined
+                    hexside2 = (hexside + 3) % 6
+                    border = hex2.borders[hexside2]
+                    border_bit = hex2.border_bits[hexside2]
                 cost = self.battle_hex_entry_cost(
-                    creature, hex2.terrain, border
+                    creature,
+                    hex2.terrain,
+                    border,
+                    hex2.terrain_bit,
+                    border_bit,
                 )
-                if cost <= movement_left:
-                    creature2 = None
-                    creatures = self.creatures_in_battle_hex(hex2.label)
-                    if creatures:
-                        creature2 = creatures.pop()
-                    if creature2 is None or (
-                        ignore_mobile_allies
-                        and creature2.legion == creature.legion
-                        and creature2.mobile
-                    ):
-                        result.add(hex2.label)
+                if cost <= left and open_hex:
+                    result.add(hex2.label)
                 if creature.flies:
                     flyover_cost = self.battle_hex_flyover_cost(
-                        creature, hex2.terrain
+                        creature, hex2.terrain, hex2.terrain_bit
                     )
                 else:
                     flyover_cost = maxsize
                 min_cost = min(cost, flyover_cost)
-                if min_cost < movement_left:
-                    result.update(
-                        self._find_battle_moves_inner(
-                            creature,
-                            hex2.label,
-                            movement_left - min_cost,
-                            ignore_mobile_allies,
-                        )
-                    )
+                if min_cost < left:
+                    left2 = left - min_cost
+                    if left2 > best_left.get(hex2.label, 0):
+                        best_left[hex2.label] = left2
+                        heapq.heappush(frontier, (-left2, hex2.label))
         result.discard(hexlabel)
         return result
 
+    def _blocked_battle_hex_mask(
+        self, creature: Creature.Creature, ignore_mobile_allies: bool
+    ) -> int:
+        """Return a bitmask of the battle hexes that creature cannot land
+        in, or walk through, because of other creatures.
+
+        See BattleMap.hexlabel_to_bit.
+        """
+        mask = 0
+        for legion in self.battle_legions:
+            for creature2 in legion.creatures:
+                if creature2.hexlabel is not None and not (
+                    ignore_mobile_allies
+                    and creature2.legion == creature.legion
+                    and creature2.mobile
+                ):
+                    mask |= BattleMap.hexlabel_to_bit[creature2.hexlabel]
+        return mask
+
     def find_battle_moves(
         self, creature: Creature.Creature, ignore_mobile_allies: bool = False
     ) -> Set[str]:
         """Return a set of all hexlabels to which creature can move,
-        excluding its current hex."""
+        excluding its current hex.
+
+        Results are memoized.  The key includes a mask of the hexes blocked
+        by other creatures, so moving any creature invalidates the entries
+        that it affects.
+        """
         result = set()  # type: Set[str]
         if self.battlemap is None:
             return result
@@ -1654,9 +1953,51 @@ class Game(Observed):
                 if not self.is_battle_hex_occupied(hexlabel2):
                     result.add(hexlabel2)
             return result
-        return self._find_battle_moves_inner(
-            creature, creature.hexlabel, creature.skill, ignore_mobile_allies
+        return self.find_blocked_battle_moves(
+            creature,
+            creature.hexlabel,
+            self._blocked_battle_hex_mask(creature, ignore_mobile_allies),
+        )
+
+    def find_blocked_battle_moves(
+        self,
+        creature: Creature.Creature,
+        hexlabel: str,
+        blocked: int,
+        battlemap: Optional[BattleMap.BattleMap] = None,
+    ) -> Set[str]:
+        """Return a set of all hexlabels to which creature could move from
+        hexlabel, excluding hexlabel, if other creatures blocked the hexes
+        in the bitmask blocked.
+
+        This ignores creature's own position and state, so that it can be
+        used for positions that aren't on the board, as in BattleSnapshot.
+        battlemap defaults to the current battle's, but can be any, so that
+        battles can be simulated before they start.  Results are memoized.
+        """
+        if battlemap is None:
+            battlemap = self.battlemap
+        key = (
+            battlemap,
+            creature.name,
+            hexlabel,
+            creature.skill,
+            blocked,
         )
+        moves = self._battle_moves_cache.get(key)
+        if moves is None:
+            moves = self._find_battle_moves_inner(
+                creature,
+                hexlabel,
+                creature.skill,
+                blocked=blocked,
+                battlemap=battlemap,
+            )
+            if len(self._battle_moves_cache) >= MAX_BATTLE_MOVES_CACHE:
+                self._battle_moves_cache.clear()
+            self._battle_moves_cache[key] = moves
+        # Callers may modify the returned set.
+        return set(moves)
 
     def move_creature(
         self,
@@ -2,9 +2,14 @@ from __future__ import annotations
 
 import logging
 from functools import cmp_to_key
-from typing import Any, Generator, List, Optional, Set, Tuple
-
-from slugathon.data import markerdata, playercolordata, recruitdata
+from typing import Any, Dict, Generator, List, Optional, Set, Tuple
+
+from slugathon.data import (
+    creaturedata,
+    markerdata,
+    playercolordata,
+    recruitdata,
+)
 from slugathon.game import Action, Caretaker, Creature, Player
 from slugathon.util.bag import bag
 from slugathon.util.Observed import Observed
@@ -13,12 +18,126 @@ __copyright__ = "Copyright (c) 2004-2021 David Ripton"
 __license__ = "GNU GPL v2"
 
 
+# Maximum number of entries in _recruits_cache
+MAX_RECRUITS_CACHE = 10000
+
+# Kinds of compiled recruiting rules
+ANY_RECRUITER = 0
+GUARDIAN_RECRUITERS = 1
+RECRUIT_UP = 2
+RECRUIT_DOWN = 3
+
+
 def find_picname(markerid: str) -> str:
     color_name = playercolordata.abbrev_to_name[markerid[:2]]
     index = int(markerid[2:]) - 1
     return markerdata.data[color_name][index]
 
 
+def _gen_sublists(recruits: List[Tuple]) -> Generator[List[Tuple], None, None]:
+    """Generate a sublist of recruits, within which up- and down-recruiting
+    is possible."""
+    sublist = []
+    for tup in recruits:
+        if tup:
+            sublist.append(tup)
+        else:
+            yield sublist
+            sublist = []
+    yield sublist
+
+
+def _compile_recruits(
+    recruits: List[Tuple],
+) -> List[Tuple[int, str, str, int]]:
+    """Compile one terrain's recruitdata into a list of rules, in the order
+    that Legion.available_recruits_and_recruiters should try them.
+
+    Each rule is (kind, recruit, recruiter, num).  An ANY_RECRUITER rule
+    needs no recruiter.  A GUARDIAN_RECRUITERS rule needs num of any one
+    creature type.  RECRUIT_UP and RECRUIT_DOWN rules need num of
+    recruiter.
+    """
+    rules = []  # type: List[Tuple[int, str, str, int]]
+    for sublist in _gen_sublists(recruits):
+        names = [tup[0] for tup in sublist]
+        nums = [tup[1] for tup in sublist]
+        for ii in range(len(sublist)):
+            name = names[ii]
+            num = nums[ii]
+            prev = None  # type: Optional[str]
+            if ii >= 1:
+                prev = names[ii - 1]
+            # Every creature up to and including this one, if recruitable.
+            lower_names = [names[jj] for jj in range(ii + 1) if nums[jj]]
+            if prev == recruitdata.ANYTHING:
+                # basic tower creature
+                for recruit in lower_names:
+                    rules.append((ANY_RECRUITER, recruit, "", 0))
+                continue
+            if prev == recruitdata.CREATURE:
+                # guardian
+                for recruit in lower_names:
+                    rules.append((GUARDIAN_RECRUITERS, recruit, "", num))
+            elif prev is not None and num:
+                rules.append((RECRUIT_UP, name, prev, num))
+            if num:
+                # recruit same or down
+                for recruit in lower_names:
+                    rules.append((RECRUIT_DOWN, recruit, name, 1))
+    return rules
+
+
+# terrain: rules, for Legion.available_recruits_and_recruiters
+_recruit_rules = {
+    terrain: _compile_recruits(recruits)
+    for terrain, recruits in recruitdata.data.items()
+}  # type: Dict[str, List[Tuple[int, str, str, int]]]
+
+# terrain: the names of every creature that can be recruited there
+_recruit_names = {
+    terrain: tuple(sorted({rule[1] for rule in rules}))
+    for terrain, rules in _recruit_rules.items()
+}  # type: Dict[str, Tuple[str, ...]]
+
+# Terrains with GUARDIAN_RECRUITERS rules
+_guardian_terrains = {
+    terrain
+    for terrain, rules in _recruit_rules.items()
+    if any(rule[0] == GUARDIAN_RECRUITERS for rule in rules)
+}  # type: Set[str]
+
+# The names of creatures (not lords or demi-lords), which can recruit
+# guardians
+_creature_type_names = {
+    name for name, tup in creaturedata.data.items() if tup[5] == "creature"
+}  # type: Set[str]
+
+# (terrain, living creature counts, max creatures of one type,
+#  availability of each recruit): recruits and recruiters
+_recruits_cache = {}  # type: Dict[Tuple, List[Tuple[str, ...]]]
+
+
+def _cmp_recruits(tup1: Tuple[str, ...], tup2: Tuple[str, ...]) -> int:
+    ii = 0
+    while True:
+        if len(tup1) < ii + 1:
+            return -1
+        if len(tup2) < ii + 1:
+            return 1
+        if tup1[ii] != tup2[ii]:
+            diff = 100 * (
+                Creature.name_to_creature_type[tup1[ii]].sort_value
+                - Creature.name_to_creature_type[tup2[ii]].sort_value
+            )
+            if diff != 0:
+                return int(diff)
+        ii += 1
+
+
+_recruits_sort_key = cmp_to_key(_cmp_recruits)
+
+
 class Legion(Observed):
     def __init__(
         self,
@@ -33,7 +152,9 @@ class Legion(Observed):
         self.creatures = creatures  # type: List[Creature.Creature]
         for creature in self.creatures:
             creature.legion = self
-        self.hexlabel = hexlabel  # type: int
+        self._hexlabel = hexlabel  # type: int
+        # The Player.LegionDict that holds this legion, if any
+        self._owner = None  # type: Optional[Player.LegionDict]
         self.player = player  # type: Player.Player
         self.moved = False  # type: bool
         self.teleported = False  # type: bool
@@ -45,6 +166,16 @@ class Legion(Observed):
         self._angels_pending = 0  # type: int
         self._archangels_pending = 0  # type: int
 
+    @property
+    def hexlabel(self) -> int:
+        return self._hexlabel
+
+    @hexlabel.setter
+    def hexlabel(self, hexlabel: int) -> None:
+        if self._owner is not None:
+            self._owner.move_legion(self, hexlabel)
+        self._hexlabel = hexlabel
+
     @property
     def dead(self) -> bool:
         """Return True iff this legion has been eliminated from battle."""
@@ -198,14 +329,28 @@ class Legion(Observed):
         creature = Creature.Creature(creature_name)
         creature.legion = self
         self.creatures.append(creature)
+        self.creatures_changed()
 
     def remove_creature_by_name(self, creature_name: str) -> None:
         for creature in self.creatures:
             if creature.name == creature_name:
                 self.creatures.remove(creature)
+                self.creatures_changed()
                 return
         raise ValueError("tried to remove missing creature")
 
+    def creatures_changed(self) -> None:
+        """Tell the game that creatures joined or left this legion, so
+        that it can reset its battle hex index.
+
+        Code that adds creatures to or removes them from a legion that
+        might be in a battle must call this.
+        """
+        player = self.player
+        if player is None or player.game is None:
+            return
+        player.game.battle_legion_changed(self)
+
     def can_be_split(self, turn: int) -> bool:
         if turn == 1:
             return len(self) == 8
@@ -256,12 +401,14 @@ class Legion(Observed):
                     self.creatures.append(creature)
                     creature.legion = self
                     count2 -= 1
+            self.creatures_changed()
 
     def forget_creatures(self) -> None:
         """Make all creatures Unknown."""
         self.creatures = Creature.n2c(len(self) * ["Unknown"])
         for creature in self.creatures:
             creature.legion = self
+        self.creatures_changed()
 
     def move(
         self,
@@ -303,27 +450,13 @@ class Legion(Observed):
     def can_flee(self) -> bool:
         return self.num_lords == 0
 
-    def _gen_sublists(
-        self, recruits: List[Tuple]
-    ) -> Generator[List[Tuple], None, None]:
-        """Generate a sublist of recruits, within which up- and down-recruiting
-        is possible."""
-        sublist = []
-        for tup in recruits:
-            if tup:
-                sublist.append(tup)
-            else:
-                yield sublist
-                sublist = []
-        yield sublist
-
     def _max_creatures_of_one_type(self) -> int:
         """Return the maximum number of creatures (not lords or demi-lords) of
         the same type in this legion."""
         counts = bag(self.creature_names)  # type: bag[str]
         maximum = 0
         for name, num in counts.items():
-            if num > maximum and Creature.Creature(name).is_creature:
+            if num > maximum and name in _creature_type_names:
                 maximum = num
         return maximum
 
@@ -378,76 +511,46 @@ class Legion(Observed):
         recruiters (if any) as its remaining elements.
 
         The list is sorted in the same order as within recruitdata.
+
+        recruitdata is compiled into _recruit_rules at import, and results
+        are kept in _recruits_cache, keyed on everything they depend on.
         """
-        result_list = []  # type: List[Tuple[str, ...]]
         counts = bag(self.living_creature_names)  # type: bag[str]
-        recruits = recruitdata.data[mterrain]
-        for sublist in self._gen_sublists(recruits):
-            names = [tup[0] for tup in sublist]
-            nums = [tup[1] for tup in sublist]
-            for ii in range(len(sublist)):
-                name = names[ii]
-                num = nums[ii]
-                prev = None  # type: Optional[str]
-                if ii >= 1:
-                    prev = names[ii - 1]
-                if prev == recruitdata.ANYTHING:
-                    # basic tower creature
-                    for jj in range(ii + 1):
-                        if nums[jj] and caretaker.counts.get(names[jj]):
-                            result_list.append((names[jj],))
-                else:
-                    if (
-                        prev == recruitdata.CREATURE
-                        and self._max_creatures_of_one_type() >= num
-                    ):
-                        # guardian
-                        recruiters = []
-                        for name2, num2 in counts.items():
-                            if (
-                                num2 >= num
-                                and Creature.Creature(name2).is_creature
-                            ):
-                                recruiters.append(name2)
-                        for jj in range(ii + 1):
-                            if nums[jj] and caretaker.counts.get(names[jj]):
-                                for recruiter in recruiters:
-                                    li = [names[jj]]
-                                    for kk in range(num):
-                                        li.append(recruiter)
-                                    tup = tuple(li)
-                                    result_list.append(tup)
-                    if prev is not None and counts[prev] >= num:
-                        # recruit up
-                        if num and caretaker.counts.get(name):
-                            li = [name]
-                            for kk in range(num):
-                                li.append(prev)
-                            tup = tuple(li)
-                            result_list.append(tup)
-                    if counts[name] and num:
-                        # recruit same or down
-                        for jj in range(ii + 1):
-                            if nums[jj] and caretaker.counts.get(names[jj]):
-                                result_list.append((names[jj], name))
-
-        def cmp_helper(tup1: Tuple[str, ...], tup2: Tuple[str, ...]) -> int:
-            ii = 0
-            while True:
-                if len(tup1) < ii + 1:
-                    return -1
-                if len(tup2) < ii + 1:
-                    return 1
-                if tup1[ii] != tup2[ii]:
-                    c1 = Creature.Creature(tup1[ii])
-                    c2 = Creature.Creature(tup2[ii])
-                    diff = 100 * (c1.sort_value - c2.sort_value)
-                    if diff != 0:
-                        return int(diff)
-                ii += 1
-
-        result_list.sort(key=cmp_to_key(cmp_helper))
-        return result_list
+        counts_items = tuple(counts.items())
+        if mterrain in _guardian_terrains:
+            max_one = self._max_creatures_of_one_type()
+        else:
+            max_one = 0
+        available = tuple(
+            bool(caretaker.counts.get(name))
+            for name in _recruit_names[mterrain]
+        )
+        key = (mterrain, counts_items, max_one, available)
+        result_list = _recruits_cache.get(key)
+        if result_list is None:
+            result_list = []
+            available_names = {
+                name
+                for name, avail in zip(_recruit_names[mterrain], available)
+                if avail
+            }
+            for kind, recruit, recruiter, num in _recruit_rules[mterrain]:
+                if recruit not in available_names:
+                    continue
+                if kind == ANY_RECRUITER:
+                    result_list.append((recruit,))
+                elif kind == GUARDIAN_RECRUITERS:
+                    if max_one >= num:
+                        for name, num2 in counts_items:
+                            if num2 >= num and name in _creature_type_names:
+                                result_list.append((recruit,) + (name,) * num)
+                elif counts[recruiter] >= num:
+                    result_list.append((recruit,) + (recruiter,) * num)
+            result_list.sort(key=_recruits_sort_key)
+            if len(_recruits_cache) >= MAX_RECRUITS_CACHE:
+                _recruits_cache.clear()
+            _recruits_cache[key] = result_list
+        return list(result_list)
 
     def recruit_creature(
         self, creature: Creature.Creature, recruiter_names: Tuple[str, ...]
@@ -472,6 +575,7 @@ class Legion(Observed):
             self.creatures.append(creature)
             self.recruiter_names_list.append(recruiter_names)
             creature.legion = self
+            self.creatures_changed()
             self.reveal_creatures([creature.name] + list(recruiter_names))
             self.recruited = True
 
@@ -482,6 +586,7 @@ class Legion(Observed):
             return
         player = self.player
         creature = self.creatures.pop()
+        self.creatures_changed()
         recruiter_names = self.recruiter_names_list.pop()
         logging.info(f"{self=} clearing self.recruited")
         self.recruited = False
@@ -503,6 +608,7 @@ class Legion(Observed):
             return
         player = self.player
         creature = self.creatures.pop()
+        self.creatures_changed()
         recruiter_names = self.recruiter_names_list.pop()
         logging.info(f"{self=} clearing self.recruited")
         self.recruited = False
@@ -616,8 +722,9 @@ class Legion(Observed):
 
     def add_points(self, points: int, can_acquire_angels: bool) -> None:
         logging.info(f"{self=} {points=} {can_acquire_angels=}")
-        ARCHANGEL_POINTS = Creature.Creature("Archangel").acquirable_every
-        ANGEL_POINTS = Creature.Creature("Angel").acquirable_every
+        creature_types = Creature.name_to_creature_type
+        ARCHANGEL_POINTS = creature_types["Archangel"].acquirable_every
+        ANGEL_POINTS = creature_types["Angel"].acquirable_every
         player = self.player
         score0 = player.score
         score1 = score0 + points
@@ -714,6 +821,7 @@ class Legion(Observed):
             caretaker.take_one(angel.name)
             self.creatures.append(angel)
             angel.legion = self
+        self.creatures_changed()
         self._angels_pending = 0
         self._archangels_pending = 0
         logging.info(f"end of acquire_angels {self=}")
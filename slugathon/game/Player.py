@@ -1,7 +1,16 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, List, Optional, Set
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from twisted.internet import reactor
 
@@ -54,7 +63,7 @@ class Player(Observed):
         # Private to this instance; not shown to others until a
         # legion is actually split off with this marker.
         self.selected_markerid = None  # type: Optional[str]
-        self.markerid_to_legion = {}  # type: Dict[str, Legion.Legion]
+        self._markerid_to_legion = LegionDict()
         self.mulligans_left = 1
         self.movement_roll = None  # type: Optional[int]
         self.summoned = False
@@ -62,6 +71,18 @@ class Player(Observed):
         self.last_donor = None  # type: Optional[Legion.Legion]
         self.has_titan = True
 
+    @property
+    def markerid_to_legion(self) -> LegionDict:
+        """Return a dict of markerid to Legion, for this player's legions."""
+        return self._markerid_to_legion
+
+    @markerid_to_legion.setter
+    def markerid_to_legion(self, markerid_to_legion: Dict) -> None:
+        if markerid_to_legion is self._markerid_to_legion:
+            return
+        self._markerid_to_legion.clear()
+        self._markerid_to_legion.update(markerid_to_legion)
+
     @property
     def legions(self) -> List[Legion.Legion]:
         return list(self.markerid_to_legion.values())
@@ -348,13 +369,9 @@ class Player(Observed):
         self, hexlabel: Optional[int] = None
     ) -> Set[Legion.Legion]:
         """Return a set of this player's legions, in hexlabel if not None."""
-        return set(
-            [
-                legion
-                for legion in self.legions
-                if hexlabel in (None, legion.hexlabel)
-            ]
-        )
+        if hexlabel is None:
+            return set(self.markerid_to_legion.values())
+        return set(self.markerid_to_legion.legions_in(hexlabel))
 
     def enemy_legions(
         self, hexlabel: Optional[int] = None
@@ -378,13 +395,10 @@ class Player(Observed):
         if not self.moved_legions:
             return False
         assert self.movement_roll is not None
+        player_moves = self.game.find_all_moves_for_player(self)
         for legion in self.friendly_legions():
             if len(self.friendly_legions(legion.hexlabel)) >= 2:
-                if not legion.moved and self.game.find_all_moves(
-                    legion,
-                    self.game.board.hexes[legion.hexlabel],
-                    self.movement_roll,
-                ):
+                if not legion.moved and player_moves.get(legion.markerid):
                     return False
                 # else will need to recombine
         return True
@@ -570,6 +584,7 @@ class Player(Observed):
         if not legion.creatures or legion.creatures[-1].name != creature_name:
             return
         legion.creatures.pop()
+        legion.creatures_changed()
         donor.add_creature_by_name(creature_name)
         creature = donor.creatures[-1]
         creature.legion = donor
@@ -677,3 +692,99 @@ class Player(Observed):
         """Withdraw from the game."""
         action = Action.Withdraw(self.game.name, self.name)
         self.notify(action)
+
+
+class LegionDict(dict):
+    """A dict of markerid to Legion that also indexes its legions by
+    masterboard hex, so that finding the legions in a hex is cheap.
+
+    Each legion tells the LegionDict that holds it when it moves, so the
+    index stays right however the legion's hexlabel is changed.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        dict.__init__(self)
+        # hexlabel: legions there
+        self.hexlabel_to_legions = {}  # type: Dict[int, Set[Legion.Legion]]
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, markerid: str, legion: Legion.Legion) -> None:
+        if markerid in self:
+            self._remove(self[markerid])
+        dict.__setitem__(self, markerid, legion)
+        legion._owner = self
+        self.hexlabel_to_legions.setdefault(legion.hexlabel, set()).add(legion)
+
+    def __delitem__(self, markerid: str) -> None:
+        self._remove(self[markerid])
+        dict.__delitem__(self, markerid)
+
+    def pop(self, markerid: str, *args: Any) -> Any:
+        if markerid in self:
+            legion = self[markerid]
+            del self[markerid]
+            return legion
+        return dict.pop(self, markerid, *args)
+
+    def popitem(self) -> Tuple[str, Legion.Legion]:
+        markerid, legion = dict.popitem(self)
+        self._remove(legion)
+        return markerid, legion
+
+    def setdefault(self, markerid: str, legion: Any = None) -> Any:
+        if markerid not in self:
+            self[markerid] = legion
+        return self[markerid]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for markerid, legion in dict(*args, **kwargs).items():
+            self[markerid] = legion
+
+    def clear(self) -> None:
+        for legion in self.values():
+            legion._owner = None
+        dict.clear(self)
+        self.hexlabel_to_legions.clear()
+
+    def _remove(self, legion: Legion.Legion) -> None:
+        """Remove legion from the hex index."""
+        legion._owner = None
+        self._unindex(legion, legion.hexlabel)
+
+    def _unindex(self, legion: Legion.Legion, hexlabel: int) -> None:
+        legions = self.hexlabel_to_legions.get(hexlabel)
+        if legions is not None:
+            legions.discard(legion)
+            if not legions:
+                del self.hexlabel_to_legions[hexlabel]
+
+    def move_legion(self, legion: Legion.Legion, hexlabel: int) -> None:
+        """Update the hex index for legion moving to hexlabel.
+
+        Called by Legion before its hexlabel changes.
+        """
+        self._unindex(legion, legion.hexlabel)
+        self.hexlabel_to_legions.setdefault(hexlabel, set()).add(legion)
+
+    def legions_in(self, hexlabel: int) -> AbstractSet[Legion.Legion]:
+        """Return the set of legions in hexlabel.
+
+        The set belongs to the index, so callers must not change it.
+        """
+        return self.hexlabel_to_legions.get(hexlabel, _no_legions)
+
+    def check(self) -> None:
+        """Raise AssertionError if the hex index does not match the
+        legions."""
+        hexlabel_to_legions = {}  # type: Dict[int, Set[Legion.Legion]]
+        for legion in self.values():
+            assert legion._owner is self, legion
+            hexlabel_to_legions.setdefault(legion.hexlabel, set()).add(legion)
+        assert self.hexlabel_to_legions == hexlabel_to_legions, (
+            self.hexlabel_to_legions,
+            hexlabel_to_legions,
+        )
+
+
+# Returned by LegionDict.legions_in for empty hexes
+_no_legions = frozenset()  # type: FrozenSet[Legion.Legion]
@@ -476,11 +476,9 @@ class GUIMasterBoard(Gtk.EventBox):
                     legion = self.selected_marker.legion
                     assert legion.player is not None
                     assert legion.player.movement_roll is not None
-                    all_moves = self.game.find_all_moves(
-                        legion,
-                        self.board.hexes[legion.hexlabel],
-                        legion.player.movement_roll,
-                    )
+                    all_moves = self.game.find_all_moves_for_player(
+                        legion.player
+                    ).get(legion.markerid, set())
                     moves = [
                         m for m in all_moves if m[0] == guihex.masterhex.label
                     ]
@@ -674,10 +672,8 @@ class GUIMasterBoard(Gtk.EventBox):
                     logging.warning("movement_roll is None; timing problem?")
                     moves = set()
                 else:
-                    moves = self.game.find_all_moves(
-                        legion,
-                        self.board.hexes[legion.hexlabel],
-                        player.movement_roll,
+                    moves = self.game.find_all_moves_for_player(player).get(
+                        legion.markerid, set()
                     )
             if moves:
                 self.selected_marker = marker
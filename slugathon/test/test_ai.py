@@ -1,8 +1,17 @@
+import itertools
+import random
 import time
-from typing import List, Set
+from typing import List, Set, Tuple
 
 from slugathon.ai import CleverBot
-from slugathon.game import Creature, Game, Phase
+from slugathon.game import (
+    BattleMap,
+    BattleSnapshot,
+    Creature,
+    Game,
+    Legion,
+    Phase,
+)
 
 __copyright__ = "Copyright (c) 2012 David Ripton"
 __license__ = "GNU GPL v2"
@@ -192,6 +201,32 @@ def test_gen_legion_moves() -> None:
     assert lm == []
 
 
+def test_gen_legion_moves_random() -> None:
+    cleverbot = CleverBot.CleverBot("player", 1)
+    hexlabels = sorted(BattleMap.all_labels)
+    rand = random.Random(3)
+    for trial in range(20):
+        movesets = [
+            set(rand.sample(hexlabels, rand.randint(1, 7)))
+            for ii in range(rand.randint(1, 5))
+        ]
+        expected = sorted(
+            list(moves)
+            for moves in itertools.product(*movesets)
+            if len(set(moves)) == len(moves)
+        )
+        assert sorted(cleverbot._gen_legion_moves(movesets)) == expected
+
+
+def test_gen_legion_moves_lazy() -> None:
+    cleverbot = CleverBot.CleverBot("player", 1)
+    hexlabels = {"A1", "A2", "A3", "B1", "B2", "B3", "B4"}
+    movesets = 7 * [hexlabels]
+    legion_moves = cleverbot._gen_legion_moves(movesets)
+    for legion_move in itertools.islice(legion_moves, 100):
+        assert set(legion_move) == hexlabels
+
+
 def test_score_legion_move_brush() -> None:
     now = time.time()
     game = Game.Game("g1", "p0", now, now, 2, 6)
@@ -912,6 +947,385 @@ def test_score_legion_move_swamp() -> None:
     a_titan.move("F4")
 
 
+def test_find_best_legion_move() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    player0.pick_marker("Rd02")
+    player0.split_legion(
+        "Rd01",
+        "Rd02",
+        ["Titan", "Centaur", "Ogre", "Gargoyle"],
+        ["Angel", "Centaur", "Ogre", "Gargoyle"],
+    )
+    rd01 = player0.markerid_to_legion["Rd01"]
+    player1.pick_marker("Bu02")
+    player1.split_legion(
+        "Bu01",
+        "Bu02",
+        ["Titan", "Centaur", "Ogre", "Gargoyle"],
+        ["Angel", "Centaur", "Ogre", "Gargoyle"],
+    )
+    bu01 = player1.markerid_to_legion["Bu01"]
+    rd01.creatures.append(Creature.Creature("Ranger"))
+    rd01.creatures.append(Creature.Creature("Gorgon"))
+    bu01.creatures.append(Creature.Creature("Ranger"))
+    bu01.creatures.append(Creature.Creature("Gorgon"))
+    rd01.move(3, False, None, 5)
+    bu01.move(3, False, None, 5)
+    game._init_battle(bu01, rd01)
+    defender = game.defender_legion
+    assert defender is not None
+    attacker = game.attacker_legion
+    assert attacker is not None
+    for creature in defender.creatures:
+        creature.legion = defender
+    for creature in attacker.creatures:
+        creature.legion = attacker
+    for creature, hexlabel in zip(
+        defender.creatures, ["E5", "D5", "C4", "D4", "E4", "F4"]
+    ):
+        creature.hexlabel = hexlabel
+    for creature, hexlabel in zip(
+        attacker.creatures, ["A1", "A2", "B2", "B3", "C2", "C3"]
+    ):
+        creature.hexlabel = hexlabel
+    game.battle_turn = 2
+
+    for legion in [defender, attacker]:
+        cleverbot = CleverBot.CleverBot(legion.player.name, 1)
+        creatures = legion.sorted_living_creatures
+        movesets = []
+        for creature in creatures:
+            assert creature.hexlabel is not None
+            moves = game.find_battle_moves(creature, ignore_mobile_allies=True)
+            moveset = set(sorted(moves)[:3])
+            moveset.add(creature.hexlabel)
+            movesets.append(moveset)
+
+        def score(legion_move: List[str]) -> float:
+            try:
+                for creature, move in zip(creatures, legion_move):
+                    creature.previous_hexlabel = creature.hexlabel
+                    creature.hexlabel = move
+                return cleverbot._score_legion_move(game, creatures)
+            finally:
+                for creature in creatures:
+                    creature.hexlabel = creature.previous_hexlabel
+
+        best_score = max(
+            score(legion_move)
+            for legion_move in cleverbot._gen_legion_moves(movesets)
+        )
+        snapshot = BattleSnapshot.BattleSnapshot(game)
+        indexes = [snapshot.index(creature) for creature in creatures]
+        legion_move = cleverbot._find_best_legion_move(
+            snapshot, indexes, movesets, time.time() + 60
+        )
+        assert legion_move is not None
+        assert score(legion_move) == best_score
+
+        parallel_bot = CleverBot.CleverBot(
+            legion.player.name, 1, ai_processes=2, seed=1
+        )
+        try:
+            legion_move2 = parallel_bot._find_best_legion_move_parallel(
+                snapshot, indexes, movesets, time.time() + 60
+            )
+            # Out of time before any worker can report back.
+            legion_move3 = parallel_bot._find_best_legion_move_parallel(
+                snapshot, indexes, movesets, time.time()
+            )
+        finally:
+            assert parallel_bot._pool is not None
+            parallel_bot._pool.shutdown()
+        assert legion_move2 is not None
+        assert score(legion_move2) == best_score
+        assert legion_move3 is not None
+        assert len(set(legion_move3)) == len(indexes)
+        for move, moveset in zip(legion_move3, movesets):
+            assert move in moveset
+
+
+def test_legion_move_scorer() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    rd01 = player0.markerid_to_legion["Rd01"]
+    bu01 = player1.markerid_to_legion["Bu01"]
+    rd01.creatures.append(Creature.Creature("Ranger"))
+    rd01.creatures.append(Creature.Creature("Gorgon"))
+    bu01.creatures.append(Creature.Creature("Ranger"))
+    bu01.creatures.append(Creature.Creature("Warlock"))
+    rd01.move(3, False, None, 5)
+    bu01.move(3, False, None, 5)
+    game._init_battle(bu01, rd01)
+    defender = game.defender_legion
+    assert defender is not None
+    attacker = game.attacker_legion
+    assert attacker is not None
+    for creature in defender.creatures:
+        creature.legion = defender
+    for creature in attacker.creatures:
+        creature.legion = attacker
+    game.battle_turn = 4
+    battlemap = game.battlemap
+    assert battlemap is not None
+    hexlabels = sorted(
+        hexlabel
+        for hexlabel, battlehex in battlemap.hexes.items()
+        if not battlehex.entrance
+    )
+    rand = random.Random(11)
+    spots = rand.sample(hexlabels, len(attacker) + len(defender))
+    for creature, hexlabel in zip(
+        defender.creatures + attacker.creatures, spots
+    ):
+        creature.hexlabel = hexlabel
+
+    for legion in [defender, attacker]:
+        cleverbot = CleverBot.CleverBot(legion.player.name, 1)
+        creatures = legion.sorted_living_creatures
+        snapshot = BattleSnapshot.BattleSnapshot(game)
+        indexes = [snapshot.index(creature) for creature in creatures]
+        scorer = CleverBot.LegionMoveScorer(cleverbot, snapshot, indexes)
+        for unused in range(200):
+            ii = rand.randrange(len(creatures))
+            occupied = set(scorer.snapshot.hexlabels)
+            hexlabel = rand.choice(
+                [
+                    hexlabel
+                    for hexlabel in hexlabels
+                    if hexlabel not in occupied
+                ]
+            )
+            scorer.move(ii, hexlabel)
+            assert scorer.snapshot.hexlabels[indexes[ii]] == hexlabel
+            # Scoring the live creatures in the same hexes must agree.
+            start_hexlabels = [creature.hexlabel for creature in creatures]
+            try:
+                for creature, index in zip(creatures, indexes):
+                    creature.hexlabel = scorer.snapshot.hexlabels[index]
+                score = cleverbot._score_legion_move(game, creatures)
+            finally:
+                for creature, start_hexlabel in zip(
+                    creatures, start_hexlabels
+                ):
+                    creature.hexlabel = start_hexlabel
+            assert abs(scorer.score - score) < 1e-9
+
+
+def test_strike_plan() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    rd01 = player0.markerid_to_legion["Rd01"]
+    bu01 = player1.markerid_to_legion["Bu01"]
+    rd01.creatures.append(Creature.Creature("Ranger"))
+    rd01.creatures.append(Creature.Creature("Gorgon"))
+    bu01.creatures.append(Creature.Creature("Ranger"))
+    bu01.creatures.append(Creature.Creature("Warlock"))
+    rd01.move(3, False, None, 5)
+    bu01.move(3, False, None, 5)
+    game._init_battle(bu01, rd01)
+    defender = game.defender_legion
+    assert defender is not None
+    attacker = game.attacker_legion
+    assert attacker is not None
+    for creature in defender.creatures:
+        creature.legion = defender
+    for creature in attacker.creatures:
+        creature.legion = attacker
+    game.battle_turn = 4
+    battlemap = game.battlemap
+    assert battlemap is not None
+    # Crowd the middle of the map, so that there are many engagements.
+    hexlabels = sorted(
+        hexlabel
+        for hexlabel, battlehex in battlemap.hexes.items()
+        if not battlehex.entrance and hexlabel[0] in "BCDE"
+    )
+    rand = random.Random(4)
+    num_multiple_targets = 0
+    for unused in range(20):
+        spots = rand.sample(hexlabels, len(attacker) + len(defender))
+        for creature, hexlabel in zip(
+            defender.creatures + attacker.creatures, spots
+        ):
+            creature.hexlabel = hexlabel
+            creature.hits = 0
+            creature.struck = False
+        game.battle_phase = rand.choice([Phase.STRIKE, Phase.COUNTERSTRIKE])
+        legion = rand.choice([attacker, defender])
+        plan = CleverBot.StrikePlan(game, legion)
+        while True:
+            strike = plan.choose_strike()
+            if strike is None:
+                break
+            striker, target, num_dice, strike_number = strike
+            assert num_dice == striker.number_of_dice(target)
+            assert strike_number == striker.strike_number(target)
+            if len(plan.striker_options[striker]) > 1:
+                num_multiple_targets += 1
+            striker.struck = True
+            target.hits = min(
+                target.hits + rand.randrange(num_dice + 1), target.power
+            )
+            plan.update()
+            # Updating must match planning from scratch.
+            plan2 = CleverBot.StrikePlan(game, legion)
+            assert plan.striker_options == plan2.striker_options
+            assert plan.target_totals == plan2.target_totals
+    assert num_multiple_targets > 0
+
+
+def _score_move_order(
+    game: Game.Game, creature_moves: List[Tuple[str, str, str]]
+) -> float:
+    """Return the total sort_value of the creatures that can make their
+    moves in the order of creature_moves."""
+    score = 0.0
+    moved = []
+    try:
+        for creature_name, start, move in creature_moves:
+            creature = game.creatures_in_battle_hex(start, creature_name).pop()
+            if move == start or move in game.find_battle_moves(creature):
+                creature.hexlabel = move
+                moved.append((creature, start))
+                score += creature.sort_value
+        return score
+    finally:
+        for creature, start in reversed(moved):
+            creature.hexlabel = start
+
+
+def test_find_move_order() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    player0.pick_marker("Rd02")
+    player0.split_legion(
+        "Rd01",
+        "Rd02",
+        ["Titan", "Centaur", "Ogre", "Gargoyle"],
+        ["Angel", "Centaur", "Ogre", "Gargoyle"],
+    )
+    rd01 = player0.markerid_to_legion["Rd01"]
+    player1.pick_marker("Bu02")
+    player1.split_legion(
+        "Bu01",
+        "Bu02",
+        ["Titan", "Centaur", "Ogre", "Gargoyle"],
+        ["Angel", "Centaur", "Ogre", "Gargoyle"],
+    )
+    bu01 = player1.markerid_to_legion["Bu01"]
+    rd01.creatures.append(Creature.Creature("Ranger"))
+    rd01.creatures.append(Creature.Creature("Gorgon"))
+    bu01.creatures.append(Creature.Creature("Ranger"))
+    bu01.creatures.append(Creature.Creature("Gorgon"))
+    rd01.move(3, False, None, 5)
+    bu01.move(3, False, None, 5)
+    game._init_battle(bu01, rd01)
+    defender = game.defender_legion
+    assert defender is not None
+    attacker = game.attacker_legion
+    assert attacker is not None
+    for creature in defender.creatures:
+        creature.legion = defender
+    for creature in attacker.creatures:
+        creature.legion = attacker
+    game.battle_turn = 2
+    game.battle_active_legion = attacker
+    battlemap = game.battlemap
+    assert battlemap is not None
+    hexlabels = sorted(
+        hexlabel
+        for hexlabel, battlehex in battlemap.hexes.items()
+        if not battlehex.entrance
+    )
+    cleverbot = CleverBot.CleverBot(attacker.player.name, 1)
+    rand = random.Random(5)
+    num_perfect = 0
+    for unused in range(20):
+        spots = rand.sample(hexlabels, len(attacker) + len(defender))
+        for creature, hexlabel in zip(
+            defender.creatures + attacker.creatures, spots
+        ):
+            creature.hexlabel = hexlabel
+        creature_moves = []
+        finishes = set()  # type: Set[str]
+        for creature in attacker.creatures:
+            assert creature.hexlabel is not None
+            moves = game.find_battle_moves(creature, ignore_mobile_allies=True)
+            moves.add(creature.hexlabel)
+            moves -= finishes
+            # Favor moves into allies' hexes, which constrain the order.
+            crowded_moves = moves & set(spots[len(defender) :])
+            if crowded_moves and rand.random() < 0.7:
+                moves = crowded_moves
+            move = rand.choice(sorted(moves))
+            finishes.add(move)
+            creature_moves.append((creature.name, creature.hexlabel, move))
+        best_score = max(
+            _score_move_order(game, list(perm))
+            for perm in itertools.permutations(creature_moves)
+        )
+        ordered_moves = cleverbot._find_move_order(game, creature_moves)
+        assert sorted(ordered_moves) == sorted(creature_moves)
+        assert [creature.hexlabel for creature in attacker.creatures] == [
+            start for (unused, start, unused2) in creature_moves
+        ]
+        score = _score_move_order(game, ordered_moves)
+        assert abs(score - best_score) < 1e-9
+        if (
+            score
+            > sum(creature.sort_value for creature in attacker.creatures)
+            - 1e-9
+        ):
+            num_perfect += 1
+    assert 0 < num_perfect < 20
+
+
 def test_score_move_scary_pursuer() -> None:
     now = time.time()
     game = Game.Game("g1", "p0", now, now, 2, 6)
@@ -989,3 +1403,139 @@ def test_player_info() -> None:
     cleverbot = CleverBot.CleverBot("ai1", 1)
     assert cleverbot.player_info.startswith("BotParams(SQUASH=0.6, ")
     assert cleverbot.player_info.endswith(")")
+
+
+def _make_crowded_game(rand: random.Random) -> Game.Game:
+    """Return a game with three players, each with five small legions in
+    random hexes."""
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 3, 6)
+    game.add_player("p1")
+    game.add_player("p2")
+    for player, tower in zip(game.players, [100, 200, 300]):
+        player.assign_starting_tower(tower)
+    game.sort_players()
+    game.started = True
+    for color in ["Red", "Blue", "Green"]:
+        playername = game.next_playername_to_pick_color
+        assert playername is not None
+        game.assign_color(playername, color)
+    hexlabels = sorted(game.board.hexes)
+    for player in game.players:
+        player.markerid_to_legion = {}
+        assert player.color_abbrev is not None
+        for num in range(1, 6):
+            markerid = player.color_abbrev + "%02d" % num
+            names = ["Titan" if num == 1 else "Ogre"]
+            names += rand.sample(["Ogre", "Troll", "Ranger", "Gargoyle"], 2)
+            legion = Legion.Legion(
+                player, markerid, Creature.n2c(names), rand.choice(hexlabels)
+            )
+            player.markerid_to_legion[markerid] = legion
+    return game
+
+
+def test_threat_map() -> None:
+    rand = random.Random(17)
+    game = _make_crowded_game(rand)
+    player0, player1, player2 = game.players
+    hexlabels = sorted(game.board.hexes)
+    game.turn = 2
+    for trial in range(4):
+        if trial == 3:
+            player1.score = 400
+        player = game.players[trial % 3]
+        threat_map = CleverBot.ThreatMap(game, player)
+        for legion in player.legions:
+            previous_hexlabel = legion.hexlabel
+            for hexlabel in rand.sample(hexlabels, 20) + [previous_hexlabel]:
+                threats = dict(threat_map.threats(legion, hexlabel))
+                try:
+                    legion.hexlabel = hexlabel
+                    for enemy in player.enemy_legions():
+                        num_rolls = 0
+                        if hexlabel != enemy.hexlabel:
+                            for roll in range(1, 6 + 1):
+                                moves = game.find_normal_moves(
+                                    enemy,
+                                    game.board.hexes[enemy.hexlabel],
+                                    roll,
+                                ).union(game.find_titan_teleport_moves(enemy))
+                                if hexlabel in {move[0] for move in moves}:
+                                    num_rolls += 1
+                        assert threats.get(enemy, 0) == num_rolls
+                finally:
+                    legion.hexlabel = previous_hexlabel
+        # Move a legion, and check that the stale searches are dropped.
+        legion = rand.choice(list(player2.legions))
+        legion.hexlabel = rand.choice(hexlabels)
+        game.check_legion_index()
+        threat_map.update()
+        fresh = CleverBot.ThreatMap(game, player)
+        for legion in player.legions:
+            for hexlabel in hexlabels:
+                assert threat_map.threats(legion, hexlabel) == fresh.threats(
+                    legion, hexlabel
+                )
+
+
+def test_move_score_cache() -> None:
+    rand = random.Random(5)
+    game = _make_crowded_game(rand)
+    game.turn = 3
+    player = game.players[1]
+    cleverbot = CleverBot.CleverBot(player.name, 5)
+    hexlabels = sorted(game.board.hexes)
+    cache = cleverbot._get_move_score_cache(player)
+    for unused in range(6):
+        assert cleverbot._get_move_score_cache(player) is cache
+        for legion in player.legions:
+            for hexlabel in rand.sample(hexlabels, 20) + [legion.hexlabel]:
+                if len(player.enemy_legions(hexlabel)) > 1:
+                    continue
+                for moved in [False, True]:
+                    assert cache.score(
+                        legion, hexlabel, moved
+                    ) == cleverbot._score_move(legion, hexlabel, moved)
+        legion = rand.choice(player.legions)
+        legion.hexlabel = rand.choice(hexlabels)
+    num_scores = len(cache.static_scores)
+    game.turn = 4
+    cache2 = cleverbot._get_move_score_cache(player)
+    assert cache2 is not cache
+    assert not cache2.static_scores
+    assert num_scores
+
+
+def test_should_flee() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0, player1 = game.players
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    strong = ["Titan", "Dragon", "Ranger", "Gorgon", "Warlock", "Griffon"]
+    weak = ["Ogre", "Centaur", "Gargoyle"]
+    attacker = Legion.Legion(player0, "Rd02", Creature.n2c(strong), 1)
+    player0.markerid_to_legion["Rd02"] = attacker
+    defender = Legion.Legion(player1, "Bu02", Creature.n2c(weak), 1)
+    player1.markerid_to_legion["Bu02"] = defender
+    for legion in [attacker, defender]:
+        for creature in legion.creatures:
+            creature.legion = legion
+        legion.entry_side = 3
+    cleverbot = CleverBot.CleverBot("p1", 5, seed=1)
+    assert cleverbot._should_flee(game, attacker, defender)
+    assert not cleverbot._should_flee(game, defender, attacker)
+    bot_params = cleverbot.bp._replace(FLEE_WIN_PROBABILITY=1.0)  # type: ignore
+    cleverbot = CleverBot.CleverBot("p1", 5, bot_params=bot_params, seed=1)
+    assert not cleverbot._should_flee(game, attacker, defender)
+    # Too little time to trust the odds, so compare combat values.
+    cleverbot = CleverBot.CleverBot("p1", 0, bot_params=bot_params, seed=1)
+    assert cleverbot._should_flee(game, attacker, defender)
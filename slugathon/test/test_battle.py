@@ -1,13 +1,81 @@
+import random
 import time
 from sys import maxsize
-from typing import Callable
+from typing import Callable, Optional, Set
 
-from slugathon.game import Creature, Game, Legion, Phase
+from slugathon.data import battlemapdata
+from slugathon.game import BattleMap, Creature, Game, Legion, Phase
 
 __copyright__ = "Copyright (c) 2008-2021 David Ripton"
 __license__ = "GNU GPL v2"
 
 
+def _find_battle_moves_recursive(
+    game: Game.Game,
+    creature: Creature.Creature,
+    hexlabel: str,
+    movement_left: int,
+    ignore_mobile_allies: bool = False,
+) -> Set[str]:
+    """The original depth-first Game._find_battle_moves_inner, kept as a
+    reference for the frontier search that replaced it."""
+    result = set()  # type: Set[str]
+    if game.battlemap is None:
+        return result
+    if movement_left <= 0:
+        return result
+    hex1 = game.battlemap.hexes[hexlabel]
+    for hexside, hex2 in hex1.neighbors.items():
+        creatures = game.creatures_in_battle_hex(hex2.label)
+        creature2 = None  # type: Optional[Creature.Creature]
+        if creatures:
+            creature2 = creatures.pop()
+        if (
+            creature.flies
+            or creature2 is None
+            or (
+                ignore_mobile_allies
+                and creature2.legion == creature.legion
+                and creature2.mobile
+            )
+        ):
+            if hex1.entrance:
+                border = None
+            else:
+                border = hex1.opposite_border(hexside)
+            cost = game.battle_hex_entry_cost(creature, hex2.terrain, border)
+            if cost <= movement_left:
+                creature2 = None
+                creatures = game.creatures_in_battle_hex(hex2.label)
+                if creatures:
+                    creature2 = creatures.pop()
+                if creature2 is None or (
+                    ignore_mobile_allies
+                    and creature2.legion == creature.legion
+                    and creature2.mobile
+                ):
+                    result.add(hex2.label)
+            if creature.flies:
+                flyover_cost = game.battle_hex_flyover_cost(
+                    creature, hex2.terrain
+                )
+            else:
+                flyover_cost = maxsize
+            min_cost = min(cost, flyover_cost)
+            if min_cost < movement_left:
+                result.update(
+                    _find_battle_moves_recursive(
+                        game,
+                        creature,
+                        hex2.label,
+                        movement_left - min_cost,
+                        ignore_mobile_allies,
+                    )
+                )
+    result.discard(hexlabel)
+    return result
+
+
 class TestBattle(object):
     def setup_method(self, method: Callable) -> None:
         now = time.time()
@@ -156,6 +224,30 @@ class TestBattle(object):
         }
         assert self.game.find_battle_moves(gargoyle) == set3
 
+    def test_find_moves_cached(self) -> None:
+        self.rd01.move(6, False, None, 3)
+        self.bu01.move(6, False, None, 3)
+        game = self.game
+        game._init_battle(self.bu01, self.rd01)
+        defender = game.defender_legion
+        assert defender is not None
+        titan = defender.sorted_creatures[0]
+        assert titan.name == "Titan"
+        ogre = defender.sorted_creatures[3]
+        assert ogre.name == "Ogre"
+        set2 = {"D1", "E1", "F1", "C1", "D2", "E2", "F2"}
+        moves = game.find_battle_moves(ogre)
+        assert moves == set2
+        moves.add("A1")
+        assert game.find_battle_moves(ogre) == set2
+
+        titan.move("E2")
+        moves = game.find_battle_moves(ogre)
+        assert "E2" not in moves
+        assert moves == game._find_battle_moves_inner(ogre, "DEFENDER", 2)
+        titan.undo_move()
+        assert game.find_battle_moves(ogre) == set2
+
     def test_find_moves_marsh(self) -> None:
         self.rd01.move(41, False, None, 3)
         self.bu01.move(41, False, None, 3)
@@ -468,6 +560,72 @@ class TestBattle(object):
         }
         assert self.game.find_battle_moves(gargoyle, True) == set4
 
+    def test_find_moves_matches_recursive(self) -> None:
+        rd02 = Legion.Legion(
+            self.player0,
+            "Rd02",
+            Creature.n2c(
+                [
+                    "Titan",
+                    "Dragon",
+                    "Hydra",
+                    "Lion",
+                    "Ranger",
+                    "Griffon",
+                    "Giant",
+                ]
+            ),
+            1,
+        )
+        self.player0.markerid_to_legion["Rd02"] = rd02
+        bu02 = Legion.Legion(
+            self.player1,
+            "Bu02",
+            Creature.n2c(
+                [
+                    "Titan",
+                    "Archangel",
+                    "Behemoth",
+                    "Minotaur",
+                    "Wyvern",
+                    "Unicorn",
+                    "Troll",
+                ]
+            ),
+            1,
+        )
+        self.player1.markerid_to_legion["Bu02"] = bu02
+        game = self.game
+        rd02.entry_side = 1
+        game._init_battle(rd02, bu02)
+        creatures = rd02.creatures + bu02.creatures
+        hexlabels = sorted(BattleMap.all_labels)
+        rand = random.Random(7)
+        for terrain in sorted(battlemapdata.data):
+            for entry_side in [1, 3, 5]:
+                game.battlemap = BattleMap.get_battlemap(terrain, entry_side)
+                for creature, hexlabel in zip(
+                    creatures, rand.sample(hexlabels, len(creatures))
+                ):
+                    creature.hexlabel = hexlabel
+                    creature.moved = rand.random() < 0.3
+                for creature in creatures:
+                    assert creature.hexlabel is not None
+                    for movement in range(1, 5):
+                        for ignore_mobile_allies in [False, True]:
+                            assert game._find_battle_moves_inner(
+                                creature,
+                                creature.hexlabel,
+                                movement,
+                                ignore_mobile_allies,
+                            ) == _find_battle_moves_recursive(
+                                game,
+                                creature,
+                                creature.hexlabel,
+                                movement,
+                                ignore_mobile_allies,
+                            )
+
     def test_strikes_plain(self) -> None:
         self.rd01.move(6, False, None, 3)
         self.bu01.move(6, False, None, 3)
@@ -677,6 +835,87 @@ class TestBattle(object):
         assert ranger1.number_of_dice(troll1) == 2
         assert ranger1.strike_number(troll1) == 2
 
+    def test_rangestrike_blocked_by_creature(self) -> None:
+        rd02 = Legion.Legion(
+            self.player0, "Rd02", Creature.n2c(["Angel", "Ranger"]), 1
+        )
+        self.player0.markerid_to_legion["Rd02"] = rd02
+        bu02 = Legion.Legion(self.player0, "Bu02", Creature.n2c(["Troll"]), 1)
+        self.player1.markerid_to_legion["Bu02"] = bu02
+        troll1 = bu02.creatures[0]
+        angel1 = rd02.creatures[0]
+        ranger1 = rd02.creatures[1]
+        game = self.game
+
+        rd02.entry_side = 1
+        game._init_battle(rd02, bu02)
+        troll1.move("A1")
+        game.battle_active_legion = rd02
+        game.battle_phase = Phase.MANEUVER
+        ranger1.move("D1")
+        angel1.move("F4")
+        game.battle_phase = Phase.STRIKE
+        assert ranger1.has_los_to("A1")
+        assert ranger1.rangestrike_targets == {troll1}
+        angel1.move("C1")
+        assert not ranger1.has_los_to("A1")
+        assert ranger1.rangestrike_targets == set()
+        angel1.move("C2")
+        assert ranger1.has_los_to("A1")
+        assert ranger1.rangestrike_targets == {troll1}
+
+    def test_battle_hex_index(self) -> None:
+        self.rd01.move(6, False, None, 3)
+        self.bu01.move(6, False, None, 3)
+        game = self.game
+        game._init_battle(self.bu01, self.rd01)
+        titan1 = self.rd01.creatures[0]
+        titan2 = self.bu01.creatures[0]
+        assert game.creatures_in_battle_hex("DEFENDER", "Titan") == {titan1}
+        assert len(game.creatures_in_battle_hex("ATTACKER")) == 4
+        assert not game.is_battle_hex_occupied("C3")
+
+        titan1.move("C3")
+        assert game.creatures_in_battle_hex("C3") == {titan1}
+        assert len(game.creatures_in_battle_hex("DEFENDER")) == 3
+        titan1.undo_move()
+        assert not game.is_battle_hex_occupied("C3")
+        assert game.creatures_in_battle_hex("DEFENDER", "Titan") == {titan1}
+
+        # The AI moves creatures by setting hexlabel directly.
+        titan2.hexlabel = "D4"
+        assert game.creatures_in_battle_hex("D4") == {titan2}
+        titan2.hexlabel = "ATTACKER"
+        assert not game.is_battle_hex_occupied("D4")
+
+        self.bu01.add_creature_by_name("Angel")
+        angel2 = self.bu01.creatures[-1]
+        angel2.hexlabel = "E2"
+        assert game.creatures_in_battle_hex("E2") == {angel2}
+        self.bu01.remove_creature_by_name("Angel")
+        assert not game.is_battle_hex_occupied("E2")
+
+        # Replacing a creature leaves the list the same length.
+        self.rd01.remove_creature_by_name("Gargoyle")
+        self.rd01.add_creature_by_name("Ogre")
+        ogre1 = self.rd01.creatures[-1]
+        ogre1.hexlabel = "E3"
+        assert game.creatures_in_battle_hex("E3") == {ogre1}
+        assert game.is_battle_hex_occupied("E3")
+
+        game.phase = Phase.FIGHT
+        game.recruit_creature("p0", "Rd01", "Lion", ("Centaur", "Centaur"))
+        lion1 = self.rd01.creatures[-1]
+        assert game.creatures_in_battle_hex("DEFENDER", "Lion") == {lion1}
+        game.undo_recruit("p0", "Rd01")
+        assert not game.creatures_in_battle_hex("DEFENDER", "Lion")
+
+        game.summon_angel("p1", "Bu01", "Bu02", "Angel")
+        angel3 = self.bu01.creatures[-1]
+        assert game.creatures_in_battle_hex("ATTACKER", "Angel") == {angel3}
+        self.player1.unsummon_angel(self.bu01, "Angel")
+        assert not game.creatures_in_battle_hex("ATTACKER", "Angel")
+
     def test_strikes_marsh(self) -> None:
         self.rd01.move(41, False, None, 5)
         self.bu01.move(41, False, None, 5)
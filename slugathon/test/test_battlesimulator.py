@@ -0,0 +1,89 @@
+import time
+from typing import List, Tuple
+
+from slugathon.ai import BattleSimulator
+from slugathon.game import Creature, Game, Legion
+
+__copyright__ = "Copyright (c) 2021 David Ripton"
+__license__ = "GNU GPL v2"
+
+
+def _make_legions(
+    attacker_names: List[str], defender_names: List[str], hexlabel: int
+) -> Tuple[Game.Game, Legion.Legion, Legion.Legion]:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    attacker = Legion.Legion(
+        player0, "Rd02", Creature.n2c(attacker_names), hexlabel
+    )
+    player0.markerid_to_legion["Rd02"] = attacker
+    defender = Legion.Legion(
+        player1, "Bu02", Creature.n2c(defender_names), hexlabel
+    )
+    player1.markerid_to_legion["Bu02"] = defender
+    for legion in [attacker, defender]:
+        for creature in legion.creatures:
+            creature.legion = legion
+    attacker.entry_side = 3
+    return game, attacker, defender
+
+
+def test_mismatch() -> None:
+    strong = ["Titan", "Dragon", "Ranger", "Gorgon", "Warlock", "Griffon"]
+    weak = ["Ogre", "Centaur", "Gargoyle"]
+    for hexlabel in [1, 100]:
+        game, attacker, defender = _make_legions(strong, weak, hexlabel)
+        simulator = BattleSimulator.BattleSimulator(
+            game, attacker, defender, seed=1
+        )
+        odds = simulator.simulate(50)
+        assert odds.rollouts == 50
+        assert odds.attacker_wins > 0.9
+        assert odds.defender_points == 0
+        assert odds.attacker_points > 0.5 * attacker.score
+
+        game, attacker, defender = _make_legions(weak, strong, hexlabel)
+        simulator = BattleSimulator.BattleSimulator(
+            game, attacker, defender, seed=1
+        )
+        odds = simulator.simulate(50)
+        assert odds.defender_wins > 0.9
+        assert odds.attacker_points == 0
+        assert odds.defender_points > 0.5 * defender.score
+        # The simulation leaves the real legions alone.
+        for creature in attacker.creatures + defender.creatures:
+            assert creature.hits == 0
+            assert creature.hexlabel is None
+
+
+def test_seed() -> None:
+    names = ["Ogre", "Centaur", "Gargoyle", "Troll"]
+    game, attacker, defender = _make_legions(names, names, 5)
+    odds = BattleSimulator.BattleSimulator(
+        game, attacker, defender, seed=2
+    ).simulate(30)
+    assert 0 < odds.attacker_wins < 1
+    assert odds.mutual >= 0
+    odds2 = BattleSimulator.BattleSimulator(
+        game, attacker, defender, seed=2
+    ).simulate(30)
+    assert odds2 == odds
+
+
+def test_time_limit() -> None:
+    names = ["Ogre", "Centaur", "Gargoyle", "Troll"]
+    game, attacker, defender = _make_legions(names, names, 1)
+    simulator = BattleSimulator.BattleSimulator(game, attacker, defender)
+    odds = simulator.simulate(1000000, time.time() - 1)
+    assert odds.rollouts == 1
@@ -0,0 +1,196 @@
+import pickle
+import random
+import time
+
+from slugathon.data import battlemapdata
+from slugathon.game import (
+    BattleMap,
+    BattleSnapshot,
+    Creature,
+    Game,
+    Legion,
+    Phase,
+)
+
+__copyright__ = "Copyright (c) 2021 David Ripton"
+__license__ = "GNU GPL v2"
+
+
+def _make_game() -> Game.Game:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    game.add_player("p1")
+    player0 = game.players[0]
+    player1 = game.players[1]
+    player0.assign_starting_tower(200)
+    player1.assign_starting_tower(100)
+    game.sort_players()
+    game.started = True
+    game.assign_color("p1", "Blue")
+    game.assign_color("p0", "Red")
+    game.assign_first_marker("p0", "Rd01")
+    game.assign_first_marker("p1", "Bu01")
+    rd02 = Legion.Legion(
+        player0,
+        "Rd02",
+        Creature.n2c(
+            ["Titan", "Dragon", "Ranger", "Gorgon", "Warlock", "Griffon"]
+        ),
+        1,
+    )
+    player0.markerid_to_legion["Rd02"] = rd02
+    bu02 = Legion.Legion(
+        player1,
+        "Bu02",
+        Creature.n2c(
+            ["Titan", "Archangel", "Behemoth", "Ranger", "Cyclops", "Troll"]
+        ),
+        1,
+    )
+    player1.markerid_to_legion["Bu02"] = bu02
+    rd02.entry_side = 1
+    game._init_battle(rd02, bu02)
+    return game
+
+
+def test_snapshot_matches_creatures() -> None:
+    game = _make_game()
+    attacker = game.attacker_legion
+    assert attacker is not None
+    defender = game.defender_legion
+    assert defender is not None
+    creatures = attacker.creatures + defender.creatures
+    hexlabels = sorted(BattleMap.all_labels - {"ATTACKER", "DEFENDER"})
+    rand = random.Random(3)
+    for terrain in sorted(battlemapdata.data):
+        for entry_side in [1, 3, 5]:
+            game.battlemap = BattleMap.get_battlemap(terrain, entry_side)
+            game.battle_turn = rand.choice([1, 2, 4])
+            game.battle_phase = rand.choice(
+                [Phase.MANEUVER, Phase.STRIKE, Phase.COUNTERSTRIKE]
+            )
+            for creature, hexlabel in zip(
+                creatures, rand.sample(hexlabels, len(creatures))
+            ):
+                creature.hexlabel = hexlabel
+                creature.moved = rand.random() < 0.2
+                creature.hits = 0
+                if rand.random() < 0.1:
+                    creature.hits = creature.power
+            attacker.creatures[-1].hexlabel = "ATTACKER"
+            snapshot = BattleSnapshot.BattleSnapshot(game)
+            for index, creature in enumerate(creatures):
+                assert snapshot.index(creature) == index
+                assert snapshot.dead(index) == creature.dead
+                assert snapshot.engaged(index) == creature.engaged
+                assert snapshot.mobile(index) == creature.mobile
+                assert {
+                    snapshot.creatures[index2]
+                    for index2 in snapshot.engaged_enemies(index)
+                } == creature.engaged_enemies
+                assert {
+                    snapshot.creatures[index2]
+                    for index2 in snapshot.potential_rangestrike_targets(index)
+                } == creature.potential_rangestrike_targets
+                assert {
+                    snapshot.creatures[index2]
+                    for index2 in snapshot.rangestrike_targets(index)
+                } == creature.rangestrike_targets
+                for ignore_mobile_allies in [False, True]:
+                    assert snapshot.find_battle_moves(
+                        index, ignore_mobile_allies
+                    ) == game.find_battle_moves(creature, ignore_mobile_allies)
+                if creature.offboard:
+                    continue
+                for index2 in snapshot.enemies(index):
+                    target = snapshot.creatures[index2]
+                    if target.offboard:
+                        continue
+                    assert snapshot.number_of_dice(
+                        index, index2
+                    ) == creature.number_of_dice(target)
+                    assert snapshot.strike_number(
+                        index, index2
+                    ) == creature.strike_number(target)
+
+
+def test_snapshot_copy_on_write() -> None:
+    game = _make_game()
+    attacker = game.attacker_legion
+    assert attacker is not None
+    defender = game.defender_legion
+    assert defender is not None
+    game.battle_turn = 2
+    for creature, hexlabel in zip(
+        attacker.creatures, ["D4", "E3", "E4", "F2", "F3", "F4"]
+    ):
+        creature.hexlabel = hexlabel
+    for creature, hexlabel in zip(
+        defender.creatures, ["A1", "A2", "A3", "B1", "B2", "B4"]
+    ):
+        creature.hexlabel = hexlabel
+    snapshot = BattleSnapshot.BattleSnapshot(game)
+    titan = attacker.creatures[0]
+    index = snapshot.index(titan)
+    moves = snapshot.find_battle_moves(index)
+    assert moves == game.find_battle_moves(titan)
+    assert "C3" in moves
+
+    snapshot2 = snapshot.move(index, "C3")
+    assert snapshot2.hexlabels[index] == "C3"
+    assert snapshot2.moved[index]
+    assert snapshot2.find_battle_moves(index) == set()
+    assert snapshot.hexlabels[index] == "D4"
+    assert not snapshot.moved[index]
+    assert snapshot.find_battle_moves(index) == moves
+    assert titan.hexlabel == "D4"
+    assert not titan.moved
+    assert snapshot2.creatures is snapshot.creatures
+    assert snapshot2.hits is snapshot.hits
+
+    target_index = snapshot.index(defender.creatures[2])
+    snapshot3 = snapshot.set_hits(target_index, 100)
+    assert snapshot3.dead(target_index)
+    assert not snapshot.dead(target_index)
+    assert not defender.creatures[2].dead
+
+
+def test_snapshot_pickle() -> None:
+    game = _make_game()
+    attacker = game.attacker_legion
+    assert attacker is not None
+    defender = game.defender_legion
+    assert defender is not None
+    game.battle_turn = 3
+    game.battle_phase = Phase.STRIKE
+    for creature, hexlabel in zip(
+        attacker.creatures, ["D4", "E3", "E4", "F2", "F3", "F4"]
+    ):
+        creature.hexlabel = hexlabel
+    for creature, hexlabel in zip(
+        defender.creatures, ["C3", "A2", "A3", "B1", "B2", "B4"]
+    ):
+        creature.hexlabel = hexlabel
+    defender.creatures[1].hits = 3
+    snapshot = BattleSnapshot.BattleSnapshot(game).move(0, "D3")
+    snapshot2 = pickle.loads(pickle.dumps(snapshot))
+    assert snapshot2.game is None
+    assert snapshot2.battlemap is snapshot.battlemap
+    assert snapshot2.hexlabels == snapshot.hexlabels
+    assert snapshot2.hits == snapshot.hits
+    assert snapshot2.moved == snapshot.moved
+    assert snapshot2.powers == snapshot.powers
+    assert snapshot2.sort_values == snapshot.sort_values
+    for index, creature in enumerate(snapshot.creatures):
+        assert snapshot2.creatures[index].name == creature.name
+        assert snapshot2.hits_left(index) == snapshot.hits_left(index)
+        assert snapshot2.engaged_enemies(index) == snapshot.engaged_enemies(
+            index
+        )
+        assert snapshot2.rangestrike_targets(
+            index
+        ) == snapshot.rangestrike_targets(index)
+        for index2 in snapshot.enemies(index):
+            assert snapshot2.number_of_dice(
+                index, index2
+            ) == snapshot.number_of_dice(index, index2)
@@ -2,6 +2,7 @@ import time
 
 import pytest
 
+from slugathon.data import creaturedata
 from slugathon.game import Creature, Game, Player
 
 __copyright__ = "Copyright (c) 2003-2012 David Ripton"
@@ -119,3 +120,46 @@ def test_titan_power() -> None:
     assert titan.power == 7
     player.score = 10000
     assert titan.power == 106
+
+
+def test_creature_type() -> None:
+    ogre = Creature.Creature("Ogre")
+    ogre2 = Creature.Creature("Ogre")
+    assert ogre.creature_type is ogre2.creature_type
+    assert ogre.creature_type is Creature.name_to_creature_type["Ogre"]
+    assert not hasattr(ogre, "__dict__")
+    ogre.hits = 3
+    assert ogre2.hits == 0
+    assert ogre.sort_value == ogre.creature_type.sort_value
+    assert ogre.combat_value == ogre.creature_type.combat_value
+
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    player = Player.Player("p0", game, 0)
+    player.assign_starting_tower(600)
+    player.assign_color("Red")
+    player.pick_marker("Rd01")
+    player.create_starting_legion()
+    legion = player.markerid_to_legion["Rd01"]
+    titan = [creature for creature in legion.creatures if creature.is_titan][0]
+    titan_type = titan.creature_type
+    assert titan.sort_value == titan_type.sort_value
+    player.score = 100
+    assert titan.power == 7
+    assert titan_type.power == 6
+    assert titan.score == 28
+    assert titan.sort_value == titan_type.sort_value_for(7)
+    assert titan.sort_value > titan_type.sort_value
+    assert titan.combat_value == titan_type.combat_value_for(7)
+
+
+def test_native_mask() -> None:
+    bits = list(Creature.hazard_to_bit.values())
+    assert len(set(bits)) == len(bits)
+    assert all(bit and not bit & (bit - 1) for bit in bits)
+    for name in creaturedata.data:
+        creature = Creature.Creature(name)
+        hazards = Creature.creature_name_to_native_hazards[name]
+        for hazard in Creature.hazard_to_bit:
+            assert creature.is_native(hazard) == (hazard in hazards)
+        assert not creature.is_native("Jackalope")
@@ -100,11 +100,41 @@ class TestGame(object):
             assert not moves
             moves = self.game.find_normal_moves(legion2, masterhex2, 2)
             assert moves == {(136, 5)}
+            game.check_legion_index()
 
         finally:
             for legion in [legion1, legion2, legion3]:
                 legion.hexlabel = legion.previous_hexlabel  # type: ignore
 
+    def test_find_paths(self) -> None:
+        game = self.game
+        masterhex = game.board.hexes[200]
+        paths = Game.find_paths(masterhex, 1)
+        assert paths is Game.find_paths(masterhex, 1)
+        assert {path[-1] for path in paths} == {(6, 5), (10, 1), (108, 3)}
+        for hexlabel, masterhex in game.board.hexes.items():
+            for roll in range(1, 7):
+                for path in Game.find_paths(masterhex, roll):
+                    assert len(path) == roll + 1
+                    assert path[0] == (hexlabel, None)
+                    for (hexlabel1, _), (hexlabel2, _) in zip(path, path[1:]):
+                        hex1 = game.board.hexes[hexlabel1]
+                        hex2 = game.board.hexes[hexlabel2]
+                        assert hex2 in hex1.neighbors
+
+    def test_find_nearby_hexlabels(self) -> None:
+        game = self.game
+        masterhex = game.board.hexes[100]
+        assert Game.find_nearby_hexlabels(masterhex, 0) == (100,)
+        hexlabels = Game.find_nearby_hexlabels(masterhex, 1)
+        assert hexlabels is Game.find_nearby_hexlabels(masterhex, 1)
+        assert set(hexlabels) == {100} | {
+            neighbor.label for neighbor in masterhex.neighbors if neighbor
+        }
+        hexlabels6 = Game.find_nearby_hexlabels(masterhex, 6)
+        assert len(set(hexlabels6)) == len(hexlabels6)
+        assert set(hexlabels) < set(hexlabels6) < set(game.board.hexes)
+
     def test_find_all_teleport_moves(self) -> None:
         game = self.game
         player = game.players[0]
@@ -245,6 +275,41 @@ class TestGame(object):
         assert (15, 1) in moves
         assert (103, 5) in moves
 
+    def test_find_all_moves_for_player(self) -> None:
+        game = self.game
+        player = game.players[0]
+        for roll in [6, 2]:
+            player.movement_roll = roll
+            player_moves = game.find_all_moves_for_player(player)
+            assert game.find_all_moves_for_player(player) is player_moves
+            assert set(player_moves) == {"Rd01", "Rd02"}
+            for markerid, moves in player_moves.items():
+                legion = player.markerid_to_legion[markerid]
+                masterhex = game.board.hexes[legion.hexlabel]
+                assert moves == game.find_all_moves(legion, masterhex, roll)
+        game.move_legion(player.name, "Rd01", 7, 3, False, None)
+        player_moves2 = game.find_all_moves_for_player(player)
+        assert player_moves2 is not player_moves
+        assert set(player_moves2) == {"Rd02"}
+        game.undo_move_legion(player.name, "Rd01")
+        assert game.find_all_moves_for_player(player) == player_moves
+
+    def test_find_all_moves_for_player_undo_split(self) -> None:
+        game = self.game
+        player = game.players[0]
+        player.movement_roll = 2
+        player_moves = game.find_all_moves_for_player(player)
+        assert set(player_moves) == {"Rd01", "Rd02"}
+        game.undo_split(player.name, "Rd01", "Rd02")
+        player_moves2 = game.find_all_moves_for_player(player)
+        assert player_moves2 is not player_moves
+        assert set(player_moves2) == {"Rd01"}
+        legion = player.markerid_to_legion["Rd01"]
+        masterhex = game.board.hexes[legion.hexlabel]
+        assert player_moves2["Rd01"] == game.find_all_moves(
+            legion, masterhex, 2
+        )
+
     def test_can_move_legion(self) -> None:
         game = self.game
         player = game.players[0]
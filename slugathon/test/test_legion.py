@@ -291,6 +291,52 @@ def test_available_recruits_and_recruiters() -> None:
     ]
 
 
+def test_available_recruits_and_recruiters_cache() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    player = Player.Player("p0", game, 0)
+    caretaker = Caretaker.Caretaker()
+    legion = Legion.Legion(
+        player,
+        "Rd01",
+        Creature.n2c(["Titan", "Troll", "Troll", "Troll"]),
+        1,
+    )
+    for creature in legion.creatures:
+        creature.legion = legion
+    tups = legion.available_recruits_and_recruiters("Tower", caretaker)
+    assert ("Guardian", "Troll", "Troll", "Troll") in tups
+    # Changing the result must not change the cached copy.
+    tups.pop()
+    assert legion.available_recruits_and_recruiters("Tower", caretaker) != tups
+
+    # Another legion with the same creatures gets the same recruits.
+    legion2 = Legion.Legion(
+        player,
+        "Rd02",
+        Creature.n2c(["Titan", "Troll", "Troll", "Troll"]),
+        1,
+    )
+    assert legion2.available_recruits_and_recruiters(
+        "Tower", caretaker
+    ) == legion.available_recruits_and_recruiters("Tower", caretaker)
+
+    # Dead creatures can't help recruit, even guardians.
+    legion.creatures[1].hits = legion.creatures[1].power
+    assert legion.available_recruits_and_recruiters("Swamp", caretaker) == [
+        ("Troll", "Troll")
+    ]
+    assert legion.available_recruits_and_recruiters("Tower", caretaker) == [
+        ("Ogre",),
+        ("Centaur",),
+        ("Gargoyle",),
+        ("Warlock", "Titan"),
+    ]
+
+    caretaker.counts["Troll"] = 0
+    assert legion.available_recruits_and_recruiters("Swamp", caretaker) == []
+
+
 def test_score() -> None:
     now = time.time()
     game = Game.Game("g1", "p0", now, now, 2, 6)
@@ -1,8 +1,9 @@
 from sys import maxsize
+from typing import Set
 
 import pytest
 
-from slugathon.game import BattleMap
+from slugathon.game import BattleMap, Creature
 from slugathon.util import guiutils
 
 __copyright__ = "Copyright (c) 2005-2021 David Ripton"
@@ -185,6 +186,102 @@ def test_range() -> None:
     assert map1.range("A1", "ATTACKER", True) == 7
     assert map1.range("A1", "DEFENDER", True) == 2
     assert map1.range("DEFENDER", "A1", True) == 2
+    assert map1.range("ATTACKER", "DEFENDER", True) == maxsize
+    assert map1.range("A1", "Z9") == maxsize
+
+
+def test_range_tables_shared() -> None:
+    map6 = BattleMap.BattleMap("Plains", 1)
+    assert map6._ranges is map1._ranges
+    assert map6._entrance_ranges is map1._entrance_ranges
+    assert map2._ranges is not map1._ranges
+    for hexlabel1 in BattleMap.all_labels:
+        for hexlabel2 in BattleMap.all_labels:
+            assert map2.range(hexlabel1, hexlabel2) == map2.range(
+                hexlabel2, hexlabel1
+            )
+            assert map2.range(hexlabel1, hexlabel2, True) == map2.range(
+                hexlabel2, hexlabel1, True
+            )
+
+
+def test_los_dirs() -> None:
+    bit = BattleMap.hexlabel_to_bit
+    map6 = BattleMap.BattleMap("Plains", 1)
+    assert map6._find_los_dirs("C1", "A1") == ((False, bit["B1"]),)
+    assert map6._find_los_dirs("D1", "A1") == ((False, bit["B1"] | bit["C1"]),)
+    assert map1._find_los_dirs("D5", "D3") == ((True, 0),)
+    assert map1._find_los_dirs("F2", "D5") == ((False, bit["E3"] | bit["E4"]),)
+    map7 = BattleMap.BattleMap("Mountains", 1)
+    assert map7._los is map1._los
+    assert map7._los is not map6._los
+
+
+def test_count_bramble_hexes() -> None:
+    map6 = BattleMap.BattleMap("Brush", 1)
+    assert map6._brambles is map3._brambles
+    assert map3.count_bramble_hexes("A1", "A1", None) == 0
+    assert map3.count_bramble_hexes("A1", "A3", None) == 0
+    assert map3.count_bramble_hexes("B1", "B3", None) == 1
+    assert map3.count_bramble_hexes("C5", "C3", None) == 1
+    assert map3._find_bramble_counts("C5", "C3") == (1,)
+
+
+def test_max_bramble_hexes() -> None:
+    jungle = BattleMap.get_battlemap("Jungle", 1)
+    # Along a hexspine, past one bramble hex on the left or two on the right.
+    assert jungle._find_bramble_counts("B1", "D5") == (1, 2)
+    bit = BattleMap.hexlabel_to_bit
+    assert jungle.count_bramble_hexes_by("B1", "D5", 0) == 1
+    assert jungle.count_bramble_hexes_by("B1", "D5", bit["B2"]) == 2
+    assert jungle.count_bramble_hexes_by("B1", "D5", bit["C2"]) == 1
+    assert jungle.max_bramble_hexes("B1", "D5") == 2
+    assert jungle.max_bramble_hexes("B1", "B1") == 0
+    assert map3.max_bramble_hexes("C5", "C3") == 1
+
+
+def test_count_walls() -> None:
+    assert map1.count_walls("D5", "D4", None) == 0
+    assert map2.count_walls("B2", "C3", None) == 1
+    assert map2.count_walls("C3", "B2", None) == 0
+    assert map2.count_walls("B2", "D4", None) == 2
+    assert map2.count_walls("ATTACKER", "D4", None) == 2
+
+
+def test_get_battlemap() -> None:
+    map6 = BattleMap.get_battlemap("Marsh", 3)
+    assert BattleMap.get_battlemap("Marsh", 3) is map6
+    assert map6.mterrain == "Marsh"
+    assert map6.entry_side == 3
+    assert BattleMap.get_battlemap("Marsh", 5) is not map6
+    assert BattleMap.get_battlemap("Swamp", 3) is not map6
+
+
+def test_neighbor_masks() -> None:
+    map6 = BattleMap.BattleMap("Desert", 1)
+    bit = BattleMap.hexlabel_to_bit
+
+    def labels(mask: int) -> Set[str]:
+        return {label for label, bit1 in bit.items() if mask & bit1}
+
+    assert labels(map6.neighbor_masks["D4"]) == {
+        "C3",
+        "C4",
+        "D3",
+        "D5",
+        "E3",
+        "E4",
+    }
+    assert labels(map6.engagement_masks["D4"]) == {"C4", "D5", "E3", "E4"}
+    assert labels(map6.neighbor_masks["B2"]) == labels(
+        map6.engagement_masks["B2"]
+    ) | {"B1"}
+    assert labels(map6.engagement_masks["ATTACKER"]) == {
+        "F1",
+        "F2",
+        "F3",
+        "F4",
+    }
 
 
 def test_opposite_border() -> None:
@@ -273,6 +370,21 @@ def test_neighbor_to_hexside() -> None:
     assert hex1.neighbor_to_hexside(hex3) is None
 
 
+def test_hazard_bits() -> None:
+    for map_ in [map1, map2, map3, map4, map5]:
+        for hex_ in map_.hexes.values():
+            assert hex_.terrain_bit == Creature.hazard_to_bit.get(
+                hex_.terrain, 0
+            )
+            for border, bit in zip(hex_.borders, hex_.border_bits):
+                if border:
+                    assert bit == Creature.hazard_to_bit[border]
+                else:
+                    assert bit == 0
+    assert hex7.terrain_bit == Creature.hazard_to_bit["Tower"]
+    assert hex2.border_bits[3] == Creature.SLOPE_BIT
+
+
 def test_width_and_height() -> None:
     assert map1.hex_width == 8
     assert map1.hex_height == 6
@@ -61,6 +61,61 @@ def test_friendly_legions() -> None:
     assert player.friendly_legions(200) == {legion2}
 
 
+def test_legion_index() -> None:
+    now = time.time()
+    game = Game.Game("g1", "p0", now, now, 2, 6)
+    player = Player.Player("p0", game, 0)
+    player.assign_starting_tower(100)
+    player.assign_color("Red")
+    player.pick_marker("Rd01")
+    player.create_starting_legion()
+    index = player.markerid_to_legion
+    index.check()
+    legion1 = index["Rd01"]
+    player.split_legion(
+        "Rd01",
+        "Rd02",
+        ["Titan", "Ogre", "Ogre", "Gargoyle"],
+        ["Angel", "Gargoyle", "Centaur", "Centaur"],
+    )
+    legion2 = index["Rd02"]
+    index.check()
+    assert index.legions_in(100) == {legion1, legion2}
+    legion1.move(8, False, None, 1)
+    index.check()
+    assert index.legions_in(100) == {legion2}
+    assert index.legions_in(8) == {legion1}
+    legion1.undo_move()
+    index.check()
+    assert index.legions_in(8) == set()
+    player.undo_split("Rd01", "Rd02")
+    index.check()
+    assert index.legions_in(100) == {legion1}
+    legion2.hexlabel = 9
+    index.check()
+    player.pick_marker("Rd02")
+    player.split_legion(
+        "Rd01",
+        "Rd02",
+        ["Titan", "Ogre", "Ogre", "Gargoyle"],
+        ["Angel", "Gargoyle", "Centaur", "Centaur"],
+    )
+    legion3 = index["Rd02"]
+    legion3.hexlabel = 200
+    index.check()
+    player.remove_legion("Rd02")
+    index.check()
+    assert index.legions_in(200) == set()
+    legion3.hexlabel = 300
+    player.markerid_to_legion = {"Rd03": legion3}
+    assert player.markerid_to_legion is index
+    index.check()
+    assert index.legions_in(100) == set()
+    assert index.legions_in(300) == {legion3}
+    legion1.hexlabel = 300
+    assert index.legions_in(300) == {legion3}
+
+
 def test_can_exit_move_phase() -> None:
     now = time.time()
     game = Game.Game("g1", "p0", now, now, 2, 6)